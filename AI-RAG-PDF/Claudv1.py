@@ -1,26 +1,30 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, scrolledtext
 import threading
-import subprocess
+import multiprocessing
 import time
 import os
 import queue
 import sys
-import json
-import re
-import pytesseract
-from PIL import Image
-import fitz  # PyMuPDF
 import chromadb
 from chromadb.utils import embedding_functions
-import numpy as np
 import pyperclip
-import tempfile
 from io import BytesIO
-from pathlib import Path
 import hashlib
 
-# pip install pytesseract fitz
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ollama_tools.bm25 import BM25Index, hybrid_search
+from ollama_tools.client import get_client
+from ollama_tools.context_budget import ContextAssembler, context_budget, estimate_tokens
+from ollama_tools.embedding_cache import EmbeddingCache
+from ollama_tools.embeddings import OllamaEmbedder
+from ollama_tools.pipeline import IngestPipeline, chroma_sink
+
+# pip install pytesseract fitz requests
+
+# Pages with less text than this are treated as scanned and their images are OCR'd in memory;
+# images smaller than 64x32 px or 2 KB (rules, bullets, icons) are skipped
+PAGE_OCR_OPTIONS = {"min_text_chars": 100, "min_width": 64, "min_height": 32, "min_bytes": 2048}
 
 class OllamaAITool:
     def __init__(self, root):
@@ -35,15 +39,18 @@ class OllamaAITool:
         self.prompt_llm = tk.StringVar()
         self.selected_pdfs = []
         self.ollama_models = []
+        self.ingest_batch_size = tk.IntVar(value=256)
         self.output_queue = queue.Queue()
         self.processing_thread = None
         self.vector_db = None
+        self.embedder = None
+        self.query_embedder = None
+        self.lexical_index = None
+        self.context_assembler = ContextAssembler()
+        self.ollama = get_client()
         self.db_client = None
         self.collection = None
         
-        # Temp directory for image extraction from PDFs
-        self.temp_dir = Path(tempfile.mkdtemp())
-        
         # Initialize GUI
         self.init_gui()
         
@@ -72,6 +79,15 @@ class OllamaAITool:
         ttk.Label(top_frame, text="Select The Prompt LLM:").grid(row=1, column=0, padx=5, pady=5, sticky=tk.W)
         self.prompt_llm_dropdown = ttk.Combobox(top_frame, textvariable=self.prompt_llm, state="readonly", width=30)
         self.prompt_llm_dropdown.grid(row=1, column=1, padx=5, pady=5, sticky=tk.W)
+        # Selected models are loaded in the background, before the first request needs them
+        self.embedding_llm_dropdown.bind("<<ComboboxSelected>>",
+                                         lambda e: self.ollama.preload(self.embedding_llm.get(), embedding=True))
+        self.prompt_llm_dropdown.bind("<<ComboboxSelected>>", lambda e: self.ollama.preload(self.prompt_llm.get()))
+        
+        ttk.Label(top_frame, text="Chunks Per Batch:").grid(row=2, column=0, padx=5, pady=5, sticky=tk.W)
+        self.batch_size_spinbox = ttk.Spinbox(top_frame, from_=1, to=4096, increment=64,
+                                              textvariable=self.ingest_batch_size, width=8)
+        self.batch_size_spinbox.grid(row=2, column=1, padx=5, pady=5, sticky=tk.W)
         
         # PDF buttons
         pdf_frame = ttk.Frame(top_frame)
@@ -129,15 +145,12 @@ class OllamaAITool:
         self.log_output("Checking if Ollama is running...")
         
         try:
-            result = subprocess.run(["ollama", "list"], capture_output=True, text=True)
-            if result.returncode == 0:
+            if self.ollama.is_running():
                 self.log_output("Ollama is running.")
                 self.fetch_ollama_models()
             else:
                 self.log_output("Ollama is not running. Please start Ollama and restart the application.")
                 self.prompt_start_ollama()
-        except FileNotFoundError:
-            self.log_output("Ollama is not installed or not in PATH. Please install Ollama first.")
         except Exception as e:
             self.log_output(f"Error checking Ollama: {str(e)}")
 
@@ -162,28 +175,13 @@ class OllamaAITool:
         self.log_output("Fetching available Ollama models...")
         
         try:
-            result = subprocess.run(["ollama", "list"], capture_output=True, text=True)
-            if result.returncode == 0:
-                # Parse the output to get model names
-                output_lines = result.stdout.strip().split("\n")
-                # Skip the header line
-                model_lines = output_lines[1:] if len(output_lines) > 1 else []
-                
-                models = []
-                for line in model_lines:
-                    # Extract the model name (first column)
-                    match = re.match(r'(\S+)', line)
-                    if match:
-                        models.append(match.group(1))
-                
-                if models:
-                    self.ollama_models = models
-                    self.log_output(f"Found {len(models)} models: {', '.join(models)}")
-                    self.update_model_dropdowns()
-                else:
-                    self.log_output("No models found. Please pull at least one model using 'ollama pull <model>'.")
+            models = self.ollama.list_models(refresh=True)
+            if models:
+                self.ollama_models = models
+                self.log_output(f"Found {len(models)} models: {', '.join(models)}")
+                self.update_model_dropdowns()
             else:
-                self.log_output("Failed to fetch models. Error: " + result.stderr)
+                self.log_output("No models found. Please pull at least one model using 'ollama pull <model>'.")
         except Exception as e:
             self.log_output(f"Error fetching models: {str(e)}")
 
@@ -196,6 +194,7 @@ class OllamaAITool:
         if self.ollama_models:
             self.embedding_llm.set(self.ollama_models[0])
             self.prompt_llm.set(self.ollama_models[0])
+            self.ollama.preload(self.prompt_llm.get())
             
             # Enable the Load PDFs button
             self.load_pdf_btn.config(state=tk.NORMAL)
@@ -250,24 +249,34 @@ class OllamaAITool:
             # Initialize ChromaDB
             self.init_vector_db()
             
-            # Process each PDF file
-            for i, pdf_path in enumerate(self.selected_pdfs):
-                if self.stop_execution:
-                    self.log_output("PDF processing stopped.")
-                    break
-                
-                pdf_name = os.path.basename(pdf_path)
-                self.log_output(f"Processing PDF {i+1}/{len(self.selected_pdfs)}: {pdf_name}")
-                
-                # Process the PDF and add to vector DB
-                self.process_single_pdf(pdf_path)
-                
-                # Check if processing is stopped
-                if self.stop_execution:
-                    self.log_output("PDF processing stopped.")
-                    break
+            try:
+                batch_size = max(1, int(self.ingest_batch_size.get()))
+            except (tk.TclError, ValueError):
+                batch_size = 256
+            
+            # Pages are parsed in worker processes while earlier pages are chunked, embedded
+            # in batches and written; the last partial batch is flushed on stop or completion
+            self.log_output(f"Processing {len(self.selected_pdfs)} PDFs in parallel...")
+            pipeline = IngestPipeline(
+                chunker=lambda text: self.chunk_text(text, 1000),
+                sink=self.indexing_sink(chroma_sink(self.collection)),
+                embedding_function=self.embedder,
+                parser="pymupdf",
+                batch_size=batch_size,
+                ocr=PAGE_OCR_OPTIONS,
+                should_stop=lambda: self.stop_execution,
+                on_progress=lambda total: self.log_output(f"Stored {total} chunks"),
+                on_error=lambda path, message: self.log_output(f"Error processing PDF {os.path.basename(path)}: {message}")
+            )
+            try:
+                stats = pipeline.run(self.selected_pdfs)
+            finally:
+                self.lexical_index.save()
+            self.log_output(stats.summary())
             
-            if not self.stop_execution:
+            if self.stop_execution:
+                self.log_output("PDF processing stopped.")
+            else:
                 self.log_output("PDF processing completed.")
                 # Enable the run query button once processing is complete
                 self.root.after(0, lambda: self.run_query_btn.config(state=tk.NORMAL))
@@ -292,57 +301,49 @@ class OllamaAITool:
             collection_id = self.generate_collection_id()
             
             # Try to get existing collection or create a new one
+            # (queries must embed with the same Ollama model the chunks were stored with)
+            embedding_func = self.embedder = self.create_ollama_embedding_function()
+            # Repeated questions reuse their query embedding (kept on disk next to the database)
+            if self.query_embedder:
+                self.query_embedder.close()
+            self.query_embedder = EmbeddingCache(embedding_func, self.embedding_llm.get(),
+                                                 path=os.path.join(db_path, "query_embeddings.sqlite"))
             try:
-                self.collection = self.db_client.get_collection(name=collection_id)
+                self.collection = self.db_client.get_collection(name=collection_id,
+                                                                embedding_function=embedding_func)
                 self.log_output(f"Using existing collection: {collection_id}")
             except:
                 # Create a new collection with the Ollama embedding function
-                embedding_func = self.create_ollama_embedding_function()
                 self.collection = self.db_client.create_collection(
                     name=collection_id,
                     embedding_function=embedding_func
                 )
                 self.log_output(f"Created new collection: {collection_id}")
+
+            # Keyword index over the same chunks, for exact terms (codes, names) embeddings miss
+            self.lexical_index = BM25Index(os.path.join(db_path, f"{collection_id}_bm25.json"))
+            if not len(self.lexical_index) and self.collection.count():
+                self.log_output("Building keyword index for existing collection...")
+                stored = self.collection.get(include=["documents", "metadatas"])
+                self.lexical_index.add(stored["ids"], stored["documents"],
+                                       [(meta or {}).get("source") for meta in stored["metadatas"]])
+                self.lexical_index.save()
             
         except Exception as e:
             self.log_output(f"Error initializing vector database: {str(e)}")
             raise
 
+    def indexing_sink(self, store):
+        # Each stored batch also goes into the keyword index
+        def add(documents, metadatas, ids, embeddings):
+            store(documents, metadatas, ids, embeddings)
+            self.lexical_index.add(ids, documents, [meta.get("source") for meta in metadatas])
+        return add
+
     def create_ollama_embedding_function(self):
-        # Create a custom embedding function that uses Ollama
-        class OllamaEmbeddingFunction:
-            def __init__(self, model_name):
-                self.model_name = model_name
-            
-            def __call__(self, texts):
-                embeddings = []
-                for text in texts:
-                    if not text.strip():
-                        # Handle empty text by returning zero vector
-                        embeddings.append(np.zeros(1536).tolist())  # Default embedding size
-                        continue
-                    
-                    try:
-                        cmd = ["ollama", "embeddings", "-m", self.model_name]
-                        process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, 
-                                                 stderr=subprocess.PIPE, text=True)
-                        stdout, stderr = process.communicate(input=text)
-                        
-                        if process.returncode != 0:
-                            raise Exception(f"Ollama embedding error: {stderr}")
-                        
-                        # Parse the JSON response
-                        response = json.loads(stdout)
-                        embedding = response.get("embedding", [])
-                        embeddings.append(embedding)
-                    except Exception as e:
-                        print(f"Error generating embedding: {str(e)}")
-                        # Return a zero vector as fallback
-                        embeddings.append(np.zeros(1536).tolist())
-                
-                return embeddings
-        
-        return OllamaEmbeddingFunction(self.embedding_llm.get())
+        # Embeddings go over the Ollama HTTP API in batches on a pooled keep-alive session
+        return OllamaEmbedder(self.embedding_llm.get(), session=self.ollama.session,
+                              keep_alive=self.ollama.keep_alive)
 
     def generate_collection_id(self):
         # Create a unique identifier based on the selected PDFs and embedding model
@@ -358,99 +359,6 @@ class OllamaAITool:
         
         return collection_id
 
-    def process_single_pdf(self, pdf_path):
-        try:
-            # Open the PDF
-            doc = fitz.open(pdf_path)
-            pdf_name = os.path.basename(pdf_path)
-            total_pages = len(doc)
-            
-            # Process each page with progress indicators
-            for page_num, page in enumerate(doc):
-                if self.stop_execution:
-                    break
-                
-                # Show progress every 30 seconds
-                if page_num % 5 == 0:
-                    self.log_output(f"Processing page {page_num+1}/{total_pages} of {pdf_name}")
-                else:
-                    self.log_output("*", end="")
-                
-                # Extract text from the page
-                text = page.get_text()
-                
-                # Process images if text is minimal
-                if len(text.strip()) < 100:  # If page has little text, check for images
-                    image_text = self.extract_text_from_images(page, page_num)
-                    if image_text:
-                        text = text + "\n" + image_text
-                
-                # Skip if page is empty
-                if not text.strip():
-                    continue
-                
-                # Split text into chunks (~ 1000 characters each)
-                chunks = self.chunk_text(text, 1000)
-                
-                # Add chunks to vector database
-                for i, chunk in enumerate(chunks):
-                    if self.stop_execution:
-                        break
-                    
-                    # Create unique ID for this chunk
-                    chunk_id = f"{pdf_name}_p{page_num}_c{i}"
-                    
-                    # Add to collection
-                    self.collection.add(
-                        documents=[chunk],
-                        metadatas=[{"source": pdf_name, "page": page_num + 1}],
-                        ids=[chunk_id]
-                    )
-                
-            doc.close()
-            
-        except Exception as e:
-            self.log_output(f"Error processing PDF {pdf_name}: {str(e)}")
-
-    def extract_text_from_images(self, page, page_num):
-        try:
-            # Get images from the page
-            image_list = page.get_images(full=True)
-            if not image_list:
-                return ""
-            
-            extracted_text = []
-            
-            for img_index, img in enumerate(image_list):
-                try:
-                    xref = img[0]
-                    base_image = page.parent.extract_image(xref)
-                    image_bytes = base_image["image"]
-                    
-                    # Save to a temporary file
-                    img_filename = self.temp_dir / f"page_{page_num}_img_{img_index}.png"
-                    with open(img_filename, "wb") as img_file:
-                        img_file.write(image_bytes)
-                    
-                    # Use pytesseract to extract text
-                    pil_image = Image.open(img_filename)
-                    text = pytesseract.image_to_string(pil_image)
-                    if text.strip():
-                        extracted_text.append(text)
-                    
-                    # Clean up temp file
-                    os.remove(img_filename)
-                    
-                except Exception as img_err:
-                    print(f"Error processing image: {str(img_err)}")
-                    continue
-            
-            return "\n".join(extracted_text)
-            
-        except Exception as e:
-            print(f"Error extracting image text: {str(e)}")
-            return ""
-
     def chunk_text(self, text, chunk_size=1000, overlap=100):
         # Split text into chunks with some overlap
         chunks = []
@@ -507,23 +415,27 @@ class OllamaAITool:
         try:
             self.log_output("Processing your query...")
             
-            # Get relevant chunks from vector DB
-            results = self.collection.query(
-                query_texts=[query],
-                n_results=10  # Adjust based on needed context
-            )
+            # Get relevant chunks: vector and keyword rankings fused by rank
+            results = hybrid_search(self.collection, self.lexical_index, query,
+                                    self.query_embedder.embed_query(query),
+                                    k=10, candidates=30)
             
             # Get the documents and their metadata
-            documents = results.get('documents', [[]])[0]
-            metadatas = results.get('metadatas', [[]])[0]
+            documents = results['documents']
+            metadatas = results['metadatas']
             
             if not documents:
                 self.log_output("No relevant information found for your query.")
                 return
             
+            # Overlapping and repeated excerpts are merged and the rest trimmed to fit the model
+            assembled = self.context_assembler.assemble(query, zip(documents, metadatas),
+                                                        context_budget(self.prompt_llm.get(), client=self.ollama))
+            self.log_output(assembled.summary())
+            
             # Prepare context from the retrieved documents
             context = ""
-            for i, (doc, meta) in enumerate(zip(documents, metadatas)):
+            for i, (doc, meta) in enumerate(assembled.passages):
                 source = meta.get('source', 'Unknown')
                 page = meta.get('page', 'Unknown')
                 context += f"\n--- Excerpt {i+1} from {source} (Page {page}) ---\n{doc}\n"
@@ -542,41 +454,28 @@ class OllamaAITool:
             User Query: {query}
             
             Answer:"""
+            self.log_output(f"Prompt: ~{estimate_tokens(prompt)} tokens")
             
             # Call Ollama to generate the answer
             self.log_output("Generating answer based on the relevant information...")
             
-            cmd = ["ollama", "run", self.prompt_llm.get()]
-            process = subprocess.Popen(
-                cmd, 
-                stdin=subprocess.PIPE, 
-                stdout=subprocess.PIPE, 
-                stderr=subprocess.PIPE, 
-                text=True,
-                bufsize=1  # Line buffered
-            )
-            
-            # Send the prompt
-            process.stdin.write(prompt)
-            process.stdin.close()
+            # Streamed over the shared HTTP connection, with the model kept loaded between queries
+            stream = self.ollama.stream({"model": self.prompt_llm.get(), "prompt": prompt})
             
             # Read and display the response in real-time
             answer = ""
-            for line in process.stdout:
+            for token in stream:
                 if self.stop_execution:
-                    process.terminate()
+                    stream.cancel()
                     self.log_output("\nQuery processing stopped.")
                     break
                 
-                answer += line
-                self.log_output(line, end="")
+                answer += token
+                self.log_output(token, end="")
             
             # Check for errors
-            stderr = process.stderr.read()
-            if stderr:
-                self.log_output(f"\nError: {stderr}")
-            
-            process.wait()
+            if stream.error:
+                self.log_output(f"\nError: {stream.error}")
             
             if not self.stop_execution:
                 self.log_output("\nQuery processing completed.")
@@ -602,6 +501,7 @@ class OllamaAITool:
         self.run_query_btn.config(state=tk.DISABLED)
         self.embedding_llm_dropdown.config(state=tk.DISABLED)
         self.prompt_llm_dropdown.config(state=tk.DISABLED)
+        self.batch_size_spinbox.config(state=tk.DISABLED)
 
     def enable_buttons_after_processing(self):
         self.load_pdf_btn.config(state=tk.NORMAL)
@@ -609,6 +509,7 @@ class OllamaAITool:
         self.run_query_btn.config(state=tk.NORMAL if hasattr(self, 'collection') and self.collection is not None else tk.DISABLED)
         self.embedding_llm_dropdown.config(state="readonly")
         self.prompt_llm_dropdown.config(state="readonly")
+        self.batch_size_spinbox.config(state=tk.NORMAL)
 
     def clear_display(self):
         self.output_display.config(state=tk.NORMAL)
@@ -661,21 +562,15 @@ class OllamaAITool:
         # Set stop flag in case any thread is running
         self.stop_execution = True
         
-        # Clean up temp directory
-        try:
-            if self.temp_dir.exists():
-                for temp_file in self.temp_dir.glob("*"):
-                    temp_file.unlink()
-                self.temp_dir.rmdir()
-        except:
-            pass
-        
         # Exit the application
         self.root.destroy()
         sys.exit(0)
 
 
 if __name__ == "__main__":
+    # PDF pages are parsed in worker processes (needed for frozen Windows builds)
+    multiprocessing.freeze_support()
+    
     # Create the main window
     root = tk.Tk()
     app = OllamaAITool(root)
@@ -2,18 +2,20 @@ import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import subprocess
 import threading
-import time
+import multiprocessing
 import os
 import sys
 import queue
 import re
-import pdfplumber
 import chromadb
 from chromadb.config import Settings
 from chromadb.utils import embedding_functions
 import ollama
 from dotenv import load_dotenv
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ollama_tools.pipeline import IngestPipeline, chroma_sink
+
 load_dotenv()
 
 class PDFAITool:
@@ -58,83 +60,80 @@ class PDFAITool:
             self.gpu_available = False
             self.gpu_info = "PyTorch not installed, using CPU"
 
-    # [Keep all previous methods unchanged until process_single_pdf]
+    # [Keep all previous methods unchanged until process_pdfs_thread]
+
+    def chunk_words(self, text):
+        # Improved text cleaning
+        cleaned = re.sub(r'[^\x00-\x7F]+', ' ', text)  # Remove non-ASCII characters
+        cleaned = re.sub(r'\s+', ' ', cleaned).strip()
+
+        # More conservative chunking
+        words = cleaned.split()
+        chunk_size = 400
+        overlap = 50
+
+        chunks = []
+        for i in range(0, len(words), chunk_size - overlap):
+            chunk = ' '.join(words[i:i+chunk_size])
+            if len(chunk) < 10:  # Skip tiny chunks
+                continue
+            chunks.append(chunk)
+        return chunks
 
-    def process_single_pdf(self, path, idx):
+    def process_pdfs_thread(self):
         try:
-            total_chunks = 0
-            with pdfplumber.open(path) as pdf:
-                documents = []
-                metadatas = []
-                ids = []
-
-                for page_num, page in enumerate(pdf.pages):
-                    if self.stop_flag:
-                        return 0
-
-                    try:
-                        text = page.extract_text()
-                        if not text:
-                            continue
-
-                        # Improved text cleaning
-                        cleaned = re.sub(r'[^\x00-\x7F]+', ' ', text)  # Remove non-ASCII characters
-                        cleaned = re.sub(r'\s+', ' ', cleaned).strip()
-                        
-                        # Skip empty text after cleaning
-                        if not cleaned:
-                            continue
-
-                        # More conservative chunking
-                        words = cleaned.split()
-                        chunk_size = 400
-                        overlap = 50
-                        
-                        for i in range(0, len(words), chunk_size - overlap):
-                            chunk = ' '.join(words[i:i+chunk_size])
-                            if len(chunk) < 10:  # Skip tiny chunks
-                                continue
-
-                            documents.append(chunk)
-                            metadatas.append({
-                                "source": os.path.basename(path),
-                                "page": str(page_num + 1)  # Ensure string type
-                            })
-                            ids.append(f"{idx}-{page_num}-{i}")
-
-                            # Add in batches to prevent memory issues
-                            if len(documents) >= 100:
-                                self.collection.add(
-                                    documents=documents,
-                                    metadatas=metadatas,
-                                    ids=ids
-                                )
-                                total_chunks += len(documents)
-                                documents = []
-                                metadatas = []
-                                ids = []
-
-                    except Exception as page_error:
-                        self.update_output(f"\nPage {page_num+1} error: {str(page_error)}")
-
-                # Add remaining documents
-                if documents:
-                    self.collection.add(
-                        documents=documents,
-                        metadatas=metadatas,
-                        ids=ids
-                    )
-                    total_chunks += len(documents)
-
-            return total_chunks
+            embedding_func = embedding_functions.OllamaEmbeddingFunction(
+                model_name=self.embedding_model.get(),
+                url="http://localhost:11434"
+            )
+            
+            self.collection = self.chroma_client.get_or_create_collection(
+                name="pdf_collection",
+                embedding_function=embedding_func
+            )
+
+            # One pipeline for all files: pages of every PDF are extracted in parallel worker
+            # processes and written in batches of 100 chunks
+            index_of = {path: idx for idx, path in enumerate(self.pdf_paths)}
+            chunk_counts = dict.fromkeys(self.pdf_paths, 0)
+            store = chroma_sink(self.collection)
+
+            def sink(documents, metadatas, ids, embeddings):
+                store(documents, metadatas, ids, embeddings)
+                for chunk_id in ids:
+                    chunk_counts[self.pdf_paths[int(chunk_id.split("-", 1)[0])]] += 1
+
+            pipeline = IngestPipeline(
+                chunker=self.chunk_words,
+                sink=sink,
+                parser="pdfplumber",
+                batch_size=100,
+                make_id=lambda pdf_path, page_num, i: f"{index_of[pdf_path]}-{page_num}-{i}",
+                make_metadata=lambda pdf_path, page_num: {
+                    "source": os.path.basename(pdf_path),
+                    "page": str(page_num + 1)  # Ensure string type
+                },
+                should_stop=lambda: self.stop_flag,
+                on_error=lambda pdf_path, message: self.update_output(
+                    f"\nError in {os.path.basename(pdf_path)}: {message}")
+            )
+            stats = pipeline.run(self.pdf_paths)
+
+            for path, chunks in chunk_counts.items():
+                self.update_output(f"Processed {os.path.basename(path)} ({chunks} chunks)\n")
+            self.update_output(f"\n{stats.summary()}\n")
+            self.update_output(f"\n=== Processing Complete ===\nTotal chunks: {stats.write.items}\n")
 
         except Exception as e:
-            self.update_output(f"\nFile error: {os.path.basename(path)} - {str(e)}\n")
-            return 0
+            self.update_output(f"\nProcessing error: {str(e)}\n")
+        finally:
+            self.processing = False
+            self.toggle_ui_state(False)
 
     # [Keep all remaining methods unchanged]
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     root = tk.Tk()
     app = PDFAITool(root)
     root.mainloop()
\ No newline at end of file
@@ -9,6 +9,7 @@ import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 import subprocess
 import threading
+import multiprocessing
 import time
 import os
 import sys
@@ -19,12 +20,36 @@ from pathlib import Path
 import json
 
 # For PDF processing and embedding
-from langchain_community.document_loaders import PyPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import Chroma
 from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain.chains import RetrievalQA
-from langchain_community.llms import Ollama
+
+import chromadb
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ollama_tools.pipeline import IngestPipeline, chroma_sink
+from ollama_tools.registry import DocumentRegistry
+from ollama_tools.answer_cache import AnswerCache, cache_scope
+from ollama_tools.embedding_cache import EmbeddingCache
+from ollama_tools.client import get_client
+from ollama_tools.timing import StageTimer
+
+# Collection name the langchain Chroma wrapper uses by default
+VECTOR_COLLECTION = "langchain"
+REGISTRY_FILE = "registry.json"
+ANSWER_CACHE_FILE = "answer_cache.json"
+QUERY_CACHE_FILE = "query_embeddings.sqlite"
+# Output pane refresh interval - streamed tokens are batched per refresh
+OUTPUT_POLL_MS = 30
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+# Same prompt RetrievalQA's "stuff" chain used
+QA_PROMPT = """Use the following pieces of context to answer the question at the end. If you don't know the answer, just say that you don't know, don't try to make up an answer.
+
+{context}
+
+Question: {question}
+Helpful Answer:"""
 
 # Optional imports that might fail on some systems
 try:
@@ -33,6 +58,82 @@ try:
 except ImportError:
     TORCH_AVAILABLE = False
 
+class RetrievalSession:
+    """
+    Embedding model, vector store and Ollama connection kept alive between queries.
+
+    Each part is built on first use and reused, and invalidate() drops the vector
+    store after the index has been rebuilt. All access goes through one lock, so a query
+    that arrives during warm_up() waits for it instead of loading the model a second time.
+    """
+    
+    def __init__(self, vector_db_path, device="cpu"):
+        self.vector_db_path = vector_db_path
+        self.device = device
+        self._lock = threading.RLock()
+        self._embeddings = None
+        self._vectordb = None
+        self._query_embedder = None
+        self._ollama = get_client()
+    
+    def embeddings(self):
+        with self._lock:
+            if self._embeddings is None:
+                self._embeddings = HuggingFaceEmbeddings(
+                    model_name=EMBEDDING_MODEL,
+                    model_kwargs={'device': self.device}
+                )
+            return self._embeddings
+    
+    def vectordb(self):
+        with self._lock:
+            if self._vectordb is None:
+                self._vectordb = Chroma(
+                    collection_name=VECTOR_COLLECTION,
+                    persist_directory=self.vector_db_path,
+                    embedding_function=self.embeddings()
+                )
+            return self._vectordb
+    
+    def query_embedder(self):
+        with self._lock:
+            if self._query_embedder is None:
+                self._query_embedder = EmbeddingCache(self.embeddings(), EMBEDDING_MODEL,
+                                                      path=os.path.join(self.vector_db_path, QUERY_CACHE_FILE))
+            return self._query_embedder
+    
+    def embed_query(self, query, timer):
+        """Query embedding, from the cache when the question was embedded before."""
+        embedder = self.query_embedder()
+        with timer.stage("embed query"):
+            return embedder.embed_query(query)
+    
+    def search(self, vector, top_k, timer):
+        """The top_k chunks closest to an already embedded query."""
+        vectordb = self.vectordb()
+        with timer.stage("search"):
+            return vectordb.similarity_search_by_vector(vector, k=top_k)
+    
+    def generate(self, model, temperature, prompt):
+        """Start a streaming Ollama generation over the shared pooled connection."""
+        payload = {"model": model, "prompt": prompt, "options": {"temperature": temperature}}
+        return self._ollama.stream(payload)
+    
+    def is_loaded(self):
+        return self._vectordb is not None
+    
+    def invalidate(self):
+        """Forget the vector store (the embedding model stays loaded)."""
+        with self._lock:
+            self._vectordb = None
+    
+    def warm_up(self):
+        """Load the embedding model (and the index, if one exists) ahead of the first query."""
+        with self._lock:
+            self.embeddings().embed_query("warm up")
+            if os.path.exists(self.vector_db_path):
+                self.vectordb()
+
 class RAGApplication:
     def __init__(self, root):
         self.root = root
@@ -44,6 +145,8 @@ class RAGApplication:
         self.processing = False
         self.stop_flag = False
         self.output_queue = queue.Queue()
+        self.active_stream = None  # GenerationStream of the running query
+        self.ollama = get_client()
         self.ollama_models = []
         self.embedding_model = "llama3"
         self.query_model = "llama3"
@@ -65,6 +168,10 @@ class RAGApplication:
         self.gpu_available = False
         self.detect_hardware()
         
+        # Loaded once and shared by indexing and every query
+        self.session = RetrievalSession(self.vector_db_path, 'cuda' if self.gpu_available else 'cpu')
+        self.answer_cache = AnswerCache(os.path.join(self.vector_db_path, ANSWER_CACHE_FILE))
+        
         # Setup GUI components
         self.setup_gui()
         
@@ -128,6 +235,8 @@ class RAGApplication:
         self.query_model_var = tk.StringVar(value=self.query_model)
         self.query_model_combo = ttk.Combobox(query_frame, textvariable=self.query_model_var, width=20)
         self.query_model_combo.pack(side=tk.LEFT, padx=5)
+        # Load the model while the user is still typing the question
+        self.query_model_combo.bind("<<ComboboxSelected>>", lambda e: self.ollama.preload(self.query_model_var.get()))
         
         # Processing parameters section
         param_frame = ttk.LabelFrame(main_frame, text="Processing Parameters", padding="5")
@@ -270,6 +379,8 @@ class RAGApplication:
         """Stop ongoing processing"""
         if self.processing:
             self.stop_flag = True
+            if self.active_stream:
+                self.active_stream.cancel()
             self.update_output("Stopping current operation...")
     
     def clear_display(self):
@@ -295,7 +406,17 @@ class RAGApplication:
     def start_background_tasks(self):
         """Start background tasks"""
         threading.Thread(target=self.check_ollama_and_models, daemon=True).start()
+        threading.Thread(target=self.warm_up_session, daemon=True).start()
         self.poll_output_queue()
+    
+    def warm_up_session(self):
+        """Load the embedding model and vector store in the background"""
+        try:
+            started = time.time()
+            self.session.warm_up()
+            self.update_output(f"Embedding model loaded in {time.time() - started:.1f}s")
+        except Exception as e:
+            self.update_output(f"Could not preload embedding model: {str(e)}")
         
     def check_ollama_and_models(self):
         """Check if Ollama server is running and get available models"""
@@ -305,8 +426,7 @@ class RAGApplication:
         if not ollama_running:
             self.update_output("Ollama not running. Attempting to start Ollama server...")
             self.start_ollama()
-            time.sleep(5)
-            ollama_running = self.check_ollama_service()
+            ollama_running = self.ollama.wait_until_ready(attempts=10, delay=1)
         
         if ollama_running:
             self.update_output("Ollama is running")
@@ -318,16 +438,7 @@ class RAGApplication:
     
     def check_ollama_service(self):
         """Check if Ollama service is running"""
-        try:
-            result = subprocess.run(
-                ["ollama", "list"], 
-                capture_output=True, 
-                text=True, 
-                timeout=5
-            )
-            return result.returncode == 0
-        except (subprocess.SubprocessError, FileNotFoundError):
-            return False
+        return self.ollama.is_running()
     
     def start_ollama(self):
         """Start Ollama server"""
@@ -354,39 +465,22 @@ class RAGApplication:
     def get_ollama_models(self):
         """Get list of available Ollama models"""
         try:
-            result = subprocess.run(
-                ["ollama", "list"], 
-                capture_output=True, 
-                text=True
-            )
-            
-            if result.returncode == 0:
-                lines = result.stdout.strip().split('\n')
-                if len(lines) > 1:
-                    models = []
-                    for line in lines[1:]:
-                        parts = line.split()
-                        if parts:
-                            model_name = parts[0]
-                            models.append(model_name)
-                    
-                    # Sort models alphabetically
-                    self.ollama_models = sorted(models, key=lambda x: x.lower())
-                    self.update_output(f"Available models: {', '.join(self.ollama_models)}")
-                    
-                    # Update comboboxes with sorted list
-                    self.embed_model_combo['values'] = self.ollama_models
-                    self.query_model_combo['values'] = self.ollama_models
-                    
-                    if self.ollama_models:
-                        if "llama3" in self.ollama_models:
-                            self.embed_model_var.set("llama3")
-                            self.query_model_var.set("llama3")
-                        else:
-                            self.embed_model_var.set(self.ollama_models[0])
-                            self.query_model_var.set(self.ollama_models[0])
-            else:
-                self.update_output(f"Error getting models: {result.stderr}")
+            # Sorted by the client
+            self.ollama_models = self.ollama.list_models(refresh=True)
+            if self.ollama_models:
+                self.update_output(f"Available models: {', '.join(self.ollama_models)}")
+                
+                # Update comboboxes with sorted list
+                self.embed_model_combo['values'] = self.ollama_models
+                self.query_model_combo['values'] = self.ollama_models
+                
+                if "llama3" in self.ollama_models:
+                    self.embed_model_var.set("llama3")
+                    self.query_model_var.set("llama3")
+                else:
+                    self.embed_model_var.set(self.ollama_models[0])
+                    self.query_model_var.set(self.ollama_models[0])
+                self.ollama.preload(self.query_model_var.get())
         except Exception as e:
             self.update_output(f"Error getting models: {str(e)}")
     
@@ -459,14 +553,12 @@ class RAGApplication:
             self.update_output("\nInitializing vector database...")
             os.makedirs(self.vector_db_path, exist_ok=True)
             
-            if os.path.exists(self.vector_db_path):
-                for item in os.listdir(self.vector_db_path):
-                    item_path = os.path.join(self.vector_db_path, item)
-                    if os.path.isfile(item_path):
-                        os.remove(item_path)
-                    elif os.path.isdir(item_path):
-                        import shutil
-                        shutil.rmtree(item_path)
+            # The index is kept between runs; only new or changed PDFs are re-embedded
+            registry = DocumentRegistry(
+                os.path.join(self.vector_db_path, REGISTRY_FILE),
+                {"embedding_model": EMBEDDING_MODEL, "chunk_size": self.chunk_size,
+                 "chunk_overlap": self.chunk_overlap, "parser": "pypdf"}
+            )
             
             self.update_output(f"Configuring embedding model: {self.embedding_model}")
             text_splitter = RecursiveCharacterTextSplitter(
@@ -475,54 +567,80 @@ class RAGApplication:
                 length_function=len
             )
             
-            all_chunks = []
-            total_pages = 0
+            embeddings = self.session.embeddings()
             
-            for i, pdf_path in enumerate(self.pdf_paths):
-                if self.stop_flag:
-                    self.update_output("\nProcessing stopped by user.")
-                    break
-                    
-                filename = os.path.basename(pdf_path)
-                self.update_output(f"\nProcessing {i+1}/{len(self.pdf_paths)}: {filename}")
-                
-                try:
-                    loader = PyPDFLoader(pdf_path)
-                    pages = loader.load()
-                    total_pages += len(pages)
-                    self.update_output(f"  - Loaded {len(pages)} pages")
-                    
-                    chunks = text_splitter.split_documents(pages)
-                    all_chunks.extend(chunks)
-                    self.update_output(f"  - Split into {len(chunks)} chunks")
-                    
-                except Exception as e:
-                    self.update_output(f"Error processing {filename}: {str(e)}")
+            # Written straight into the collection the langchain Chroma wrapper reads at query time
+            client = chromadb.PersistentClient(path=self.vector_db_path)
+            collection = client.get_or_create_collection(VECTOR_COLLECTION)
+            # Different settings, or an index built before the registry existed, mean a full rebuild
+            if registry.params_changed or (not len(registry) and collection.count()):
+                self.update_output("Chunking or embedding settings changed - rebuilding the whole index")
+                client.delete_collection(VECTOR_COLLECTION)
+                collection = client.get_or_create_collection(VECTOR_COLLECTION)
+                registry.clear()
             
-            if all_chunks and not self.stop_flag:
-                self.update_output(f"\nCreating vector embeddings for {len(all_chunks)} chunks from {total_pages} pages...")
-                
-                if self.gpu_available:
-                    model_kwargs = {'device': 'cuda'}
-                else:
-                    model_kwargs = {'device': 'cpu'}
-                
-                embeddings = HuggingFaceEmbeddings(
-                    model_name="sentence-transformers/all-MiniLM-L6-v2",
-                    model_kwargs=model_kwargs
+            plan = registry.plan(self.pdf_paths)
+            self.update_output(f"\n{len(plan['new'])} new, {len(plan['changed'])} changed, "
+                               f"{len(plan['unchanged'])} unchanged, {len(plan['removed'])} removed PDFs")
+            
+            # New paths are cleared too, in case an earlier run was stopped halfway through them.
+            # Changed ones are forgotten with their chunks, so the saved version (and with it the
+            # answer cache scope) changes even if this run is stopped or the file fails
+            for path in plan["removed"] + plan["changed"] + plan["new"]:
+                collection.delete(where={"source": path})
+            for path in plan["removed"] + plan["changed"]:
+                registry.forget(path)
+            registry.save()
+            
+            to_index = plan["changed"] + plan["new"]
+            stats = None
+            failed = set()
+            chunk_ids = {path: [] for path in to_index}
+            store = chroma_sink(collection)
+            
+            def sink(documents, metadatas, ids, vectors):
+                store(documents, metadatas, ids, vectors)
+                for metadata, chunk_id in zip(metadatas, ids):
+                    chunk_ids[metadata["source"]].append(chunk_id)
+            
+            def on_error(path, message):
+                failed.add(path)
+                self.update_output(f"Error processing {os.path.basename(path)}: {message}")
+            
+            if to_index:
+                # Pages are parsed in worker processes while earlier pages are split, embedded and stored
+                self.update_output(f"\nProcessing {len(to_index)} PDFs in parallel...")
+                pipeline = IngestPipeline(
+                    chunker=text_splitter.split_text,
+                    sink=sink,
+                    embedding_function=embeddings.embed_documents,
+                    parser="pypdf",
+                    batch_size=128,
+                    make_id=lambda path, page, i: f"{path}:{page}:{i}",
+                    make_metadata=lambda path, page: {"source": path, "page": page},
+                    should_stop=lambda: self.stop_flag,
+                    on_progress=lambda total: self.status_var.set(f"Stored {total} chunks..."),
+                    on_error=on_error
                 )
+                stats = pipeline.run(to_index)
                 
-                vectordb = Chroma.from_documents(
-                    documents=all_chunks,
-                    embedding=embeddings,
-                    persist_directory=self.vector_db_path
-                )
+                # A stopped run leaves its PDFs unrecorded, so the next run redoes them
+                if not stats.stopped:
+                    for path in to_index:
+                        if path not in failed:
+                            registry.record(path, chunk_ids[path])
+                registry.save()
                 
-                vectordb.persist()
-                self.update_output("Vector database created and persisted successfully!")
-                self.update_output(f"Total documents: {len(all_chunks)} chunks from {total_pages} pages across {len(self.pdf_paths)} files")
-            elif self.stop_flag:
+                self.update_output("\nPipeline throughput:")
+                self.update_output(stats.summary())
+            
+            if self.stop_flag:
                 self.update_output("\nProcessing was stopped before completion.")
+            elif len(registry):
+                self.update_output("Vector database updated and persisted successfully!")
+                if stats:
+                    self.update_output(f"Indexed {stats.write.items} chunks from {stats.extract.items} pages across {len(to_index)} files")
+                self.update_output(f"Index holds {len(registry)} PDFs, {collection.count()} chunks")
             else:
                 self.update_output("\nNo chunks were created. Processing failed.")
             
@@ -531,6 +649,8 @@ class RAGApplication:
         except Exception as e:
             self.update_output(f"Error in processing: {str(e)}")
         finally:
+            # The collection may have been recreated; queries reopen it
+            self.session.invalidate()
             self.processing = False
             self.progress.stop()
             self.status_var.set("Ready")
@@ -569,58 +689,71 @@ class RAGApplication:
             self.update_output(f"Top K results: {self.top_k_results}")
             self.update_output(f"Temperature: {self.temperature}")
             
-            if self.gpu_available:
-                model_kwargs = {'device': 'cuda'}
-            else:
-                model_kwargs = {'device': 'cpu'}
-            
-            embeddings = HuggingFaceEmbeddings(
-                model_name="sentence-transformers/all-MiniLM-L6-v2",
-                model_kwargs=model_kwargs
-            )
+            if not self.session.is_loaded():
+                self.update_output("Loading vector database...")
             
-            self.update_output("Loading vector database...")
-            vectordb = Chroma(
-                persist_directory=self.vector_db_path,
-                embedding_function=embeddings
+            # Repeated questions against the same index and settings reuse the earlier answer
+            timer = StageTimer()
+            scope = cache_scope(
+                index=DocumentRegistry.stored_version(os.path.join(self.vector_db_path, REGISTRY_FILE)),
+                model=self.query_model, temperature=self.temperature, top_k=self.top_k_results, prompt=QA_PROMPT
             )
+            vector = None
+            cached = self.answer_cache.get(scope, query_text)
+            if cached is None:
+                self.update_output("Retrieving relevant documents...")
+                vector = self.session.embed_query(query_text, timer)
+                cached = self.answer_cache.get(scope, query_text, vector)
             
-            retriever = vectordb.as_retriever(
-                search_kwargs={"k": self.top_k_results}
-            )
-            
-            self.update_output("Retrieving relevant documents...")
-            docs = retriever.get_relevant_documents(query_text)
-            
-            if self.stop_flag:
-                self.update_output("\nQuery processing stopped by user.")
-                return
-            
-            self.update_output(f"Configuring LLM using model: {self.query_model}")
-            llm = Ollama(model=self.query_model, temperature=self.temperature)
-            
-            qa_chain = RetrievalQA.from_chain_type(
-                llm=llm,
-                chain_type="stuff",
-                retriever=retriever,
-                return_source_documents=True
-            )
-            
-            self.update_output("Generating response...")
-            result = qa_chain({"query": query_text})
-            
-            if self.stop_flag:
-                self.update_output("\nQuery processing stopped by user.")
-                return
-            
-            self.update_output("\n--- Response ---")
-            self.update_output(result["result"])
+            if cached is not None:
+                timer.stop()
+                match = "exact match" if "similarity" not in cached else f"similar question, {cached['similarity']:.2f}"
+                self.update_output(f"\n--- Response (cached, {match}) ---")
+                if "similarity" in cached:
+                    self.update_output(f"Cached question: {cached['query']}")
+                self.update_output(cached["answer"])
+                sources = cached["sources"]
+            else:
+                # Retrieve once; the same documents feed the prompt and the source list
+                docs = self.session.search(vector, self.top_k_results, timer)
+                
+                if self.stop_flag:
+                    self.update_output("\nQuery processing stopped by user.")
+                    return
+                
+                with timer.stage("prompt build"):
+                    context = "\n\n".join(doc.page_content for doc in docs)
+                    prompt = QA_PROMPT.format(context=context, question=query_text)
+                
+                # The answer is streamed into the output pane; Stop aborts the request
+                self.update_output("Generating response...")
+                self.update_output("\n--- Response ---")
+                stream = self.active_stream = self.session.generate(self.query_model, self.temperature, prompt)
+                for token in stream:
+                    timer.mark("first token")
+                    self.update_output(token, end="")
+                self.active_stream = None
+                timer.stop()
+                self.update_output("")
+                
+                if stream.error:
+                    raise stream.error
+                if self.stop_flag:
+                    self.update_output("\nQuery processing stopped by user.")
+                    return
+                
+                sources = [{"source": doc.metadata.get("source", "Unknown"), "page": doc.metadata.get("page", "Unknown")}
+                           for doc in docs]
+                self.answer_cache.put(scope, query_text, stream.text, vector, sources)
             
             self.update_output("\n--- Sources ---")
-            for i, doc in enumerate(result["source_documents"]):
-                source = doc.metadata.get("source", "Unknown")
-                page = doc.metadata.get("page", "Unknown")
-                self.update_output(f"Source {i+1}: {source}, Page: {page}")
+            for i, source in enumerate(sources):
+                self.update_output(f"Source {i+1}: {source['source']}, Page: {source['page']}")
+            
+            self.update_output("\n--- Timing ---")
+            self.update_output(timer.summary())
+            self.update_output(self.answer_cache.summary())
+            self.update_output(self.session.query_embedder().summary())
             
         except Exception as e:
             self.update_output(f"Error executing query: {str(e)}")
@@ -629,22 +762,27 @@ class RAGApplication:
             self.progress.stop()
             self.status_var.set("Ready")
     
-    def update_output(self, text):
+    def update_output(self, text, end="\n"):
         """Add text to the output queue"""
-        self.output_queue.put(text)
+        self.output_queue.put(f"{text}{end}")
     
     def poll_output_queue(self):
         """Poll the output queue and update the text widget"""
         try:
+            # Everything queued since the last frame goes in with one insert
+            parts = []
             while not self.output_queue.empty():
-                text = self.output_queue.get(block=False)
-                self.output_text.insert(tk.END, f"{text}\n")
-                self.output_text.see(tk.END)
+                parts.append(self.output_queue.get(block=False))
                 self.output_queue.task_done()
+            if parts:
+                self.output_text.insert(tk.END, "".join(parts))
+                self.output_text.see(tk.END)
         finally:
-            self.root.after(100, self.poll_output_queue)
+            self.root.after(OUTPUT_POLL_MS, self.poll_output_queue)
 
 def main():
+    # PDF pages are parsed in worker processes (needed for frozen Windows builds)
+    multiprocessing.freeze_support()
     root = tk.Tk()
     app = RAGApplication(root)
     root.mainloop()
@@ -2,15 +2,20 @@ import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import subprocess
 import threading
-import time
 import os
+import sys
+import multiprocessing
 import requests
 import json
-from PyPDF2 import PdfReader
 import chromadb
 from chromadb.config import Settings
 from chromadb.utils import embedding_functions
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ollama_tools.client import get_client
+from ollama_tools.embedding_cache import EmbeddingCache
+from ollama_tools.pipeline import IngestPipeline, chroma_sink
+
 # pip install tkinter requests PyPDF2 chromadb
 
 
@@ -23,8 +28,13 @@ class AIToolGUI:
         self.embedding_llm = tk.StringVar()
         self.prompt_llm = tk.StringVar()
         self.pdf_files = []
+        self.ollama = get_client()
         self.chroma_client = chromadb.Client(Settings(persist_directory="./db"))
-        self.collection = self.chroma_client.create_collection("pdf_collection")
+        # Chroma's default model; questions asked again skip it through the cache
+        self.embedding_function = embedding_functions.DefaultEmbeddingFunction()
+        self.query_embedder = EmbeddingCache(self.embedding_function, "chroma-default")
+        self.collection = self.chroma_client.create_collection("pdf_collection",
+                                                               embedding_function=self.embedding_function)
 
         self.create_widgets()
 
@@ -37,6 +47,8 @@ class AIToolGUI:
         ttk.Label(self.master, text="Select The Prompt LLM:").pack()
         self.prompt_llm_dropdown = ttk.Combobox(self.master, textvariable=self.prompt_llm)
         self.prompt_llm_dropdown.pack()
+        # Load the prompt model in the background as soon as it is picked
+        self.prompt_llm_dropdown.bind("<<ComboboxSelected>>", lambda e: self.ollama.preload(self.prompt_llm.get()))
 
         # Buttons
         ttk.Button(self.master, text="Load PDFs", command=self.load_pdfs).pack()
@@ -60,20 +72,14 @@ class AIToolGUI:
         self.check_ollama()
 
     def check_ollama(self):
-        try:
-            response = requests.get("http://localhost:11434/api/tags")
-            if response.status_code == 200:
-                self.update_llm_list()
-            else:
-                messagebox.showwarning("Ollama Not Running", "Please start Ollama and restart the application.")
-                self.master.quit()
-        except requests.ConnectionError:
+        if self.ollama.is_running():
+            self.update_llm_list()
+        else:
             messagebox.showwarning("Ollama Not Running", "Please start Ollama and restart the application.")
             self.master.quit()
 
     def update_llm_list(self):
-        response = requests.get("http://localhost:11434/api/tags")
-        llms = [model['name'] for model in response.json()['models']]
+        llms = self.ollama.list_models()
         self.embedding_llm_dropdown['values'] = llms
         self.prompt_llm_dropdown['values'] = llms
 
@@ -94,27 +100,22 @@ class AIToolGUI:
 
     def _process_pdfs(self):
         self.output_display.insert(tk.END, "Processing PDFs started...\n")
-        for pdf_file in self.pdf_files:
-            self.output_display.insert(tk.END, f"Processing {os.path.basename(pdf_file)}...\n")
-            self.master.update_idletasks()
-
-            reader = PdfReader(pdf_file)
-            for i, page in enumerate(reader.pages):
-                text = page.extract_text()
-                self.collection.add(
-                    documents=[text],
-                    metadatas=[{"source": os.path.basename(pdf_file), "page": i+1}],
-                    ids=[f"{os.path.basename(pdf_file)}_page_{i+1}"]
-                )
-
-                if (i + 1) % 10 == 0:
-                    self.output_display.insert(tk.END, "*")
-                    self.master.update_idletasks()
-                    time.sleep(0.1)
-
-            self.output_display.insert(tk.END, f"\nFinished processing {os.path.basename(pdf_file)}\n")
-            self.master.update_idletasks()
+        self.master.update_idletasks()
 
+        # Pages are extracted in worker processes and stored one page per document, in batches
+        pipeline = IngestPipeline(
+            chunker=lambda text: [text],
+            sink=chroma_sink(self.collection),
+            parser="pypdf2",
+            batch_size=64,
+            make_id=lambda pdf_file, page, i: f"{os.path.basename(pdf_file)}_page_{page+1}",
+            on_progress=lambda total: self.output_display.insert(tk.END, "*"),
+            on_error=lambda pdf_file, message: self.output_display.insert(
+                tk.END, f"\nError processing {os.path.basename(pdf_file)}: {message}\n")
+        )
+        stats = pipeline.run(self.pdf_files)
+
+        self.output_display.insert(tk.END, f"\n{stats.summary()}\n")
         self.output_display.insert(tk.END, "PDF processing Completed.\n")
 
     def run_query(self):
@@ -134,7 +135,7 @@ class AIToolGUI:
         self.master.update_idletasks()
 
         # Retrieve relevant documents from the vector database
-        results = self.collection.query(query_texts=[query], n_results=5)
+        results = self.collection.query(query_embeddings=[self.query_embedder.embed_query(query)], n_results=5)
 
         # Prepare the context for the LLM
         context = "\n".join([doc for doc in results['documents'][0]])
@@ -143,14 +144,11 @@ class AIToolGUI:
         prompt = f"Context:\n{context}\n\nQuery: {query}\n\nAnswer:"
 
         # Send the query to Ollama
-        response = requests.post("http://localhost:11434/api/generate",
-                                 json={"model": self.prompt_llm.get(), "prompt": prompt})
-
-        if response.status_code == 200:
-            answer = response.json()['response']
+        try:
+            answer = self.ollama.generate({"model": self.prompt_llm.get(), "prompt": prompt})['response']
             self.output_display.insert(tk.END, f"\nAnswer:\n{answer}\n")
-        else:
-            self.output_display.insert(tk.END, f"\nError processing query: {response.text}\n")
+        except requests.RequestException as e:
+            self.output_display.insert(tk.END, f"\nError processing query: {e}\n")
 
         self.master.update_idletasks()
 
@@ -179,6 +177,7 @@ class AIToolGUI:
         self.output_display.insert(tk.END, info)
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     root = tk.Tk()
     app = AIToolGUI(root)
     root.mainloop()
@@ -1,8 +1,11 @@
 import tkinter as tk
-from tkinter import ttk, messagebox, scrolledtext
+from tkinter import ttk, messagebox, scrolledtext, filedialog
 import numpy as np
 import threading
-import time
+import multiprocessing
+from allocation_engine import (budget_grid, covariance_matrix, format_report, load_covariance_csv, optimize,
+                               sweep_frontier, target_percentages)
+import batch_rebalance
 
 # Enhanced
 # pyinstaller --onefile --windowed CalculateOptimalAllocation.py
@@ -11,12 +14,13 @@ class ETFOptimizerApp:
     def __init__(self, root):
         self.root = root
         self.root.title("ETF Allocation Optimizer")
-        self.root.geometry("900x950")  # Adjusted window size for better display
+        self.root.geometry("900x1000")  # Adjusted window size for better display
         self.root.minsize(900, 900)   # Set minimum window size
         self.root.resizable(True, True)
         
         self.stop_flag = threading.Event()
         self.calculation_thread = None
+        self.covariance_path = None
         
         # Default ETF entries
         self.default_entries = [
@@ -66,6 +70,70 @@ class ETFOptimizerApp:
         self.secondary_obj.pack(side=tk.LEFT, padx=5)
         self.secondary_obj.set("Minimize Total Deviation")
         
+        # Solver frame
+        solver_frame = ttk.Frame(main_frame, padding="5")
+        solver_frame.pack(fill=tk.X, pady=5)
+        
+        ttk.Label(solver_frame, text="Solver:", font=("Arial", 10, "bold")).pack(side=tk.LEFT, padx=5)
+        self.solver_var = tk.StringVar()
+        self.solver = ttk.Combobox(solver_frame, textvariable=self.solver_var, 
+                                 values=["Greedy Search", "Branch & Bound Search"],
+                                 state="readonly", width=25)
+        self.solver.pack(side=tk.LEFT, padx=5)
+        self.solver.set("Greedy Search")
+        
+        # Mode frame - fresh cash allocation or rebalancing of the held shares
+        mode_frame = ttk.Frame(main_frame, padding="5")
+        mode_frame.pack(fill=tk.X, pady=5)
+        
+        ttk.Label(mode_frame, text="Mode:", font=("Arial", 10, "bold")).pack(side=tk.LEFT, padx=5)
+        self.mode_var = tk.StringVar()
+        self.mode = ttk.Combobox(mode_frame, textvariable=self.mode_var, 
+                               values=["New Cash", "Rebalance Holdings"],
+                               state="readonly", width=20)
+        self.mode.pack(side=tk.LEFT, padx=5)
+        self.mode.set("New Cash")
+        
+        ttk.Label(mode_frame, text="Band (%):").pack(side=tk.LEFT, padx=(10, 2))
+        self.band_entry = ttk.Entry(mode_frame, width=6)
+        self.band_entry.pack(side=tk.LEFT)
+        ttk.Label(mode_frame, text="Cost/Trade ($):").pack(side=tk.LEFT, padx=(10, 2))
+        self.cost_trade_entry = ttk.Entry(mode_frame, width=6)
+        self.cost_trade_entry.pack(side=tk.LEFT)
+        ttk.Label(mode_frame, text="Cost (bps):").pack(side=tk.LEFT, padx=(10, 2))
+        self.cost_bps_entry = ttk.Entry(mode_frame, width=6)
+        self.cost_bps_entry.pack(side=tk.LEFT)
+        for entry in (self.band_entry, self.cost_trade_entry, self.cost_bps_entry):
+            entry.insert(0, "0")
+        
+        self.fractional_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(mode_frame, text="Fractional", variable=self.fractional_var).pack(side=tk.LEFT, padx=(10, 2))
+        self.allow_sells_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(mode_frame, text="Allow Sells", variable=self.allow_sells_var).pack(side=tk.LEFT, padx=2)
+        
+        # Monte Carlo frame - re-score the allocation under simulated price moves (0 scenarios = off)
+        scenario_frame = ttk.Frame(main_frame, padding="5")
+        scenario_frame.pack(fill=tk.X, pady=5)
+        
+        ttk.Label(scenario_frame, text="Scenarios:", font=("Arial", 10, "bold")).pack(side=tk.LEFT, padx=5)
+        self.scenarios_entry = ttk.Entry(scenario_frame, width=8)
+        self.scenarios_entry.pack(side=tk.LEFT)
+        ttk.Label(scenario_frame, text="Volatility (%):").pack(side=tk.LEFT, padx=(10, 2))
+        self.volatility_entry = ttk.Entry(scenario_frame, width=6)
+        self.volatility_entry.pack(side=tk.LEFT)
+        ttk.Label(scenario_frame, text="Correlation:").pack(side=tk.LEFT, padx=(10, 2))
+        self.correlation_entry = ttk.Entry(scenario_frame, width=6)
+        self.correlation_entry.pack(side=tk.LEFT)
+        ttk.Label(scenario_frame, text="Horizon (yrs):").pack(side=tk.LEFT, padx=(10, 2))
+        self.horizon_entry = ttk.Entry(scenario_frame, width=6)
+        self.horizon_entry.pack(side=tk.LEFT)
+        self.reset_scenario_entries()
+        
+        self.covariance_button = ttk.Button(scenario_frame, text="Load Covariance...", command=self.load_covariance)
+        self.covariance_button.pack(side=tk.LEFT, padx=(10, 2))
+        self.covariance_label = ttk.Label(scenario_frame, text="")
+        self.covariance_label.pack(side=tk.LEFT, padx=2)
+        
         # Input section frame
         input_frame = ttk.LabelFrame(main_frame, text="ETF Entries", padding="10")
         input_frame.pack(fill=tk.BOTH, expand=True, pady=10)
@@ -74,8 +142,8 @@ class ETFOptimizerApp:
         header_frame = ttk.Frame(input_frame)
         header_frame.pack(fill=tk.X)
 
-        headers = ["#", "Symbol", "Target ($)", "Price ($)"]
-        widths = [3, 10, 12, 12]
+        headers = ["#", "Symbol", "Target ($)", "Price ($)", "Held"]
+        widths = [3, 10, 12, 12, 10]
         
         self.header_labels = []
         for i, header in enumerate(headers):
@@ -103,6 +171,7 @@ class ETFOptimizerApp:
         self.symbol_entries = []
         self.target_entries = []
         self.price_entries = []
+        self.held_entries = []
         
         for i in range(10):
             ttk.Label(self.rows_frame, text=f"{i+1}", width=3).grid(row=i, column=0, padx=5, pady=2)
@@ -118,6 +187,10 @@ class ETFOptimizerApp:
             price_entry = ttk.Entry(self.rows_frame, width=widths[3])
             price_entry.grid(row=i, column=3, padx=5, pady=2)
             self.price_entries.append(price_entry)
+            
+            held_entry = ttk.Entry(self.rows_frame, width=widths[4])
+            held_entry.grid(row=i, column=4, padx=5, pady=2)
+            self.held_entries.append(held_entry)
         
         # Load default entries
         self.reload_defaults()
@@ -181,6 +254,33 @@ class ETFOptimizerApp:
                                    width=15, height=2, 
                                    bg="red", fg="black")
         self.exit_button.pack(side=tk.RIGHT, padx=5)
+        
+        # Batch and analysis tools
+        tools_frame = ttk.Frame(main_frame)
+        tools_frame.pack(fill=tk.X, pady=(0, 10))
+        
+        self.batch_button = tk.Button(tools_frame, text="Batch Rebalance", 
+                                    command=self.start_batch,
+                                    width=15, height=2, 
+                                    bg="light blue", fg="black")
+        self.batch_button.pack(side=tk.LEFT, padx=5)
+        
+        self.sweep_button = tk.Button(tools_frame, text="Frontier Sweep", 
+                                    command=self.start_sweep,
+                                    width=15, height=2, 
+                                    bg="light blue", fg="black")
+        self.sweep_button.pack(side=tk.LEFT, padx=5)
+        
+        ttk.Label(tools_frame, text="Budgets ($) From:").pack(side=tk.LEFT, padx=(10, 2))
+        self.sweep_from_entry = ttk.Entry(tools_frame, width=8)
+        self.sweep_from_entry.pack(side=tk.LEFT)
+        ttk.Label(tools_frame, text="To:").pack(side=tk.LEFT, padx=(10, 2))
+        self.sweep_to_entry = ttk.Entry(tools_frame, width=8)
+        self.sweep_to_entry.pack(side=tk.LEFT)
+        ttk.Label(tools_frame, text="Step:").pack(side=tk.LEFT, padx=(10, 2))
+        self.sweep_step_entry = ttk.Entry(tools_frame, width=8)
+        self.sweep_step_entry.pack(side=tk.LEFT)
+        self.reset_sweep_entries()
     
     def update_target_header(self, *args):
         alloc_type = self.allocation_type_var.get()
@@ -193,14 +293,45 @@ class ETFOptimizerApp:
         self.rows_canvas.configure(scrollregion=self.rows_canvas.bbox("all"))
     
     def validate_inputs(self):
+        rebalance = self.mode_var.get() == "Rebalance Holdings"
         try:
             budget = float(self.budget_entry.get())
-            if budget <= 0:
+            if budget < 0 or (budget == 0 and not rebalance):
                 raise ValueError("Budget must be a positive number")
         except ValueError as e:
             messagebox.showerror("Input Error", f"Invalid budget: {str(e)}")
             return None
         
+        rebalance_options = {}
+        if rebalance:
+            try:
+                for key, entry in (("band", self.band_entry), ("cost_per_trade", self.cost_trade_entry),
+                                   ("cost_bps", self.cost_bps_entry)):
+                    value = float(entry.get().strip() or 0)
+                    if value < 0:
+                        raise ValueError(f"{key.replace('_', ' ').title()} cannot be negative")
+                    rebalance_options[key] = value
+            except ValueError as e:
+                messagebox.showerror("Input Error", f"Invalid rebalance setting: {str(e)}")
+                return None
+            rebalance_options["fractional"] = self.fractional_var.get()
+            rebalance_options["allow_sells"] = self.allow_sells_var.get()
+        
+        try:
+            scenarios = int(self.scenarios_entry.get().strip() or 0)
+            volatility = float(self.volatility_entry.get().strip() or 0) / 100
+            correlation = float(self.correlation_entry.get().strip() or 0)
+            horizon = float(self.horizon_entry.get().strip() or 0)
+            if scenarios < 0:
+                raise ValueError("Scenarios cannot be negative")
+            if scenarios and (volatility < 0 or horizon <= 0):
+                raise ValueError("Volatility cannot be negative and horizon must be positive")
+            if scenarios and not -1 <= correlation <= 1:
+                raise ValueError("Correlation must be between -1 and 1")
+        except ValueError as e:
+            messagebox.showerror("Input Error", f"Invalid scenario setting: {str(e)}")
+            return None
+        
         allocation_type = self.allocation_type_var.get()
         if allocation_type not in ["$", "%"]:
             messagebox.showerror("Input Error", "Invalid allocation type selected.")
@@ -209,6 +340,7 @@ class ETFOptimizerApp:
         etfs = []
         targets = []
         prices = []
+        holdings = []
         
         for i in range(10):
             symbol = self.symbol_entries[i].get().strip()
@@ -237,9 +369,15 @@ class ETFOptimizerApp:
                 if price <= 0:
                     raise ValueError(f"Price for {symbol} must be positive")
                 
+                held_str = self.held_entries[i].get().strip()
+                held = float(held_str) if held_str else 0.0
+                if held < 0:
+                    raise ValueError(f"Held shares for {symbol} cannot be negative")
+                
                 etfs.append(symbol)
                 targets.append(target)
                 prices.append(price)
+                holdings.append(held)
                 
             except ValueError as e:
                 messagebox.showerror("Input Error", f"Invalid value for ETF #{i+1} ({symbol}): {str(e)}")
@@ -249,12 +387,15 @@ class ETFOptimizerApp:
             messagebox.showerror("Input Error", "At least one ETF must be defined")
             return None
         
-        # Validate total allocations
+        # Validate total allocations (when rebalancing, the targets cover cash plus held shares)
         if allocation_type == "$":
             total_targets = sum(targets)
-            if not np.isclose(total_targets, budget, atol=0.01):
+            total_value = budget
+            if rebalance:
+                total_value += sum(h * p for h, p in zip(holdings, prices))
+            if not np.isclose(total_targets, total_value, atol=0.01):
                 messagebox.showerror("Input Error", 
-                    f"Sum of target allocations (${total_targets:.2f}) does not match total budget (${budget:.2f}).")
+                    f"Sum of target allocations (${total_targets:.2f}) does not match total budget (${total_value:.2f}).")
                 return None
         else:
             total_percent = sum(targets)
@@ -262,7 +403,19 @@ class ETFOptimizerApp:
                 messagebox.showerror("Input Error", 
                     f"Sum of target percentages ({total_percent:.2f}%) does not equal 100%.")
                 return None
-        
+
+        # Scenario covariance: the loaded file, or one volatility/correlation for every ETF
+        covariance = None
+        if scenarios:
+            try:
+                if self.covariance_path:
+                    covariance = load_covariance_csv(self.covariance_path, etfs)
+                else:
+                    covariance = covariance_matrix(len(etfs), volatility, correlation)
+            except (OSError, ValueError) as e:
+                messagebox.showerror("Input Error", f"Invalid covariance: {str(e)}")
+                return None
+
         # Get secondary objective
         secondary_obj = self.secondary_obj_var.get()
         if secondary_obj == "Minimize Total Deviation":
@@ -270,156 +423,44 @@ class ETFOptimizerApp:
         else:
             secondary_choice = 'max'
         
+        solver_choice = 'exact' if self.solver_var.get().startswith("Branch") else 'greedy'
+        
         return {
             "budget": budget,
             "etfs": etfs,
             "targets": targets,
             "prices": prices,
             "allocation_type": allocation_type,
-            "secondary_objective": secondary_choice
+            "secondary_objective": secondary_choice,
+            "solver": solver_choice,
+            "mode": 'rebalance' if rebalance else 'new',
+            "holdings": holdings,
+            "rebalance_options": rebalance_options,
+            "scenarios": scenarios,
+            "horizon": horizon,
+            "covariance": covariance
         }
     
     def optimize_allocation(self, data):
-        self.status_var.set("Optimizing allocation...")
-        self.root.update_idletasks()
-        
-        etfs = data["etfs"]
-        targets = data["targets"].copy()
-        prices = data["prices"]
-        total_budget = data["budget"]
-        allocation_type = data["allocation_type"]
-        secondary_obj = data["secondary_objective"]
-        
-        if allocation_type == "%":
-            # Convert percentages to dollar amounts
-            targets = [t * total_budget / 100 for t in targets]
-        
-        if self.stop_flag.is_set():
-            return "Optimization stopped by user."
-        
-        def calculate_allocation_metrics(shares):
-            actual_investments = [shares[i] * prices[i] for i in range(len(etfs))]
-            total_invested = sum(actual_investments)
-            remainder = total_budget - total_invested
-            
-            if total_invested == 0:
-                return {
-                    "actual_investments": actual_investments,
-                    "total_invested": 0,
-                    "remainder": remainder,
-                    "actual_percentages": [0]*len(etfs),
-                    "percentage_deviations": [100]*len(etfs),
-                    "total_deviation": 100*len(etfs),
-                    "max_deviation": 100
-                }
-            
-            if allocation_type == "$":
-                target_percentages = [t/total_budget*100 for t in targets]
-            else:
-                target_percentages = data["targets"]
-            
-            actual_percentages = [a/total_invested*100 for a in actual_investments]
-            percentage_deviations = [abs(actual_percentages[i] - target_percentages[i]) for i in range(len(etfs))]
-            total_deviation = sum(percentage_deviations)
-            max_deviation = max(percentage_deviations)
-            
-            return {
-                "actual_investments": actual_investments,
-                "total_invested": total_invested,
-                "remainder": remainder,
-                "actual_percentages": actual_percentages,
-                "percentage_deviations": percentage_deviations,
-                "total_deviation": total_deviation,
-                "max_deviation": max_deviation
-            }
-        
-        # Initial allocation
-        initial_shares = []
-        for t, p in zip(targets, prices):
-            calculated_shares = max(int(t / p), 1)
-            initial_shares.append(calculated_shares)
-        
-        current_metrics = calculate_allocation_metrics(initial_shares)
-        current_shares = initial_shares.copy()
-        
-        iteration = 0
-        max_iterations = 1000
-        
-        while iteration < max_iterations:
-            iteration += 1
-            
-            if self.stop_flag.is_set():
-                return "Optimization stopped by user."
-            
-            if iteration % 10 == 0:
-                self.status_var.set(f"Optimizing... Iteration {iteration}")
-                self.root.update_idletasks()
-                time.sleep(0.01)
-            
-            best_metric = float('inf')
-            best_idx = -1
-            best_metrics = None
-            
-            for i in range(len(etfs)):
-                test_shares = current_shares.copy()
-                test_shares[i] += 1
-                test_metrics = calculate_allocation_metrics(test_shares)
-                
-                if test_metrics['remainder'] < 0:
-                    continue
-                
-                if secondary_obj == 'total':
-                    current_metric = test_metrics['total_deviation']
-                else:
-                    current_metric = test_metrics['max_deviation']
-                
-                if current_metric < best_metric:
-                    best_metric = current_metric
-                    best_idx = i
-                    best_metrics = test_metrics
-                elif current_metric == best_metric:
-                    if secondary_obj == 'total':
-                        tie_metric = test_metrics['max_deviation']
-                        current_tie = best_metrics['max_deviation']
-                    else:
-                        tie_metric = test_metrics['total_deviation']
-                        current_tie = best_metrics['total_deviation']
-                    
-                    if tie_metric < current_tie:
-                        best_metric = current_metric
-                        best_idx = i
-                        best_metrics = test_metrics
-            
-            if best_idx == -1:
-                break
-            
-            current_shares[best_idx] += 1
-            current_metrics = best_metrics
+        """Run the allocation engine on the validated inputs and return the text report."""
+        def report_progress(message):
+            self.root.after(0, self.status_var.set, message)
         
-        # Generate results
-        if allocation_type == "$":
-            target_percentages = [t/total_budget*100 for t in targets]
-        else:
-            target_percentages = data["targets"]
-        
-        result = f"Optimization Results (Budget: ${total_budget:.2f})\n"
-        result += f"Allocation Type: {allocation_type}\n"
-        result += f"Secondary Objective: {data['secondary_objective']}\n"
-        result += f"\n{'ETF':<6} {'Target':<10} {'Price($)':<10} {'Shares':<8} {'Actual($)':<12} {'Target%':<10} {'Actual%':<10}\n"
-        result += "-"*85 + "\n"
-        
-        for i in range(len(etfs)):
-            result += (f"{etfs[i]:<6} {targets[i]:<10.2f} ${prices[i]:<9.2f} {current_shares[i]:<8} "
-                      f"${current_metrics['actual_investments'][i]:<11.2f} {target_percentages[i]:<9.2f}% "
-                      f"{current_metrics['actual_percentages'][i]:<9.2f}%\n")
-        
-        result += "-"*85 + "\n"
-        result += f"Total Invested: ${current_metrics['total_invested']:.2f}\n"
-        result += f"Remainder: ${current_metrics['remainder']:.2f}\n"
-        result += f"Total Deviation: {current_metrics['total_deviation']:.2f}%\n"
-        result += f"Max Deviation: {current_metrics['max_deviation']:.2f}%\n"
-        
-        return result
+        result = optimize(data, should_stop=self.stop_flag.is_set, progress=report_progress)
+        return format_report(result)
+    
+    def load_covariance(self):
+        """Pick a covariance CSV for the scenarios (cancel clears it and falls back to vol/correlation)."""
+        path = filedialog.askopenfilename(title="Select Covariance CSV",
+                                          filetypes=[("CSV files", "*.csv"), ("All files", "*.*")])
+        self.covariance_path = path or None
+        self.covariance_label.config(text=path.replace("\\", "/").split("/")[-1] if path else "")
+    
+    def reset_scenario_entries(self):
+        for entry, value in ((self.scenarios_entry, "0"), (self.volatility_entry, "20"),
+                             (self.correlation_entry, "0.5"), (self.horizon_entry, "1")):
+            entry.delete(0, tk.END)
+            entry.insert(0, value)
     
     def start_simulation(self):
         data = self.validate_inputs()
@@ -444,10 +485,170 @@ class ETFOptimizerApp:
         except Exception as e:
             self.root.after(0, self.update_results, f"Error: {str(e)}")
     
+    def start_batch(self):
+        """Rebalance every account in a CSV file across a process pool."""
+        csv_path = filedialog.askopenfilename(title="Select Accounts CSV",
+                                              filetypes=[("CSV files", "*.csv"), ("All files", "*.*")])
+        if not csv_path:
+            return
+        
+        objective = 'total' if self.secondary_obj_var.get() == "Minimize Total Deviation" else 'max'
+        solver = 'exact' if self.solver_var.get().startswith("Branch") else 'greedy'
+        
+        self.stop_flag.clear()
+        self.results_text.delete(1.0, tk.END)
+        self.results_text.insert(tk.END, "Batch rebalancing in progress...\n")
+        self.run_button.config(state=tk.DISABLED)
+        self.batch_button.config(state=tk.DISABLED)
+        self.sweep_button.config(state=tk.DISABLED)
+        self.stop_button.config(state=tk.NORMAL)
+        self.status_var.set("Reading accounts...")
+        
+        self.calculation_thread = threading.Thread(target=self.run_batch_rebalance,
+                                                   args=(csv_path, objective, solver))
+        self.calculation_thread.daemon = True
+        self.calculation_thread.start()
+    
+    def run_batch_rebalance(self, csv_path, objective, solver):
+        def report_progress(done, total):
+            self.root.after(0, self.status_var.set, f"Rebalancing... {done}/{total} accounts")
+        
+        try:
+            results, trades_path, report_path = batch_rebalance.run_batch(
+                csv_path, objective=objective, solver=solver,
+                progress=report_progress, should_stop=self.stop_flag.is_set)
+            
+            result = f"Batch Rebalance Results ({len(results)} accounts)\n"
+            result += f"Secondary Objective: {objective}\nSolver: {solver}\n"
+            if self.stop_flag.is_set():
+                result += "Stopped by user - remaining accounts were not processed.\n"
+            result += f"\n{'Account':<14} {'Value($)':<14} {'Leftover($)':<12} {'Total Dev':<10} {'Max Dev':<10} {'Trades':<6}\n"
+            result += "-"*85 + "\n"
+            for r in results:
+                if r["error"]:
+                    result += f"{r['account']:<14} Error: {r['error']}\n"
+                    continue
+                trades = sum(1 for s, h in zip(r["shares"], r["holdings"]) if s != h)
+                m = r["metrics"]
+                result += (f"{r['account']:<14} {r['total_value']:<14.2f} {m['remainder']:<12.2f} "
+                           f"{m['total_deviation']:<9.2f}% {m['max_deviation']:<9.2f}% {trades:<6}\n")
+            result += "-"*85 + "\n"
+            result += f"Trade list: {trades_path}\n"
+            result += f"Deviation report: {report_path}\n"
+            self.root.after(0, self.update_results, result)
+        except Exception as e:
+            self.root.after(0, self.update_results, f"Error: {str(e)}")
+    
+    def start_sweep(self):
+        """Solve a grid of budgets for both objectives and show the leftover/deviation frontier."""
+        data = self.validate_inputs()
+        if not data:
+            return
+        try:
+            budgets = budget_grid(float(self.sweep_from_entry.get()), float(self.sweep_to_entry.get()),
+                                  float(self.sweep_step_entry.get()))
+        except ValueError as e:
+            messagebox.showerror("Input Error", f"Invalid sweep range: {str(e)}")
+            return
+        if len(budgets) > 2000:
+            messagebox.showerror("Input Error", f"Sweep has {len(budgets)} budgets - use a larger step (max 2000).")
+            return
+        
+        self.stop_flag.clear()
+        self.results_text.delete(1.0, tk.END)
+        self.results_text.insert(tk.END, "Frontier sweep in progress...\n")
+        self.run_button.config(state=tk.DISABLED)
+        self.batch_button.config(state=tk.DISABLED)
+        self.sweep_button.config(state=tk.DISABLED)
+        self.stop_button.config(state=tk.NORMAL)
+        self.status_var.set("Sweeping budgets...")
+        
+        self.calculation_thread = threading.Thread(target=self.run_sweep, args=(data, budgets))
+        self.calculation_thread.daemon = True
+        self.calculation_thread.start()
+    
+    def run_sweep(self, data, budgets):
+        def report_progress(done, total):
+            self.root.after(0, self.status_var.set, f"Sweeping... {done}/{total} solves")
+        
+        try:
+            # Target weights are fixed by the entered budget, then held across the grid
+            target_pcts = target_percentages(data["targets"], data["budget"], data["allocation_type"])
+            points = sweep_frontier(target_pcts, data["prices"], budgets, solver=data.get("solver", 'greedy'),
+                                    should_stop=self.stop_flag.is_set, progress=report_progress)
+            if points is None:
+                self.root.after(0, self.update_results, "Frontier sweep stopped by user.")
+                return
+            
+            result = f"Frontier Sweep ({len(budgets)} budgets, ${budgets[0]:.2f} - ${budgets[-1]:.2f})\n"
+            result += f"Solver: {data.get('solver', 'greedy')}\n"
+            result += "* = on the leftover cash / deviation frontier for that objective\n"
+            result += f"\n{'Budget($)':<12} {'Objective':<10} {'Invested($)':<12} {'Leftover($)':<12} {'Total Dev':<10} {'Max Dev':<10} {'Shares'}\n"
+            result += "-"*85 + "\n"
+            for p in points:
+                mark = "*" if p["on_frontier"] else " "
+                result += (f"{p['budget']:<12.2f} {p['objective']:<10} {p['total_invested']:<12.2f} "
+                           f"{p['leftover']:<11.2f}{mark} {p['total_deviation']:<9.2f}% {p['max_deviation']:<9.2f}% "
+                           f"{' '.join(str(s) for s in p['shares'])}\n")
+            result += "-"*85 + "\n"
+            self.root.after(0, self.update_results, result)
+            self.root.after(0, self.show_frontier_plot, points)
+        except Exception as e:
+            self.root.after(0, self.update_results, f"Error: {str(e)}")
+    
+    def show_frontier_plot(self, points):
+        """Scatter of leftover cash vs deviation per objective in its own window."""
+        window = tk.Toplevel(self.root)
+        window.title("Leftover Cash vs Deviation")
+        width, height, pad = 700, 450, 60
+        canvas = tk.Canvas(window, width=width, height=height, bg="white")
+        canvas.pack(fill=tk.BOTH, expand=True)
+        
+        series = [("total", "total_deviation", "blue", "Total deviation (total objective)"),
+                  ("max", "max_deviation", "red", "Max deviation (max objective)")]
+        xs = [p["leftover"] for p in points]
+        ys = [p[key] for objective, key, _, _ in series for p in points if p["objective"] == objective]
+        x_lo, x_hi = min(xs), max(xs)
+        y_lo, y_hi = 0.0, max(ys + [1e-9])
+        x_span = (x_hi - x_lo) or 1.0
+        
+        def to_canvas(x, y):
+            return (pad + (x - x_lo) / x_span * (width - 2 * pad),
+                    height - pad - (y - y_lo) / (y_hi - y_lo) * (height - 2 * pad))
+        
+        canvas.create_line(pad, height - pad, width - pad, height - pad)
+        canvas.create_line(pad, pad, pad, height - pad)
+        canvas.create_text(width / 2, height - 20, text="Leftover cash ($)")
+        canvas.create_text(20, height / 2, text="Deviation (%)", angle=90)
+        for frac in (0.0, 0.5, 1.0):
+            x, _ = to_canvas(x_lo + frac * x_span, 0)
+            canvas.create_text(x, height - pad + 12, text=f"{x_lo + frac * x_span:.0f}")
+            _, y = to_canvas(x_lo, y_lo + frac * (y_hi - y_lo))
+            canvas.create_text(pad - 20, y, text=f"{y_lo + frac * (y_hi - y_lo):.1f}")
+        
+        for row, (objective, key, color, label) in enumerate(series):
+            group = [p for p in points if p["objective"] == objective]
+            for p in group:
+                x, y = to_canvas(p["leftover"], p[key])
+                r = 4 if p["on_frontier"] else 2
+                canvas.create_oval(x - r, y - r, x + r, y + r, fill=color if p["on_frontier"] else "", outline=color)
+            frontier = sorted((p for p in group if p["on_frontier"]), key=lambda p: p["leftover"])
+            if len(frontier) > 1:
+                canvas.create_line(*[c for p in frontier for c in to_canvas(p["leftover"], p[key])], fill=color)
+            canvas.create_text(width - pad, pad - 30 + row * 15, text=label, fill=color, anchor="e")
+    
+    def reset_sweep_entries(self):
+        for entry, value in ((self.sweep_from_entry, "5000"), (self.sweep_to_entry, "12000"),
+                             (self.sweep_step_entry, "250")):
+            entry.delete(0, tk.END)
+            entry.insert(0, value)
+    
     def update_results(self, result):
         self.results_text.delete(1.0, tk.END)
         self.results_text.insert(tk.END, result)
         self.run_button.config(state=tk.NORMAL)
+        self.batch_button.config(state=tk.NORMAL)
+        self.sweep_button.config(state=tk.NORMAL)
         self.stop_button.config(state=tk.DISABLED)
         self.status_var.set("Optimization complete")
     
@@ -460,12 +661,19 @@ class ETFOptimizerApp:
         self.budget_entry.delete(0, tk.END)
         self.budget_entry.insert(0, "8000")
         self.secondary_obj.set("Minimize Total Deviation")
+        self.solver.set("Greedy Search")
+        self.mode.set("New Cash")
         self.allocation_type.set("$")
+        self.reset_scenario_entries()
+        self.reset_sweep_entries()
+        self.covariance_path = None
+        self.covariance_label.config(text="")
         
         for i in range(10):
             self.symbol_entries[i].delete(0, tk.END)
             self.target_entries[i].delete(0, tk.END)
             self.price_entries[i].delete(0, tk.END)
+            self.held_entries[i].delete(0, tk.END)
         
         self.results_text.delete(1.0, tk.END)
         self.status_var.set("Entries cleared")
@@ -481,6 +689,7 @@ class ETFOptimizerApp:
             self.symbol_entries[i].delete(0, tk.END)
             self.target_entries[i].delete(0, tk.END)
             self.price_entries[i].delete(0, tk.END)
+            self.held_entries[i].delete(0, tk.END)
         
         for i, (symbol, target, price) in enumerate(self.default_entries):
             self.symbol_entries[i].insert(0, symbol)
@@ -509,6 +718,7 @@ class ETFOptimizerApp:
             self.root.destroy()
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # Needed for the batch process pool in the PyInstaller build
     try:
         root = tk.Tk()
         app = ETFOptimizerApp(root)
@@ -0,0 +1,1003 @@
+import argparse
+import csv
+import json
+import math
+import sys
+import time
+
+import numpy as np
+
+# Allocation routines used by the ETF Allocation Optimizer (V3.py / CalculateOptimalAllocation.py)
+# Kept free of any tkinter code so the solvers can be reused outside the GUI
+# Usage: python allocation_engine.py request.json [-o result.json] [--report]
+#   {"budget": 8000, "etfs": ["VGT", "SCHD"], "targets": [50, 50], "prices": [625, 28],
+#    "allocation_type": "%", "secondary_objective": "total", "solver": "greedy"}
+
+# Seconds an exact solve may take in batches and sweeps before its best allocation so far is used
+EXACT_TIME_LIMIT = 10.0
+
+
+def target_percentages(targets, budget, allocation_type):
+    """Convert the entered targets into target percentages of the portfolio."""
+    if allocation_type == "%":
+        return list(targets)
+    return [t / budget * 100 for t in targets]
+
+
+def target_dollars(targets, budget, allocation_type):
+    """Convert the entered targets into target dollar amounts."""
+    if allocation_type == "%":
+        return [t * budget / 100 for t in targets]
+    return list(targets)
+
+
+def initial_allocation(dollar_targets, prices):
+    """Floor allocation from fresh cash (at least one share of every ETF)."""
+    return [max(int(t / p), 1) for t, p in zip(dollar_targets, prices)]
+
+
+def allocation_metrics(shares, prices, target_pcts, budget):
+    """Compute invested amounts, percentages and deviations for a share allocation."""
+    n = len(prices)
+    actual_investments = [shares[i] * prices[i] for i in range(n)]
+    total_invested = sum(actual_investments)
+    remainder = budget - total_invested
+
+    if total_invested == 0:
+        return {
+            "actual_investments": actual_investments,
+            "total_invested": 0,
+            "remainder": remainder,
+            "actual_percentages": [0]*n,
+            "percentage_deviations": [100]*n,
+            "total_deviation": 100*n,
+            "max_deviation": 100
+        }
+
+    actual_percentages = [a/total_invested*100 for a in actual_investments]
+    percentage_deviations = [abs(actual_percentages[i] - target_pcts[i]) for i in range(n)]
+
+    return {
+        "actual_investments": actual_investments,
+        "total_invested": total_invested,
+        "remainder": remainder,
+        "actual_percentages": actual_percentages,
+        "percentage_deviations": percentage_deviations,
+        "total_deviation": sum(percentage_deviations),
+        "max_deviation": max(percentage_deviations)
+    }
+
+
+def objective_key(total_deviation, max_deviation, objective):
+    """Ranking key: the secondary objective first, the other deviation breaks ties."""
+    if objective == 'total':
+        return (total_deviation, max_deviation)
+    return (max_deviation, total_deviation)
+
+
+def is_better(key, best_key, tol=1e-9):
+    """Lexicographic comparison of two objective keys with a small float tolerance."""
+    if best_key is None:
+        return True
+    if key[0] < best_key[0] - tol:
+        return True
+    return abs(key[0] - best_key[0]) <= tol and key[1] < best_key[1] - tol
+
+
+class IncrementalEvaluator:
+    """
+    Running-total view of an allocation used to score "buy one more share" moves.
+
+    Holding j is above its target while the invested total T <= 100*v_j/w_j, so sorting
+    those breakpoints lets the total deviation at any new total be read from prefix sums.
+    Applying a move only updates the changed ETF and the shared invested total.
+    """
+
+    def __init__(self, shares, prices, target_pcts):
+        self.prices = np.asarray(prices, dtype=float)
+        self.weights = np.asarray(target_pcts, dtype=float)
+        self.shares = np.array(shares)
+        self.values = self.shares * self.prices
+        self.total = float(self.values.sum())
+        self._value_sum = self.total
+        self._weight_sum = float(self.weights.sum())
+
+        breakpoints = self._breakpoint(self.values, self.weights)
+        self._order = np.argsort(breakpoints, kind="stable")
+        self._breakpoints = breakpoints[self._order]
+        self._refresh_prefix_sums()
+
+    @staticmethod
+    def _breakpoint(values, weights):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(weights > 0, 100 * values / np.where(weights > 0, weights, 1), np.inf)
+
+    def _refresh_prefix_sums(self):
+        self._cum_values = np.concatenate(([0.0], np.cumsum(self.values[self._order])))
+        self._cum_weights = np.concatenate(([0.0], np.cumsum(self.weights[self._order])))
+
+    def total_deviation_at(self, totals):
+        """Sum of |actual% - target%| over all ETFs for each invested total in totals."""
+        totals = np.asarray(totals, dtype=float)
+        below = np.searchsorted(self._breakpoints, totals, side="left")
+        values_below = self._cum_values[below]
+        weights_below = self._cum_weights[below]
+        values_above = self._value_sum - values_below
+        weights_above = self._weight_sum - weights_below
+        return 100 * (values_above - values_below) / totals + (weights_below - weights_above)
+
+    def candidate_scores(self):
+        """Total and max deviation after buying one more share of each ETF, plus the new totals."""
+        n = len(self.prices)
+        new_totals = self.total + self.prices
+        inv = 1.0 / new_totals
+        old_own = np.abs(100 * self.values * inv - self.weights)
+        new_own = np.abs(100 * (self.values + self.prices) * inv - self.weights)
+        total_devs = self.total_deviation_at(new_totals) - old_own + new_own
+
+        # Max deviation: drop every row's own holding, then add back its post-move value
+        at_lo = np.abs(100 * self.values * inv.min() - self.weights)
+        at_hi = np.abs(100 * self.values * inv.max() - self.weights)
+        ceiling = np.maximum(at_lo, at_hi)
+        refs = np.unique([int(np.argmax(at_lo)), int(np.argmax(at_hi))])
+        ref_rows = np.zeros(n, dtype=bool)
+        ref_rows[refs] = True
+        if (~ref_rows).any():
+            ref_devs = np.abs(100 * np.outer(inv[~ref_rows], self.values[refs]) - self.weights[refs])
+            floor = ref_devs.max(axis=1).min()
+            cols = np.flatnonzero(ceiling >= floor - 1e-9)
+        else:
+            cols = np.arange(n)
+
+        others = np.zeros(n)
+        if len(cols):
+            devs = np.abs(100 * np.outer(inv, self.values[cols]) - self.weights[cols])
+            devs[cols, np.arange(len(cols))] = 0.0
+            others = devs.max(axis=1)
+        # Reference rows lost a reference holding, so rescan them against every holding
+        for i in refs:
+            devs = np.abs(100 * self.values * inv[i] - self.weights)
+            devs[i] = 0.0
+            others[i] = devs.max()
+        max_devs = np.maximum(others, new_own)
+        return total_devs, max_devs, new_totals
+
+    def current_scores(self):
+        """Total and max deviation of the allocation as it stands."""
+        devs = np.abs(100 * self.values / self.total - self.weights)
+        return float(devs.sum()), float(devs.max())
+
+    def best_move(self, budget, objective, tol=1e-9, allowed=None, improve_only=False):
+        """
+        Index of the best single-share purchase that fits the budget, or None.
+
+        allowed optionally masks which ETFs may be bought; with improve_only the move must
+        also beat the current allocation.
+        """
+        total_devs, max_devs, new_totals = self.candidate_scores()
+        feasible = budget - new_totals >= -tol
+        if allowed is not None:
+            feasible &= np.asarray(allowed, dtype=bool)
+        if not feasible.any():
+            return None
+        if objective == 'total':
+            primary, secondary = total_devs, max_devs
+        else:
+            primary, secondary = max_devs, total_devs
+        primary = np.where(feasible, primary, np.inf)
+        tied = primary <= primary.min() + tol
+        best_idx = int(np.argmin(np.where(tied, secondary, np.inf)))
+        if improve_only:
+            key = objective_key(total_devs[best_idx], max_devs[best_idx], objective)
+            if not is_better(key, objective_key(*self.current_scores(), objective), tol):
+                return None
+        return best_idx
+
+    def apply(self, i):
+        """Buy one share of ETF i, updating only its breakpoint and the shared totals."""
+        self.shares[i] += 1
+        self.values[i] += self.prices[i]
+        self.total += float(self.prices[i])
+        self._value_sum += float(self.prices[i])
+
+        pos = int(np.flatnonzero(self._order == i)[0])
+        order = np.delete(self._order, pos)
+        breakpoints = np.delete(self._breakpoints, pos)
+        new_bp = self._breakpoint(self.values[i:i+1], self.weights[i:i+1])[0]
+        insert_at = int(np.searchsorted(breakpoints, new_bp, side="left"))
+        self._order = np.insert(order, insert_at, i)
+        self._breakpoints = np.insert(breakpoints, insert_at, new_bp)
+        self._refresh_prefix_sums()
+
+
+def solve_greedy(target_pcts, prices, budget, objective, start_shares, should_stop=None,
+                 progress=None, max_iterations=None):
+    """
+    Hill climb that repeatedly buys the single share that best improves the objective.
+
+    Returns the final share list, or None if should_stop() became true. progress(iteration)
+    is called every 10 iterations.
+    """
+    evaluator = IncrementalEvaluator(start_shares, prices, target_pcts)
+    iteration = 0
+    while max_iterations is None or iteration < max_iterations:
+        iteration += 1
+
+        if should_stop and should_stop():
+            return None
+
+        if progress and iteration % 10 == 0:
+            progress(iteration)
+
+        best_idx = evaluator.best_move(budget, objective)
+        if best_idx is None:
+            break
+        evaluator.apply(best_idx)
+
+    return evaluator.shares.tolist()
+
+
+def solve_exact(target_pcts, prices, budget, objective, should_stop=None, incumbent=None,
+                time_limit=None):
+    """
+    Branch-and-bound search over every whole-share allocation whose cost fits the budget.
+
+    The result minimizes the secondary objective (the other deviation breaking ties) over
+    all of them, so it is never worse than the greedy answer. incumbent (the greedy result
+    when not given) bounds the deviation D a better answer can have: each ETF may then only
+    be off its target by D, which confines the final total to a narrow range as soon as one
+    count is fixed and every other count to a small window inside it.
+    Returns the best share list, or None if should_stop() became true. After time_limit
+    seconds the search ends early and returns the best allocation found so far (at worst
+    the incumbent).
+    """
+    n = len(prices)
+    tol = 1e-9
+    # Expensive ETFs first: they have the fewest choices and pin the total down the most
+    order = sorted(range(n), key=lambda i: prices[i], reverse=True)
+    shares = [0] * n
+    deadline = None if time_limit is None else time.monotonic() + time_limit
+
+    def keys_for(counts):
+        total = sum(counts[i] * prices[i] for i in range(n))
+        if total <= 0:
+            return (math.inf, math.inf)
+        devs = [abs(counts[i] * prices[i] / total * 100 - target_pcts[i]) for i in range(n)]
+        return objective_key(sum(devs), max(devs), objective)
+
+    if incumbent is None or sum(incumbent[i] * prices[i] for i in range(n)) > budget + tol:
+        start = [int(t * budget / 100 / p) if t > 0 else 0 for t, p in zip(target_pcts, prices)]
+        incumbent = solve_greedy(target_pcts, prices, budget, objective, start, should_stop=should_stop)
+        if incumbent is None:
+            return None
+    best = {"shares": list(incumbent), "key": keys_for(incumbent),
+            "spent": sum(incumbent[i] * prices[i] for i in range(n)), "cap": math.inf, "nodes": 0,
+            "stopped": False, "expired": False}
+
+    def lower_bound(depth, t_lo, t_hi, kind):
+        # In x = 100 / final total, with the total somewhere in [t_lo, t_hi], each assigned
+        # ETF deviates by |value * x - target| and the unassigned ones together by at least
+        # |assigned value * x - assigned target| (their shares sum to the rest)
+        if t_lo <= 0:
+            return 0.0
+        terms = [(shares[i] * prices[i], target_pcts[i]) for i in order[:depth]]
+        rest = (sum(v for v, _ in terms), sum(w for _, w in terms))
+        x_lo, x_hi = 100 / t_hi, 100 / t_lo
+
+        if kind == 'max':
+            # Spread evenly is the best the unassigned ETFs can do
+            terms.append((rest[0] / (n - depth), rest[1] / (n - depth)))
+        else:
+            terms.append(rest)
+
+        def score(x):
+            devs = [abs(v * x - w) for v, w in terms]
+            return sum(devs) if kind == 'total' else max(devs)
+
+        # Both objectives are convex and piecewise linear in x, so the minimum is at an end of
+        # the interval, a root of one term or (for the max) where two terms cross
+        candidates = [x_lo, x_hi] + [w / v for v, w in terms if v > 0]
+        if kind == 'max':
+            for j, (v1, w1) in enumerate(terms):
+                for v2, w2 in terms[j + 1:]:
+                    if v1 != v2:
+                        candidates.append((w1 - w2) / (v1 - v2))
+                    candidates.append((w1 + w2) / (v1 + v2) if v1 + v2 > 0 else x_lo)
+        return min(score(x) for x in candidates if x_lo <= x <= x_hi)
+
+    def interrupted():
+        best["nodes"] += 1
+        if best["nodes"] % 1000 == 0:
+            if should_stop and should_stop():
+                best["stopped"] = True
+            elif deadline is not None and time.monotonic() > deadline:
+                best["expired"] = True
+        return best["stopped"] or best["expired"]
+
+    def narrow(depth, spent, t_lo, t_hi, limit):
+        # Each ETF still to come needs a whole number of shares within D of its target somewhere
+        # in t_lo..t_hi; those counts narrow the range (None when some ETF has no count left)
+        for _ in range(2):
+            low_total = high_total = spent
+            for j in order[depth:]:
+                price, target = prices[j], target_pcts[j]
+                if target <= 0:
+                    continue
+                low = math.ceil(max(0.0, target - limit) * t_lo / 100 / price - tol)
+                high = math.floor((target + limit) * t_hi / 100 / price + tol)
+                if low > high:
+                    return None
+                t_lo = max(t_lo, 100 * low * price / (target + limit))
+                if target > limit:
+                    t_hi = min(t_hi, 100 * high * price / (target - limit))
+                low_total += low * price
+                high_total += high * price
+            t_lo, t_hi = max(t_lo, low_total), min(t_hi, high_total)
+            if t_lo > t_hi + tol or t_hi <= 0:
+                return None
+        return min(t_lo, t_hi), t_hi
+
+    def search(depth, spent, t_lo, t_hi):
+        # t_lo..t_hi: the final totals at which every assigned ETF is within D of its target
+        if interrupted():
+            return
+        if depth == n:
+            # Equally good allocations: the one investing more of the budget wins
+            key = keys_for(shares)
+            if is_better(key, best["key"]) or (not is_better(best["key"], key) and spent > best["spent"] + tol):
+                best.update(key=key, shares=shares.copy(), spent=spent)
+            return
+        limit = min(best["key"][0], best["cap"]) + tol
+        if depth:
+            bound = lower_bound(depth, t_lo, t_hi, objective)
+            if bound > limit:
+                return
+            # Only a tie can be reached: the other deviation must then beat the best one's
+            other = 'max' if objective == 'total' else 'total'
+            if bound >= best["key"][0] - tol and lower_bound(depth, t_lo, t_hi, other) > best["key"][1] + tol:
+                return
+
+        i = order[depth]
+        price, target = prices[i], target_pcts[i]
+        low = math.ceil(max(0.0, target - limit) * t_lo / 100 / price - tol)
+        high = math.floor(min((target + limit) * t_hi / 100, t_hi - spent) / price + tol) if target > 0 else 0
+        # Try the counts closest to the ETF's ideal share of the middle of the range first
+        ideal = target * (t_lo + t_hi) / 200 / price if t_lo > 0 else target * t_hi / 100 / price
+        for count in sorted(range(low, high + 1), key=lambda c: abs(c - ideal)):
+            value = count * price
+            limit = min(best["key"][0], best["cap"]) + tol
+            new_lo = max(t_lo, spent + value, 100 * value / (target + limit) if value else 0.0)
+            new_hi = min(t_hi, 100 * value / (target - limit)) if target > limit else t_hi
+            window = narrow(depth + 1, spent + value, new_lo, new_hi, limit)
+            if window is None:
+                continue
+            shares[i] = count
+            search(depth + 1, spent + value, *window)
+            if best["stopped"] or best["expired"]:
+                break
+        shares[i] = 0
+
+    if math.isinf(best["key"][0]):
+        return best["shares"]  # nothing is affordable
+
+    # Deviations within a small cap are searched first, which finds good allocations quickly;
+    # the cap doubles until a search finds one within it (then nothing better exists)
+    best["cap"] = best["key"][0] / 16
+    while True:
+        search(0, 0.0, 0.0, float(budget))
+        if best["stopped"] or best["expired"] or best["key"][0] <= best["cap"] + tol:
+            break
+        best["cap"] *= 2
+    if best["stopped"]:
+        return None
+    return best["shares"]
+
+
+def _water_fill(values, weights, cash):
+    """Dollar buys that lift the most underweight positions to a common level using cash."""
+    order = np.argsort(values / weights)
+    ratios = (values / weights)[order]
+    cum_values = np.cumsum(values[order])
+    cum_weights = np.cumsum(weights[order])
+    levels = (cash + cum_values) / cum_weights
+    # The level is valid once it no longer reaches the next position's ratio
+    next_ratios = np.append(ratios[1:], np.inf)
+    k = int(np.argmax(levels <= next_ratios))
+    return np.maximum(weights * levels[k] - values, 0.0)
+
+
+def rebalance_portfolio(holdings, prices, target_pcts, cash, objective='total', lot_sizes=None,
+                        fractional=False, fraction_step=0.0001, allow_sells=True, band=0.0,
+                        cost_per_trade=0.0, cost_bps=0.0, min_trade=0.0):
+    """
+    Buy/sell set that moves existing holdings toward the target weights with few, cheap trades.
+
+    Positions whose weight is within band percentage points of target are left alone, the
+    rest trade to the nearest whole lot of target. Trades smaller than min_trade or costing
+    more than the misallocation they remove are dropped, buys are cut back to what the cash
+    and sale proceeds can fund, and leftover cash tops up positions already being bought.
+    """
+    prices = np.asarray(prices, dtype=float)
+    weights = np.asarray(target_pcts, dtype=float)
+    held = np.asarray(holdings, dtype=float)
+    n = len(prices)
+    if fractional:
+        lots = np.full(n, float(fraction_step))
+    elif lot_sizes is not None:
+        lots = np.asarray(lot_sizes, dtype=float)
+    else:
+        lots = np.ones(n)
+    bps = cost_bps / 10000
+
+    values = held * prices
+    total_value = cash + values.sum()
+    if total_value <= 0:
+        raise ValueError("Portfolio has no cash or holdings")
+    target_values = weights * total_value / 100
+    lot_values = lots * prices
+
+    def trade_costs(trades):
+        return np.where(trades != 0, cost_per_trade + np.abs(trades) * prices * bps, 0.0)
+
+    def cash_after(trades):
+        return cash - (trades * prices).sum() - trade_costs(trades).sum()
+
+    # Positions inside the tolerance band are left alone
+    current_pcts = values / total_value * 100
+    tradable = np.abs(current_pcts - weights) > max(band, 1e-9)
+
+    trades = np.where(tradable, np.round((target_values - values) / lot_values), 0.0) * lots
+    # Sales are limited to whole lots of what is held, except a 0% target sells everything
+    trades = np.maximum(trades, -np.floor(held / lots + 1e-9) * lots)
+    trades = np.where(tradable & (weights == 0), -held, trades)
+    if not allow_sells:
+        trades = np.maximum(trades, 0.0)
+
+    # Drop trades that are too small or cost more than the misallocation they fix
+    fixed = np.abs(target_values - values) - np.abs(target_values - values - trades * prices)
+    drop = (trades != 0) & ((np.abs(trades) * prices < min_trade) | (fixed <= trade_costs(trades)))
+    trades[drop] = 0.0
+
+    # Fund the buys: re-spread what the cash and sale proceeds allow, then trim by lots
+    if cash_after(trades) < -1e-9:
+        buys = trades > 0
+        sells = np.where(trades < 0, trades, 0.0)
+        spendable = cash_after(sells) - cost_per_trade * buys.sum()
+        dollars = _water_fill(values[buys], np.maximum(weights[buys], 1e-12), max(spendable, 0.0) / (1 + bps))
+        funded = np.floor(dollars / lot_values[buys] + 1e-9) * lots[buys]
+        trades[buys] = np.minimum(trades[buys], funded)
+    while cash_after(trades) < -1e-9 and (trades > 0).any():
+        surplus = np.where(trades > 0, values + trades * prices - target_values, -np.inf)
+        i = int(np.argmax(surplus))
+        trades[i] = max(trades[i] - lots[i], 0.0)
+
+    # Leftover cash buys more lots of positions already being bought (no new trades)
+    buys = trades > 0
+    leftover = cash_after(trades)
+    if buys.any() and leftover > 0 and fractional:
+        # Fractional lots are tiny, so spread the cash directly instead of lot by lot
+        new_values = values + trades * prices
+        dollars = _water_fill(new_values[buys], np.maximum(weights[buys], 1e-12), leftover / (1 + bps))
+        trades[buys] += np.floor(dollars / lot_values[buys]) * lots[buys]
+    elif buys.any() and leftover > 0:
+        new_values = values + trades * prices
+        evaluator = IncrementalEvaluator(new_values / lot_values, lot_values, weights)
+        budget = evaluator.total + leftover / (1 + bps)
+        while True:
+            i = evaluator.best_move(budget, objective, allowed=buys, improve_only=True)
+            if i is None:
+                break
+            evaluator.apply(i)
+            trades[i] += lots[i]
+
+    if fractional:
+        trades = np.round(trades, 6)
+        shares = np.round(held + trades, 6)
+    else:
+        # Whole-share trades on top of the holdings as they are; selling off a fractional
+        # holding entirely also sells its fraction
+        sell_all = (trades < 0) & (trades == -held)
+        trades = np.where(sell_all, -held, np.round(trades))
+        shares = np.where(sell_all, 0.0, np.round(held + trades, 6))
+        if np.array_equal(held, np.round(held)):
+            trades, shares = trades.astype(int), shares.astype(int)
+
+    costs = trade_costs(trades)
+    cash_left = cash_after(trades)
+    invested = float((shares * prices).sum())
+    metrics = allocation_metrics(shares.tolist(), prices.tolist(), weights.tolist(), invested + cash_left)
+    return {
+        "shares": shares.tolist(),
+        "trades": trades.tolist(),
+        "costs": costs.tolist(),
+        "total_cost": float(costs.sum()),
+        "trade_count": int((trades != 0).sum()),
+        "cash_left": float(cash_left),
+        "total_value": float(total_value),
+        "metrics": metrics
+    }
+
+
+def covariance_matrix(n, volatility=0.2, correlation=0.0):
+    """Covariance of annual returns for n ETFs sharing one volatility and pairwise correlation."""
+    vols = np.broadcast_to(np.asarray(volatility, dtype=float), (n,))
+    corr = np.full((n, n), float(correlation))
+    np.fill_diagonal(corr, 1.0)
+    return corr * np.outer(vols, vols)
+
+
+def load_covariance_csv(path, symbols=None):
+    """
+    Read a square covariance matrix of annual returns from a CSV file.
+
+    An optional header row of symbols is used to reorder the matrix to match symbols.
+    """
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        rows = [row for row in csv.reader(f) if any(cell.strip() for cell in row)]
+    if not rows:
+        raise ValueError("Covariance file is empty")
+
+    header = None
+    try:
+        float(rows[0][-1])
+    except ValueError:
+        header = [cell.strip().upper() for cell in rows[0] if cell.strip()]
+        rows = rows[1:]
+    # A leading label column (symbol names down the side) is skipped as well
+    values = []
+    for row in rows:
+        cells = [cell.strip() for cell in row if cell.strip()]
+        if header and len(cells) == len(header) + 1:
+            cells = cells[1:]
+        values.append([float(cell) for cell in cells])
+    matrix = np.array(values, dtype=float)
+    if matrix.ndim != 2 or matrix.shape[0] != matrix.shape[1]:
+        raise ValueError("Covariance matrix must be square")
+    if not np.allclose(matrix, matrix.T, atol=1e-10):
+        raise ValueError("Covariance matrix must be symmetric")
+
+    if symbols is not None:
+        symbols = [s.upper() for s in symbols]
+        if header:
+            missing = [s for s in symbols if s not in header]
+            if missing:
+                raise ValueError(f"Covariance file has no entry for: {', '.join(missing)}")
+            order = [header.index(s) for s in symbols]
+            matrix = matrix[np.ix_(order, order)]
+        elif matrix.shape[0] != len(symbols):
+            raise ValueError(f"Covariance matrix is {matrix.shape[0]}x{matrix.shape[0]} "
+                             f"but there are {len(symbols)} ETFs")
+    return matrix
+
+
+def _covariance_factor(covariance):
+    """Lower-triangular factor of the covariance (eigenvalues clipped if it is not positive definite)."""
+    try:
+        return np.linalg.cholesky(covariance)
+    except np.linalg.LinAlgError:
+        eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+        return eigenvectors * np.sqrt(np.clip(eigenvalues, 0.0, None))
+
+
+def simulate_price_scenarios(prices, covariance, n_scenarios=10000, horizon=1.0, seed=None):
+    """
+    Draw n_scenarios correlated lognormal price shocks over horizon years.
+
+    Log returns are normal with the given annual covariance and zero expected simple return,
+    so the result is an (n_scenarios, n) array of prices.
+    """
+    prices = np.asarray(prices, dtype=float)
+    covariance = np.asarray(covariance, dtype=float) * horizon
+    factor = _covariance_factor(covariance)
+    rng = np.random.default_rng(seed)
+    shocks = rng.standard_normal((n_scenarios, len(prices))) @ factor.T
+    return prices * np.exp(shocks - 0.5 * np.diag(covariance))
+
+
+def score_scenarios(shares, scenario_prices, target_pcts):
+    """Deviation metrics of one allocation under every scenario, as arrays over scenarios."""
+    values = np.asarray(scenario_prices, dtype=float) * np.asarray(shares, dtype=float)
+    invested = values.sum(axis=1, keepdims=True)
+    pcts = np.divide(values * 100, invested, out=np.zeros_like(values), where=invested > 0)
+    deviations = np.abs(pcts - np.asarray(target_pcts, dtype=float))
+    return {
+        "invested": invested[:, 0],
+        "actual_percentages": pcts,
+        "total_deviation": deviations.sum(axis=1),
+        "max_deviation": deviations.max(axis=1)
+    }
+
+
+def simulate_allocation(shares, prices, target_pcts, covariance, n_scenarios=10000, horizon=1.0,
+                        seed=None, chunk_size=100000):
+    """
+    Monte Carlo drift of an allocation: re-score it under simulated prices.
+
+    Scenarios are drawn and scored chunk_size at a time to bound memory. Returns the
+    per-scenario total/max deviations, invested value and the mean drifted weights.
+    """
+    rng = np.random.default_rng(seed)
+    total_devs, max_devs, invested = [], [], []
+    weight_sum = np.zeros(len(prices))
+    for start in range(0, n_scenarios, chunk_size):
+        count = min(chunk_size, n_scenarios - start)
+        scenario_prices = simulate_price_scenarios(prices, covariance, count, horizon, seed=rng)
+        scores = score_scenarios(shares, scenario_prices, target_pcts)
+        total_devs.append(scores["total_deviation"])
+        max_devs.append(scores["max_deviation"])
+        invested.append(scores["invested"])
+        weight_sum += scores["actual_percentages"].sum(axis=0)
+    return {
+        "total_deviation": np.concatenate(total_devs),
+        "max_deviation": np.concatenate(max_devs),
+        "invested": np.concatenate(invested),
+        "mean_percentages": weight_sum / max(n_scenarios, 1)
+    }
+
+
+def distribution_summary(values, percentiles=(5, 25, 50, 75, 95)):
+    """Mean and percentiles of a scenario distribution."""
+    values = np.asarray(values, dtype=float)
+    summary = {"mean": float(values.mean())}
+    for p, v in zip(percentiles, np.percentile(values, percentiles)):
+        summary[f"p{p}"] = float(v)
+    return summary
+
+
+def budget_grid(start, stop, step):
+    """Budgets from start to stop (inclusive) in step increments."""
+    if start <= 0 or step <= 0 or stop < start:
+        raise ValueError("Sweep needs 0 < start <= stop and a positive step")
+    count = int(math.floor((stop - start) / step + 1e-9)) + 1
+    return [round(start + k * step, 2) for k in range(count)]
+
+
+def pareto_mask(leftover, deviation):
+    """True for points that no other point beats on both leftover cash and deviation."""
+    leftover = np.asarray(leftover, dtype=float)[:, None]
+    deviation = np.asarray(deviation, dtype=float)[:, None]
+    no_worse = (leftover.T <= leftover + 1e-9) & (deviation.T <= deviation + 1e-9)
+    better = (leftover.T < leftover - 1e-9) | (deviation.T < deviation - 1e-9)
+    return ~(no_worse & better).any(axis=1)
+
+
+def _objective_of(shares, prices, target_pcts, budget, objective):
+    metrics = allocation_metrics(shares, prices, target_pcts, budget)
+    return objective_key(metrics["total_deviation"], metrics["max_deviation"], objective)
+
+
+def sweep_frontier(target_pcts, prices, budgets, objectives=('total', 'max'), solver='greedy',
+                   should_stop=None, progress=None, cold_every=10, time_limit=EXACT_TIME_LIMIT):
+    """
+    Solve every (budget, objective) pair of a budget grid for the leftover-cash/deviation frontier.
+
+    Budgets are walked in increasing order and each greedy solve is warm-started from the
+    previous budget's allocation (still affordable with more cash, so it only needs the
+    extra cash spent). A cold solve from the budget's floor allocation is only run every
+    cold_every budgets, or when the warm answer is worse than the previous budget's, and the
+    better of the two is kept; the result seeds the exact search as its incumbent, which
+    settles for its best allocation so far after time_limit seconds. Returns one dict per
+    point with an on_frontier flag per objective, or None if should_stop() became true.
+    progress(done, total) is called after each point.
+    """
+    budgets = sorted(budgets)
+    total_points = len(budgets) * len(objectives)
+    points = []
+    for objective in objectives:
+        previous = None
+        previous_key = None
+        for k, budget in enumerate(budgets):
+            shares = None
+            if previous is not None:
+                shares = solve_greedy(target_pcts, prices, budget, objective, previous, should_stop=should_stop)
+                if shares is None:
+                    return None
+                key = _objective_of(shares, prices, target_pcts, budget, objective)
+            if previous is None or k % cold_every == 0 or is_better(previous_key, key):
+                floor = initial_allocation([t * budget / 100 for t in target_pcts], prices)
+                cold = solve_greedy(target_pcts, prices, budget, objective, floor, should_stop=should_stop)
+                if cold is None:
+                    return None
+                if shares is None or is_better(_objective_of(cold, prices, target_pcts, budget, objective), key):
+                    shares = cold
+            if solver == 'exact':
+                shares = solve_exact(target_pcts, prices, budget, objective, should_stop=should_stop,
+                                     incumbent=shares, time_limit=time_limit)
+                if shares is None:
+                    return None
+            previous = shares
+            previous_key = _objective_of(shares, prices, target_pcts, budget, objective)
+
+            metrics = allocation_metrics(shares, prices, target_pcts, budget)
+            points.append({
+                "budget": budget,
+                "objective": objective,
+                "shares": shares,
+                "total_invested": metrics["total_invested"],
+                "leftover": metrics["remainder"],
+                "total_deviation": metrics["total_deviation"],
+                "max_deviation": metrics["max_deviation"]
+            })
+            if progress:
+                progress(len(points), total_points)
+
+    for objective in objectives:
+        group = [p for p in points if p["objective"] == objective]
+        deviation_key = "total_deviation" if objective == 'total' else "max_deviation"
+        mask = pareto_mask([p["leftover"] for p in group], [p[deviation_key] for p in group])
+        for point, on_frontier in zip(group, mask):
+            point["on_frontier"] = bool(on_frontier)
+    return points
+
+
+def normalize_request(request):
+    """
+    Check an optimize() request and fill in its defaults; raises ValueError on bad input.
+
+    Request keys (JSON-friendly):
+      etfs, targets, prices          equal-length lists (required)
+      budget                         new cash to invest (required, >= 0 when rebalancing)
+      allocation_type                "$" (default) or "%"
+      secondary_objective            "total" (default) or "max"
+      solver                         "greedy" (default) or "exact"
+      mode                           "new" (default) or "rebalance"
+      holdings                       shares held per ETF (rebalance mode)
+      rebalance_options              keyword arguments for rebalance_portfolio
+      scenarios, horizon, seed       Monte Carlo drift report (0 scenarios = off)
+      covariance / covariance_csv    annual return covariance, else volatility + correlation
+    """
+    req = dict(request)
+    etfs = [str(e).strip().upper() for e in req.get("etfs") or []]
+    targets = [float(t) for t in req.get("targets") or []]
+    prices = [float(p) for p in req.get("prices") or []]
+    if not etfs:
+        raise ValueError("At least one ETF is required")
+    if not len(etfs) == len(targets) == len(prices):
+        raise ValueError("etfs, targets and prices must have the same length")
+    if any(p <= 0 for p in prices):
+        raise ValueError("Prices must be positive")
+
+    mode = req.get("mode", "new")
+    if mode not in ("new", "rebalance"):
+        raise ValueError(f"Unknown mode '{mode}'")
+    budget = float(req.get("budget", 0))
+    if budget < 0 or (budget == 0 and mode == "new"):
+        raise ValueError("Budget must be a positive number")
+    holdings = [float(h) for h in req.get("holdings") or [0.0] * len(etfs)]
+    if len(holdings) != len(etfs) or any(h < 0 for h in holdings):
+        raise ValueError("holdings must list a non-negative share count per ETF")
+
+    allocation_type = req.get("allocation_type", "$")
+    if allocation_type not in ("$", "%"):
+        raise ValueError("allocation_type must be '$' or '%'")
+    if any(t < 0 for t in targets):
+        raise ValueError("Targets cannot be negative")
+    total_value = budget + (sum(h * p for h, p in zip(holdings, prices)) if mode == "rebalance" else 0.0)
+    if allocation_type == "$" and abs(sum(targets) - total_value) > 0.01:
+        raise ValueError(f"Sum of target allocations (${sum(targets):.2f}) does not match "
+                         f"total budget (${total_value:.2f})")
+    if allocation_type == "%" and abs(sum(targets) - 100.0) > 0.01:
+        raise ValueError(f"Sum of target percentages ({sum(targets):.2f}%) does not equal 100%")
+
+    if req.get("secondary_objective", "total") not in ("total", "max"):
+        raise ValueError("secondary_objective must be 'total' or 'max'")
+    if req.get("solver", "greedy") not in ("greedy", "exact"):
+        raise ValueError("solver must be 'greedy' or 'exact'")
+
+    scenarios = int(req.get("scenarios") or 0)
+    horizon = float(req.get("horizon", 1.0))
+    if scenarios < 0 or (scenarios and horizon <= 0):
+        raise ValueError("Scenarios cannot be negative and horizon must be positive")
+    covariance = req.get("covariance")
+    if scenarios and covariance is None:
+        if req.get("covariance_csv"):
+            covariance = load_covariance_csv(req["covariance_csv"], etfs)
+        else:
+            covariance = covariance_matrix(len(etfs), float(req.get("volatility", 0.2)),
+                                           float(req.get("correlation", 0.0)))
+    if covariance is not None:
+        covariance = np.asarray(covariance, dtype=float)
+        if covariance.shape != (len(etfs), len(etfs)):
+            raise ValueError(f"Covariance must be {len(etfs)}x{len(etfs)}")
+
+    req.update({
+        "etfs": etfs, "targets": targets, "prices": prices, "budget": budget, "holdings": holdings,
+        "mode": mode, "allocation_type": allocation_type,
+        "secondary_objective": req.get("secondary_objective", "total"),
+        "solver": req.get("solver", "greedy"),
+        "rebalance_options": dict(req.get("rebalance_options") or {}),
+        "scenarios": scenarios, "horizon": horizon, "covariance": covariance
+    })
+    return req
+
+
+def optimize(request, should_stop=None, progress=None):
+    """
+    Solve one allocation request (see normalize_request) without any GUI.
+
+    should_stop() is polled by the solvers; progress(message) receives status text.
+    Returns a JSON-serializable result dict whose "status" is "ok" or "stopped".
+    """
+    req = normalize_request(request)
+    prices = req["prices"]
+    objective = req["secondary_objective"]
+
+    def report(message):
+        if progress:
+            progress(message)
+
+    result = {
+        "status": "ok",
+        "mode": req["mode"],
+        "etfs": req["etfs"],
+        "prices": prices,
+        "allocation_type": req["allocation_type"],
+        "secondary_objective": objective,
+        "solver": req["solver"],
+        "budget": req["budget"]
+    }
+
+    if req["mode"] == "rebalance":
+        report("Rebalancing holdings...")
+        holdings = req["holdings"]
+        total_value = req["budget"] + sum(h * p for h, p in zip(holdings, prices))
+        target_pcts = target_percentages(req["targets"], total_value, req["allocation_type"])
+        options = dict({"band": 0.0, "cost_per_trade": 0.0, "cost_bps": 0.0,
+                        "fractional": False, "allow_sells": True}, **req["rebalance_options"])
+        rebalanced = rebalance_portfolio(holdings, prices, target_pcts, req["budget"], objective, **options)
+        shares = rebalanced["shares"]
+        result.update({
+            "holdings": holdings,
+            "rebalance_options": options,
+            "trades": rebalanced["trades"],
+            "costs": rebalanced["costs"],
+            "total_cost": rebalanced["total_cost"],
+            "trade_count": rebalanced["trade_count"],
+            "cash_left": rebalanced["cash_left"],
+            "total_value": rebalanced["total_value"]
+        })
+        metrics = rebalanced["metrics"]
+    else:
+        report("Optimizing allocation...")
+        budget = req["budget"]
+        dollars = target_dollars(req["targets"], budget, req["allocation_type"])
+        target_pcts = target_percentages(req["targets"], budget, req["allocation_type"])
+        start = initial_allocation(dollars, prices)
+
+        shares = solve_greedy(target_pcts, prices, budget, objective, start, should_stop=should_stop,
+                              progress=lambda iteration: report(f"Optimizing... Iteration {iteration}"))
+        if shares is not None and req["solver"] == 'exact':
+            # The greedy answer seeds the exact search so it can prune from the start
+            report("Optimizing... Branch & bound search")
+            shares = solve_exact(target_pcts, prices, budget, objective,
+                                 should_stop=should_stop, incumbent=shares)
+        if shares is None:
+            result["status"] = "stopped"
+            return result
+        metrics = allocation_metrics(shares, prices, target_pcts, budget)
+        result["target_dollars"] = dollars
+
+    result.update({"target_percentages": target_pcts, "shares": shares, "metrics": metrics})
+
+    if req["scenarios"] and not (should_stop and should_stop()):
+        report(f"Simulating {req['scenarios']} price scenarios...")
+        simulated = simulate_allocation(shares, prices, target_pcts, req["covariance"], req["scenarios"],
+                                        req["horizon"], seed=req.get("seed"))
+        result["scenarios"] = {
+            "count": req["scenarios"],
+            "horizon": req["horizon"],
+            "total_deviation": distribution_summary(simulated["total_deviation"]),
+            "max_deviation": distribution_summary(simulated["max_deviation"]),
+            "invested": distribution_summary(simulated["invested"]),
+            "mean_percentages": simulated["mean_percentages"].tolist()
+        }
+    return result
+
+
+def _scenario_report(result):
+    scenarios = result.get("scenarios")
+    if not scenarios:
+        return ""
+    text = f"\nPrice Scenarios ({scenarios['count']} draws, {scenarios['horizon']:g} yr horizon)\n"
+    text += f"{'Metric':<18} {'Mean':<9} {'P5':<9} {'P25':<9} {'Median':<9} {'P75':<9} {'P95':<9}\n"
+    text += "-"*85 + "\n"
+    for label, key, fmt in (("Total Deviation %", "total_deviation", ".2f"),
+                            ("Max Deviation %", "max_deviation", ".2f"), ("Value ($)", "invested", ".0f")):
+        s = scenarios[key]
+        text += (f"{label:<18} " + " ".join(f"{s[k]:<9{fmt}}" for k in ("mean", "p5", "p25", "p50", "p75", "p95"))
+                 + "\n")
+    text += "-"*85 + "\n"
+    text += "Mean drifted weights: " + ", ".join(
+        f"{etf} {pct:.2f}%" for etf, pct in zip(result["etfs"], scenarios["mean_percentages"])) + "\n"
+    return text
+
+
+def format_report(result):
+    """Plain-text report of an optimize() result, as shown in the GUI."""
+    if result["status"] == "stopped":
+        return "Optimization stopped by user."
+
+    etfs = result["etfs"]
+    prices = result["prices"]
+    shares = result["shares"]
+    metrics = result["metrics"]
+    target_pcts = result["target_percentages"]
+
+    if result["mode"] == "rebalance":
+        options = result["rebalance_options"]
+        text = f"Rebalance Results (Cash: ${result['budget']:.2f}, Portfolio Value: ${result['total_value']:.2f})\n"
+        text += f"Secondary Objective: {result['secondary_objective']}\n"
+        text += (f"Band: {options['band']:.2f}%  Cost/Trade: ${options['cost_per_trade']:.2f}  "
+                 f"Cost: {options['cost_bps']:.1f} bps  Fractional: {options['fractional']}  "
+                 f"Sells: {options['allow_sells']}\n")
+        text += f"\n{'ETF':<6} {'Price($)':<10} {'Held':<10} {'Trade':<10} {'Shares':<10} {'Actual($)':<12} {'Target%':<10} {'Actual%':<10}\n"
+        text += "-"*85 + "\n"
+        for i in range(len(etfs)):
+            trade = result["trades"][i]
+            trade_str = f"{trade:+g}" if trade else "-"
+            text += (f"{etfs[i]:<6} ${prices[i]:<9.2f} {result['holdings'][i]:<10g} {trade_str:<10} {shares[i]:<10g} "
+                     f"${metrics['actual_investments'][i]:<11.2f} {target_pcts[i]:<9.2f}% "
+                     f"{metrics['actual_percentages'][i]:<9.2f}%\n")
+        text += "-"*85 + "\n"
+        text += f"Trades: {result['trade_count']}\n"
+        text += f"Trade Costs: ${result['total_cost']:.2f}\n"
+        text += f"Total Invested: ${metrics['total_invested']:.2f}\n"
+        text += f"Cash Left: ${result['cash_left']:.2f}\n"
+    else:
+        targets = result["target_dollars"]
+        text = f"Optimization Results (Budget: ${result['budget']:.2f})\n"
+        text += f"Allocation Type: {result['allocation_type']}\n"
+        text += f"Secondary Objective: {result['secondary_objective']}\n"
+        text += f"Solver: {result['solver']}\n"
+        text += f"\n{'ETF':<6} {'Target':<10} {'Price($)':<10} {'Shares':<8} {'Actual($)':<12} {'Target%':<10} {'Actual%':<10}\n"
+        text += "-"*85 + "\n"
+        for i in range(len(etfs)):
+            text += (f"{etfs[i]:<6} {targets[i]:<10.2f} ${prices[i]:<9.2f} {shares[i]:<8} "
+                     f"${metrics['actual_investments'][i]:<11.2f} {target_pcts[i]:<9.2f}% "
+                     f"{metrics['actual_percentages'][i]:<9.2f}%\n")
+        text += "-"*85 + "\n"
+        text += f"Total Invested: ${metrics['total_invested']:.2f}\n"
+        text += f"Remainder: ${metrics['remainder']:.2f}\n"
+
+    text += f"Total Deviation: {metrics['total_deviation']:.2f}%\n"
+    text += f"Max Deviation: {metrics['max_deviation']:.2f}%\n"
+    text += _scenario_report(result)
+    return text
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Optimize an ETF allocation from a JSON request.")
+    parser.add_argument("request", help="JSON request file, or - for stdin (see normalize_request)")
+    parser.add_argument("-o", "--output", help="Write the JSON result here instead of stdout")
+    parser.add_argument("--report", action="store_true", help="Print the text report instead of JSON")
+    parser.add_argument("--quiet", action="store_true", help="No progress messages on stderr")
+    args = parser.parse_args(argv)
+
+    if args.request == "-":
+        request = json.load(sys.stdin)
+    else:
+        with open(args.request, encoding="utf-8") as f:
+            request = json.load(f)
+
+    def show_progress(message):
+        print(f"\r{message:<40}", end="", file=sys.stderr, flush=True)
+
+    try:
+        result = optimize(request, progress=None if args.quiet else show_progress)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    if not args.quiet:
+        print(file=sys.stderr)
+
+    output = format_report(result) if args.report else json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
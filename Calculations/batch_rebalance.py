@@ -0,0 +1,319 @@
+import argparse
+import csv
+import multiprocessing
+import os
+import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from allocation_engine import (EXACT_TIME_LIMIT, allocation_metrics, initial_allocation, rebalance_portfolio,
+                               solve_exact, solve_greedy)
+
+# Batch rebalancing of many client accounts with the allocation engine
+# Usage: python batch_rebalance.py accounts.csv --objective total --solver greedy --workers 4
+#        python batch_rebalance.py accounts.csv --mode min-trade --band 1 --cost-per-trade 4.95
+#
+# Input CSV - one row per account/symbol:
+#   account,cash,symbol,target,price,shares,lot
+#   ACC-001,5000,VGT,20,625,3,
+#   ACC-001,,SCHD,80,28,100,10
+# target is the percentage of the account's total value (cash + holdings); cash only
+# needs to be filled on one row per account; shares is the current holding (blank = 0);
+# lot is the optional trading lot size used by the min-trade mode (blank = 1)
+
+REQUIRED_COLUMNS = ["account", "symbol", "target", "price"]
+
+# Set in each worker process: stops the solves running there when the batch is stopped
+_stop_event = None
+
+
+def _init_worker(stop_event):
+    global _stop_event
+    _stop_event = stop_event
+
+
+def _stopped():
+    return _stop_event is not None and _stop_event.is_set()
+
+
+def _parse_float(value, field, account, symbol, default=None):
+    value = (value or "").strip()
+    if not value:
+        if default is None:
+            raise ValueError(f"Missing {field} for {symbol} in account {account}")
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"Invalid {field} '{value}' for {symbol} in account {account}")
+
+
+def read_accounts(csv_path):
+    """Read the accounts CSV into a list of account dicts (keeps file order)."""
+    accounts = {}
+    with open(csv_path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f)
+        header = [h.strip().lower() for h in (reader.fieldnames or [])]
+        missing = [c for c in REQUIRED_COLUMNS if c not in header]
+        if missing:
+            raise ValueError(f"Missing column(s) in {os.path.basename(csv_path)}: {', '.join(missing)}")
+
+        for row in reader:
+            row = {(k or "").strip().lower(): (v or "") for k, v in row.items()}
+            account_id = row["account"].strip()
+            symbol = row["symbol"].strip()
+            if not account_id or not symbol:
+                continue
+
+            account = accounts.setdefault(account_id, {
+                "account": account_id, "cash": None, "symbols": [], "targets": [],
+                "prices": [], "holdings": [], "lots": [], "error": None
+            })
+            try:
+                if row.get("cash", "").strip():
+                    cash = _parse_float(row["cash"], "cash", account_id, symbol)
+                    if cash < 0:
+                        raise ValueError(f"Cash for account {account_id} cannot be negative")
+                    if account["cash"] is not None and abs(account["cash"] - cash) > 0.005:
+                        raise ValueError(f"Conflicting cash values for account {account_id}")
+                    account["cash"] = cash
+                account["symbols"].append(symbol)
+                account["targets"].append(_parse_float(row["target"], "target", account_id, symbol))
+                account["prices"].append(_parse_float(row["price"], "price", account_id, symbol))
+                account["holdings"].append(_parse_float(row.get("shares"), "shares", account_id, symbol,
+                                                        default=0.0))
+                account["lots"].append(_parse_float(row.get("lot"), "lot", account_id, symbol, default=1.0))
+            except ValueError as e:
+                account["error"] = account["error"] or str(e)
+
+    for account in accounts.values():
+        if account["cash"] is None:
+            account["cash"] = 0.0
+    return list(accounts.values())
+
+
+def solve_account(account, objective="total", solver="greedy", mode="optimal", rebalance_options=None,
+                  time_limit=EXACT_TIME_LIMIT):
+    """
+    Rebalance one account to its target weights. Runs in a worker process.
+
+    mode "optimal" re-solves the whole account and trades the difference; "min-trade"
+    uses rebalance_portfolio with rebalance_options (band, costs, lots, fractional, ...).
+    An exact solve that runs past time_limit seconds keeps its best allocation so far
+    (at worst the greedy one).
+    """
+    result = {"account": account["account"], "symbols": account["symbols"], "error": account.get("error")}
+    try:
+        if result["error"]:
+            raise ValueError(result["error"])
+
+        prices = account["prices"]
+        targets = account["targets"]
+        holdings = account["holdings"]
+        if any(p <= 0 for p in prices):
+            raise ValueError("Prices must be positive")
+        if any(h < 0 for h in holdings) or any(lot <= 0 for lot in account["lots"]):
+            raise ValueError("Holdings cannot be negative and lot sizes must be positive")
+        if any(t < 0 or t > 100 for t in targets):
+            raise ValueError("Percentage targets must be between 0% and 100%")
+        if abs(sum(targets) - 100.0) > 0.01:
+            raise ValueError(f"Sum of target percentages ({sum(targets):.2f}%) does not equal 100%")
+
+        # Holdings are valued at today's prices and pooled with the cash
+        total_value = account["cash"] + sum(h * p for h, p in zip(holdings, prices))
+        if total_value <= 0:
+            raise ValueError("Account has no cash or holdings")
+
+        if mode == "min-trade":
+            options = dict(rebalance_options or {})
+            options.setdefault("lot_sizes", account["lots"])
+            rebalanced = rebalance_portfolio(holdings, prices, targets, account["cash"], objective, **options)
+            shares = rebalanced["shares"]
+            metrics = rebalanced["metrics"]
+            trade_cost = rebalanced["total_cost"]
+        else:
+            # A 0% target means the position should be sold off entirely, so only the
+            # positive targets are solved and the rest are left at 0 shares
+            kept = [i for i, t in enumerate(targets) if t > 0]
+            kept_targets = [targets[i] for i in kept]
+            kept_prices = [prices[i] for i in kept]
+            start = initial_allocation([t * total_value / 100 for t in kept_targets], kept_prices)
+            solved = solve_greedy(kept_targets, kept_prices, total_value, objective, start, should_stop=_stopped)
+            if solved is not None and solver == "exact":
+                solved = solve_exact(kept_targets, kept_prices, total_value, objective, should_stop=_stopped,
+                                     incumbent=solved, time_limit=time_limit)
+            if solved is None:
+                raise ValueError("Stopped")
+            shares = [0] * len(targets)
+            for i, count in zip(kept, solved):
+                shares[i] = count
+            metrics = allocation_metrics(shares, prices, targets, total_value)
+            trade_cost = 0.0
+
+        result.update({
+            "total_value": total_value,
+            "targets": targets,
+            "prices": prices,
+            "holdings": holdings,
+            "shares": shares,
+            "metrics": metrics,
+            "trade_cost": trade_cost
+        })
+    except Exception as e:
+        result["error"] = str(e)
+    return result
+
+
+def solve_accounts(accounts, objective="total", solver="greedy", workers=None, progress=None,
+                   should_stop=None, mode="optimal", rebalance_options=None, time_limit=EXACT_TIME_LIMIT):
+    """
+    Solve all accounts across a process pool; returns results in input order.
+
+    Once should_stop() is true the pending accounts are cancelled and the ones being solved
+    are stopped; only the accounts finished by then are returned.
+    """
+    results = [None] * len(accounts)
+    stop_event = multiprocessing.Event()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(stop_event,)) as executor:
+        futures = {executor.submit(solve_account, account, objective, solver, mode, rebalance_options,
+                                   time_limit): i
+                   for i, account in enumerate(accounts)}
+        pending = set(futures)
+        while pending:
+            # Wake up now and then so a stop does not wait for the next account to finish
+            finished, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+            for future in finished:
+                results[futures[future]] = future.result()
+            if progress and finished:
+                progress(len(futures) - len(pending), len(accounts))
+            if should_stop and should_stop():
+                stop_event.set()
+                for future in pending:
+                    future.cancel()
+                break
+    return [r for r in results if r is not None]
+
+
+def trade_rows(results):
+    """Consolidated trade list: one row per share change needed in any account."""
+    rows = []
+    for result in results:
+        if result["error"]:
+            continue
+        for symbol, price, held, shares in zip(result["symbols"], result["prices"],
+                                               result["holdings"], result["shares"]):
+            quantity = round(shares - held, 6)
+            if quantity == 0:
+                continue
+            rows.append({
+                "account": result["account"],
+                "symbol": symbol,
+                "action": "BUY" if quantity > 0 else "SELL",
+                "quantity": f"{abs(quantity):g}",
+                "price": f"{price:.2f}",
+                "amount": f"{abs(quantity) * price:.2f}"
+            })
+    return rows
+
+
+def report_rows(results):
+    """Per-account, per-symbol deviation report (accounts that failed get one error row)."""
+    rows = []
+    for result in results:
+        if result["error"]:
+            rows.append({"account": result["account"], "status": f"Error: {result['error']}"})
+            continue
+        metrics = result["metrics"]
+        for i, symbol in enumerate(result["symbols"]):
+            rows.append({
+                "account": result["account"],
+                "symbol": symbol,
+                "shares": f"{result['shares'][i]:g}",
+                "target_pct": f"{result['targets'][i]:.2f}",
+                "actual_pct": f"{metrics['actual_percentages'][i]:.2f}",
+                "deviation_pct": f"{metrics['percentage_deviations'][i]:.2f}",
+                "total_value": f"{result['total_value']:.2f}",
+                "invested": f"{metrics['total_invested']:.2f}",
+                "leftover_cash": f"{metrics['remainder']:.2f}",
+                "total_deviation": f"{metrics['total_deviation']:.2f}",
+                "max_deviation": f"{metrics['max_deviation']:.2f}",
+                "trade_cost": f"{result['trade_cost']:.2f}",
+                "status": "OK"
+            })
+    return rows
+
+
+def write_csv(path, rows, fieldnames):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+TRADE_FIELDS = ["account", "symbol", "action", "quantity", "price", "amount"]
+REPORT_FIELDS = ["account", "symbol", "shares", "target_pct", "actual_pct", "deviation_pct", "total_value",
+                 "invested", "leftover_cash", "total_deviation", "max_deviation", "trade_cost", "status"]
+
+
+def run_batch(csv_path, trades_path=None, report_path=None, objective="total", solver="greedy",
+              workers=None, progress=None, should_stop=None, mode="optimal", rebalance_options=None,
+              time_limit=EXACT_TIME_LIMIT):
+    """Read, solve and write a whole batch. Returns (results, trades_path, report_path)."""
+    base, _ = os.path.splitext(csv_path)
+    trades_path = trades_path or f"{base}_trades.csv"
+    report_path = report_path or f"{base}_report.csv"
+
+    accounts = read_accounts(csv_path)
+    results = solve_accounts(accounts, objective, solver, workers, progress, should_stop,
+                             mode, rebalance_options, time_limit)
+
+    write_csv(trades_path, trade_rows(results), TRADE_FIELDS)
+    write_csv(report_path, report_rows(results), REPORT_FIELDS)
+    return results, trades_path, report_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebalance many accounts from a CSV file.")
+    parser.add_argument("accounts_csv", help="CSV with account,cash,symbol,target,price,shares columns")
+    parser.add_argument("--trades", help="Output trade list CSV (default: <input>_trades.csv)")
+    parser.add_argument("--report", help="Output deviation report CSV (default: <input>_report.csv)")
+    parser.add_argument("--objective", choices=["total", "max"], default="total")
+    parser.add_argument("--solver", choices=["greedy", "exact"], default="greedy")
+    parser.add_argument("--time-limit", type=float, default=EXACT_TIME_LIMIT,
+                        help="exact: seconds per account before the best allocation so far is used")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--mode", choices=["optimal", "min-trade"], default="optimal",
+                        help="optimal: re-solve each account; min-trade: trade only what is needed")
+    parser.add_argument("--band", type=float, default=0.0, help="min-trade: tolerance band in % points")
+    parser.add_argument("--cost-per-trade", type=float, default=0.0, help="min-trade: fixed cost per trade ($)")
+    parser.add_argument("--cost-bps", type=float, default=0.0, help="min-trade: cost in basis points of amount")
+    parser.add_argument("--min-trade", type=float, default=0.0, help="min-trade: smallest trade amount ($)")
+    parser.add_argument("--fractional", action="store_true", help="min-trade: allow fractional shares")
+    parser.add_argument("--no-sells", action="store_true", help="min-trade: only buy with available cash")
+    args = parser.parse_args(argv)
+
+    rebalance_options = {
+        "band": args.band,
+        "cost_per_trade": args.cost_per_trade,
+        "cost_bps": args.cost_bps,
+        "min_trade": args.min_trade,
+        "fractional": args.fractional,
+        "allow_sells": not args.no_sells
+    }
+
+    def show_progress(done, total):
+        print(f"\rSolved {done}/{total} accounts", end="", flush=True)
+
+    results, trades_path, report_path = run_batch(args.accounts_csv, args.trades, args.report,
+                                                  args.objective, args.solver, args.workers,
+                                                  progress=show_progress, mode=args.mode,
+                                                  rebalance_options=rebalance_options,
+                                                  time_limit=args.time_limit)
+    failed = sum(1 for r in results if r["error"])
+    print(f"\n{len(results) - failed} accounts rebalanced, {failed} failed")
+    print(f"Trade list: {trades_path}")
+    print(f"Deviation report: {report_path}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,43 @@
+import time
+
+from allocation_engine import allocation_metrics, initial_allocation, solve_exact, solve_greedy
+
+PRICES = [625, 216, 28, 59, 57, 480, 110, 95, 310, 42]
+TARGETS = [22, 15, 3, 8, 5, 17, 10, 6, 9, 5]
+
+
+def deviation(shares, prices, targets, budget, objective):
+    metrics = allocation_metrics(shares, prices, targets, budget)
+    return metrics["total_deviation" if objective == "total" else "max_deviation"]
+
+
+def test_exact_searches_below_the_floor():
+    # The floor allocation is 6/142; spending less gets much closer to 50/50
+    shares = solve_exact([50, 50], [625, 28], 8000, "total")
+    assert shares == [6, 134]
+
+
+def test_exact_ten_etfs_large_budget_is_fast():
+    budget = 1_000_000
+    for objective in ("total", "max"):
+        start = initial_allocation([t * budget / 100 for t in TARGETS], PRICES)
+        greedy = solve_greedy(TARGETS, PRICES, budget, objective, start)
+        started = time.perf_counter()
+        shares = solve_exact(TARGETS, PRICES, budget, objective, incumbent=greedy)
+        assert time.perf_counter() - started < 5
+        assert sum(s * p for s, p in zip(shares, PRICES)) <= budget
+        assert (deviation(shares, PRICES, TARGETS, budget, objective)
+                <= deviation(greedy, PRICES, TARGETS, budget, objective))
+
+
+def test_exact_time_limit_keeps_the_incumbent():
+    budget = 50_000
+    start = initial_allocation([t * budget / 100 for t in TARGETS], PRICES)
+    greedy = solve_greedy(TARGETS, PRICES, budget, "max", start)
+    shares = solve_exact(TARGETS, PRICES, budget, "max", incumbent=greedy, time_limit=0)
+    assert shares is not None
+    assert deviation(shares, PRICES, TARGETS, budget, "max") <= deviation(greedy, PRICES, TARGETS, budget, "max")
+
+
+def test_exact_stop_returns_none():
+    assert solve_exact(TARGETS, PRICES, 50_000, "max", should_stop=lambda: True) is None
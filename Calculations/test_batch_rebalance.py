@@ -0,0 +1,83 @@
+import pytest
+
+from batch_rebalance import read_accounts, report_rows, run_batch, solve_account, solve_accounts, trade_rows
+
+HEADER = "account,cash,symbol,target,price,shares,lot\n"
+
+
+def write_accounts(tmp_path, rows, header=HEADER):
+    path = tmp_path / "accounts.csv"
+    path.write_text(header + "".join(row + "\n" for row in rows), encoding="utf-8")
+    return str(path)
+
+
+def test_read_accounts_groups_rows(tmp_path):
+    path = write_accounts(tmp_path, ["ACC-001,5000,VGT,20,625,3,", "ACC-001,,SCHD,80,28,100,10",
+                                     "ACC-002,100,VTI,100,250,,"])
+    first, second = read_accounts(path)
+    assert first["cash"] == 5000 and first["symbols"] == ["VGT", "SCHD"]
+    assert first["holdings"] == [3, 100] and first["lots"] == [1, 10]
+    assert second["holdings"] == [0] and second["error"] is None
+
+
+def test_read_accounts_missing_column(tmp_path):
+    path = write_accounts(tmp_path, ["ACC-001,VGT,100"], header="account,symbol,target\n")
+    with pytest.raises(ValueError, match="price"):
+        read_accounts(path)
+
+
+def test_read_accounts_conflicting_cash(tmp_path):
+    path = write_accounts(tmp_path, ["ACC-001,5000,VGT,50,625,,", "ACC-001,4000,SCHD,50,28,,"])
+    account, = read_accounts(path)
+    assert "Conflicting cash" in account["error"]
+    assert "Conflicting cash" in solve_account(account)["error"]
+
+
+def test_zero_target_is_sold_off(tmp_path):
+    # The greedy used to buy the 0% position back up to 20 shares (33% total deviation)
+    path = write_accounts(tmp_path, ["ACC-001,1000,A,50,400,,", "ACC-001,,B,50,300,,", "ACC-001,,C,0,10,20,"])
+    account, = read_accounts(path)
+    for solver in ("greedy", "exact"):
+        result = solve_account(account, solver=solver)
+        assert result["error"] is None
+        assert result["shares"][2] == 0
+        assert result["metrics"]["total_deviation"] <= 20
+
+
+def test_min_trade_mode_respects_band_and_lots(tmp_path):
+    path = write_accounts(tmp_path, ["ACC-001,0,VGT,50,100,50,", "ACC-001,,SCHD,50,10,450,10"])
+    account, = read_accounts(path)
+    # 52.6% / 47.4% is inside a 5% band: nothing to trade
+    assert solve_account(account, mode="min-trade", rebalance_options={"band": 5})["shares"] == [50, 450]
+    result = solve_account(account, mode="min-trade")
+    assert result["error"] is None
+    assert result["shares"][0] < 50 and (result["shares"][1] - 450) % 10 == 0
+
+
+def test_trade_and_report_rows(tmp_path):
+    path = write_accounts(tmp_path, ["ACC-001,1000,A,50,400,,", "ACC-001,,B,50,300,,", "ACC-001,,C,0,10,20,",
+                                     "ACC-002,100,D,50,10,,", "ACC-002,,E,40,10,,"])
+    results = [solve_account(account) for account in read_accounts(path)]
+    trades = trade_rows(results)
+    assert {row["account"] for row in trades} == {"ACC-001"}
+    assert {"account": "ACC-001", "symbol": "C", "action": "SELL", "quantity": "20", "price": "10.00",
+            "amount": "200.00"} in trades
+    report = report_rows(results)
+    assert [row["status"] for row in report if row["account"] == "ACC-001"] == ["OK"] * 3
+    error, = [row for row in report if row["account"] == "ACC-002"]
+    assert error["status"].startswith("Error: Sum of target percentages")
+
+
+def test_run_batch_writes_both_files(tmp_path):
+    path = write_accounts(tmp_path, ["ACC-001,5000,VGT,20,625,3,", "ACC-001,,SCHD,80,28,100,"])
+    results, trades_path, report_path = run_batch(path, workers=1)
+    assert results[0]["error"] is None
+    assert open(trades_path, encoding="utf-8").readline().startswith("account,symbol,action")
+    assert len(open(report_path, encoding="utf-8").readlines()) == 3
+
+
+def test_stop_returns_only_finished_accounts(tmp_path):
+    rows = [f"ACC-{i:03d},8000,A,50,625,," for i in range(20)] + [f"ACC-{i:03d},,B,50,28,," for i in range(20)]
+    accounts = read_accounts(write_accounts(tmp_path, rows))
+    results = solve_accounts(accounts, workers=1, should_stop=lambda: True)
+    assert len(results) < len(accounts)
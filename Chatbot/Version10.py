@@ -1,8 +1,8 @@
+# pip install requests aiohttp
 import subprocess
 import threading
 import tkinter as tk
 from tkinter import scrolledtext, font
-import requests
 import json
 import time
 from typing import List, Dict, Optional, Generator
@@ -10,6 +10,15 @@ from dataclasses import dataclass
 from datetime import datetime
 import sys
 import socket
+import os
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ollama_tools.async_client import AsyncOllamaClient
+from ollama_tools.client import get_client
+from ollama_tools.memory import ConversationMemory
+from ollama_tools.streaming import GenerationStream, TextStreamer
+from ollama_tools.timing import StageTimer
 
 @dataclass
 class ChatMessage:
@@ -21,6 +30,60 @@ class ChatMessage:
         if self.timestamp is None:
             self.timestamp = datetime.now()
 
+class LLMExpansion:
+    """Related questions written by the model (a full generation, so it runs beside the answer)."""
+    name = "llm"
+    local = False
+
+    def __init__(self, chatbot):
+        self.chatbot = chatbot
+
+    def expand(self, question: str) -> List[str]:
+        return self.chatbot.get_similar_questions(question)
+
+class KeywordExpansion:
+    """Related questions built from the question's key terms, without a model call."""
+    name = "keywords"
+    local = True
+    STOPWORDS = {"what", "which", "when", "where", "why", "how", "who", "whom", "does", "did", "the",
+                 "this", "that", "these", "those", "there", "their", "about", "with", "from", "into",
+                 "your", "have", "has", "been", "were", "will", "would", "could", "should", "can",
+                 "are", "is", "was", "for", "and", "but", "not", "you", "some", "any", "more", "most",
+                 "best", "tell", "explain", "describe", "please", "give", "make", "like", "between"}
+
+    def __init__(self, chatbot=None):
+        self.chatbot = chatbot
+
+    def key_terms(self, question: str, limit: int = 3) -> List[str]:
+        words = [w.strip(".,;:!?()[]\"'").lower() for w in question.split()]
+        terms = list(dict.fromkeys(w for w in words if len(w) > 3 and w not in self.STOPWORDS))
+        # Longer words tend to be the more specific ones
+        return sorted(terms, key=len, reverse=True)[:limit]
+
+    def expand(self, question: str) -> List[str]:
+        terms = self.key_terms(question)
+        if not terms:
+            return []
+        questions = [f"What are the key facts about {terms[0]}?"]
+        if len(terms) > 1:
+            questions.append(f"How does {terms[0]} relate to {terms[1]}?")
+        questions.append(f"What are common examples or pitfalls of {' '.join(terms[-2:])}?")
+        return questions[:3]
+
+class NoExpansion:
+    name = "none"
+    local = True
+
+    def __init__(self, chatbot=None):
+        pass
+
+    def expand(self, question: str) -> List[str]:
+        return []
+
+# Query expansion strategies by name; "local" ones are cheap enough to run before the answer
+# and go into its prompt, the others run while the answer streams and are appended when ready
+EXPANSION_STRATEGIES = {cls.name: cls for cls in (LLMExpansion, KeywordExpansion, NoExpansion)}
+
 class OllamaChatbot:
     def __init__(self, 
                  model: str = "llama2:latest",
@@ -28,58 +91,73 @@ class OllamaChatbot:
                  max_retries: int = 3,
                  retry_delay: int = 1,
                  temperature: float = 0.7,
-                 max_history: int = 10):
+                 max_history: int = 10,
+                 expansion: str = "llm",
+                 memory_tokens: int = 1024):
         self.model = model
         self.base_url = base_url.rstrip('/')
         self.max_retries = max_retries
         self.retry_delay = retry_delay
         self.temperature = temperature
         self.max_history = max_history
-        self.conversation_history: List[ChatMessage] = []
-        self.context = None  # Context array for maintaining conversation state
+        self.conversation_history = deque(maxlen=max_history)
+        # Follow-ups are prompted with recent messages and a summary of older ones (built in the
+        # background) instead of Ollama's ever-growing context array
+        self.memory = ConversationMemory(self.summarize_conversation, token_budget=memory_tokens,
+                                         max_messages=max(2 * max_history, 4))
+        self.ollama = get_client(self.base_url)  # pooled keep-alive connection shared by all requests
+        # Generations run on an asyncio loop thread: concurrent, retried with backoff and cancellable
+        self.async_client = AsyncOllamaClient(self.base_url, retries=max_retries, backoff=retry_delay,
+                                              keep_alive=self.ollama.keep_alive)
+        self.request_timeout = 120  # seconds for a non-streamed generation
+        self.set_expansion(expansion)
+        self.expansion_latency: Dict[str, List[float]] = {}  # strategy name -> seconds per call
         self.verify_setup()
 
     def verify_setup(self):
         try:
-            response = requests.get(f"{self.base_url}/api/tags")
-            if response.status_code != 200:
-                raise Exception(f"Server returned status code: {response.status_code}")
-            models_data = response.json().get("models", [])
-            self.available_models = sorted([model["name"] for model in models_data], reverse=True)  # Sort models in descending order
+            if not self.ollama.is_running():
+                raise Exception(f"No response from {self.base_url}")
+            self.available_models = sorted(self.ollama.list_models(refresh=True), reverse=True)  # Sort models in descending order
             if self.model not in self.available_models:
                 print(f"Warning: Model {self.model} not found in available models.")
                 print("Attempting to use default model llama2:latest")
                 self.model = "llama2:latest"
+            self.ollama.preload(self.model)
         except Exception as e:
             raise Exception(f"Failed to verify Ollama setup: {str(e)}")
 
     def query_ollama(self, 
                     prompt: str, 
-                    stream: bool = False,
                     context: List[int] = None) -> Optional[Dict]:
-        url = f"{self.base_url}/api/generate"
+        """Complete (non-streamed) response; None when it failed or was cancelled."""
         data = {
             "model": self.model,
             "prompt": prompt,
-            "stream": stream,
             "temperature": self.temperature
         }
         if context:
             data["context"] = context
-        for attempt in range(self.max_retries):
-            try:
-                response = requests.post(url, json=data)
-                response.raise_for_status()
-                return response.json()
-            except requests.exceptions.RequestException as e:
-                if attempt == self.max_retries - 1:
-                    print(f"Error after {self.max_retries} attempts: {e}")
-                    return None
-                print(f"Attempt {attempt + 1} failed. Retrying in {self.retry_delay} seconds...")
-                time.sleep(self.retry_delay)
+        try:
+            # Retried with exponential backoff on the loop thread; cancel_requests() aborts it
+            return self.async_client.run(self.async_client.generate(data, timeout=self.request_timeout))
+        except Exception as e:
+            print(f"Request failed: {e!r}")
+            return None
+
+    def stream_ollama(self, prompt: str, context: List[int] = None) -> GenerationStream:
+        """Start a streaming generation; tokens arrive on the returned stream's queue."""
+        data = {
+            "model": self.model,
+            "prompt": prompt,
+            "temperature": self.temperature
+        }
+        if context:
+            data["context"] = context
+        return self.async_client.stream(data)
 
     def _stream_response(self, url: str, data: Dict) -> Generator[str, None, None]:
-        with requests.post(url, json=data, stream=True) as response:
+        with self.ollama.session.post(url, json=data, stream=True, timeout=self.ollama.timeout) as response:
             response.raise_for_status()
             for line in response.iter_lines():
                 if line:
@@ -102,10 +180,40 @@ class OllamaChatbot:
             return similar_questions
         return []
 
+    def cancel_requests(self) -> int:
+        """Abort every generation in flight (answer, related questions, summary)."""
+        return self.async_client.cancel_all()
+
+    def set_expansion(self, name: str):
+        self.expansion = EXPANSION_STRATEGIES[name](self)
+
+    def expand_query(self, question: str, strategy=None) -> List[str]:
+        """Related questions from the current (or given) expansion strategy; its latency is recorded."""
+        strategy = strategy or self.expansion
+        started = time.perf_counter()
+        try:
+            return strategy.expand(question)
+        finally:
+            self.expansion_latency.setdefault(strategy.name, []).append(time.perf_counter() - started)
+
+    def expansion_summary(self) -> str:
+        return ", ".join(f"{name}: {len(times)} calls, avg {sum(times) / len(times) * 1000:.0f} ms"
+                         for name, times in self.expansion_latency.items()) or "no expansions yet"
+
     def get_comprehensive_response(self, 
                                  original_question: str, 
                                  similar_questions: List[str],
-                                 stream: bool = True) -> Optional[Dict]:
+                                 stream: bool = True):
+        """GenerationStream when stream is set, otherwise the complete response dict."""
+        if not similar_questions:
+            context_prompt = f"""Main question: {original_question}
+
+        Please provide a comprehensive response that:
+        1. Directly answers the main question
+        2. Covers closely related aspects a reader would likely ask about next
+        3. Maintains a coherent and well-structured flow
+        4. Provides specific examples where appropriate"""
+            return self.stream_ollama(context_prompt) if stream else self.query_ollama(context_prompt)
         context_prompt = f"""Consider the following main question and related questions:
 
         Main question: {original_question}
@@ -116,12 +224,35 @@ class OllamaChatbot:
         2. Incorporates relevant insights from the related questions
         3. Maintains a coherent and well-structured flow
         4. Provides specific examples where appropriate"""
-        return self.query_ollama(context_prompt, stream=stream)
+        if stream:
+            return self.stream_ollama(context_prompt)
+        return self.query_ollama(context_prompt)
+
+    def summarize_conversation(self, summary: str, transcript: str) -> str:
+        prompt = f"""Summarize the conversation below in a few sentences. Keep facts, names, numbers and
+        decisions the user may refer back to.
 
-    def add_to_history(self, role: str, content: str):
+        Earlier summary: {summary or "none"}
+
+        Conversation:
+        {transcript}
+
+        Summary:"""
+        response = self.query_ollama(prompt)
+        if not response:
+            raise Exception("No summary generated")
+        return response["response"]
+
+    def follow_up_prompt(self, question: str) -> str:
+        return self.memory.prompt(question)
+
+    def add_to_history(self, role: str, content: str, tokens: Optional[int] = None):
         self.conversation_history.append(ChatMessage(role=role, content=content))
-        if len(self.conversation_history) > self.max_history:
-            self.conversation_history = self.conversation_history[-self.max_history:]
+        self.memory.add(role, content, tokens)
+
+    def clear_history(self):
+        self.conversation_history.clear()
+        self.memory.clear()
 
 class ChatbotGUI:
     def __init__(self, master):
@@ -133,6 +264,10 @@ class ChatbotGUI:
         self.ollama_process = None
         self.is_processing = False
         self.stop_rendering = False  # Flag to stop rendering
+        self.active_stream = None  # GenerationStream being shown
+        self.query_id = 0  # results of an older query arriving late are ignored
+        self.related_questions = None  # from an expansion running beside the answer
+        self.answer_done = False
 
         self.create_widgets()
 
@@ -147,10 +282,20 @@ class ChatbotGUI:
         self.model_label.grid(row=0, column=0, sticky=tk.W, pady=5)
 
         self.model_var = tk.StringVar()
-        self.model_dropdown = tk.OptionMenu(self.frame, self.model_var, *self.chatbot.available_models)
+        # Picking a model starts loading it, so the first query does not wait for the load
+        self.model_dropdown = tk.OptionMenu(self.frame, self.model_var, *self.chatbot.available_models,
+                                            command=self.chatbot.ollama.preload)
         self.model_dropdown.grid(row=0, column=1, sticky=(tk.W, tk.E), pady=5)
         self.model_var.set(self.chatbot.model)
 
+        # How related questions are found
+        self.expansion_frame = tk.Frame(self.frame)
+        self.expansion_frame.grid(row=0, column=2, sticky=tk.E, pady=5)
+        tk.Label(self.expansion_frame, text="Expansion:", font=custom_font).pack(side=tk.LEFT)
+        self.expansion_var = tk.StringVar(value=self.chatbot.expansion.name)
+        tk.OptionMenu(self.expansion_frame, self.expansion_var, *EXPANSION_STRATEGIES,
+                      command=self.chatbot.set_expansion).pack(side=tk.LEFT)
+
         # Query input
         self.query_label = tk.Label(self.frame, text="Enter your query:", font=custom_font)
         self.query_label.grid(row=1, column=0, sticky=tk.W, pady=5)
@@ -226,51 +371,106 @@ class ChatbotGUI:
 
         self.is_processing = True
         self.stop_rendering = False  # Reset stop flag
-        threading.Thread(target=self._process_query_thread, args=(query,), daemon=True).start()
-
-    def _process_query_thread(self, query):
+        self.query_id += 1
+        self.related_questions = None
+        self.answer_done = False
+        self.expansion_info = ""
+        threading.Thread(target=self._process_query_thread, args=(query, self.query_id), daemon=True).start()
+
+    def _process_query_thread(self, query, query_id):
+        timer = StageTimer()
         try:
-            if not self.chatbot.context:
-                # First query: generate similar questions and comprehensive response
-                similar_questions = self.chatbot.get_similar_questions(query)
-                self.status_text.insert(tk.END, f"Generated {len(similar_questions)} similar questions:\n")
-                for i, q in enumerate(similar_questions, 1):
-                    self.status_text.insert(tk.END, f"{i}. {q}\n")
-                self.status_text.see(tk.END)
-                self.master.update_idletasks()
-
-                response = self.chatbot.get_comprehensive_response(query, similar_questions)
-            else:
-                # Follow-up query: use context from previous response
-                response = self.chatbot.query_ollama(query, context=self.chatbot.context)
-
-            if response:
-                self.response_text.delete("1.0", tk.END)
-                self.response_text.insert(tk.END, response["response"])
-                self.response_text.see(tk.END)
-                self.master.update_idletasks()
-
-                # Update context for the next query
-                self.chatbot.context = response.get("context", None)
-                self.status_text.insert(tk.END, "Context updated for follow-up queries.\n")
-                self.status_text.see(tk.END)
-
-                # Add to conversation history
-                self.chatbot.add_to_history("user", query)
-                self.chatbot.add_to_history("assistant", response["response"])
-            else:
-                self.status_text.insert(tk.END, "No response generated. Please try again.\n")
+            if len(self.chatbot.memory):
+                # Follow-up query: recent messages and the summary of older ones
+                stream = self.chatbot.stream_ollama(self.chatbot.follow_up_prompt(query))
+                self.master.after(0, self._show_stream, query, stream, timer)
+                return
+
+            strategy = self.chatbot.expansion
+            if strategy.local:
+                # Cheap expansion: its questions shape the answer's prompt
+                similar_questions = self._expand(query, strategy, timer)
+                self.master.after(0, self._show_similar_questions, similar_questions, query_id, False)
+                stream = self.chatbot.get_comprehensive_response(query, similar_questions)
+                self.master.after(0, self._show_stream, query, stream, timer)
+                return
+
+            # Model-written expansion: start the answer first and generate the questions alongside
+            stream = self.chatbot.get_comprehensive_response(query, [])
+            self.master.after(0, self._show_stream, query, stream, timer)
+            similar_questions = self._expand(query, strategy, timer)
+            self.master.after(0, self._show_similar_questions, similar_questions, query_id, True)
         except Exception as e:
-            self.status_text.insert(tk.END, f"Error: {str(e)}\n")
-        finally:
-            self.is_processing = False
-            self.status_text.insert(tk.END, "Processing complete.\n")
-            self.status_text.see(tk.END)
-            self.master.update_idletasks()
+            self.master.after(0, self._finish_query, f"Error: {str(e)}\n")
+
+    def _expand(self, query, strategy, timer):
+        with timer.stage("expansion"):
+            similar_questions = self.chatbot.expand_query(query, strategy)
+        self.expansion_info = f"{strategy.name}, {timer.stages['expansion'] * 1000:.0f} ms"
+        return similar_questions
+
+    def _show_similar_questions(self, similar_questions, query_id, append):
+        if query_id != self.query_id:
+            return
+        self.status_text.insert(tk.END, f"Generated {len(similar_questions)} similar questions "
+                                        f"({self.expansion_info}):\n")
+        for i, q in enumerate(similar_questions, 1):
+            self.status_text.insert(tk.END, f"{i}. {q}\n")
+        self.status_text.see(tk.END)
+        if append:
+            self.related_questions = similar_questions
+            if self.answer_done:
+                self._append_related_questions()
+
+    def _append_related_questions(self):
+        if self.related_questions:
+            self.response_text.insert(tk.END, "\n\nRelated questions:\n" +
+                                      "\n".join(f"- {q}" for q in self.related_questions))
+            self.response_text.see(tk.END)
+        self.related_questions = None
+
+    def _show_stream(self, query, stream, timer):
+        """Render the answer as it is generated (runs on the Tk thread)."""
+        self.active_stream = stream
+        self.response_text.delete("1.0", tk.END)
+        if self.stop_rendering:
+            stream.cancel()
+        TextStreamer(self.response_text, stream,
+                     on_done=lambda finished: self._stream_finished(query, finished, timer)).start()
+
+    def _stream_finished(self, query, stream, timer):
+        self.active_stream = None
+        timer.stop()
+        if stream.first_token_time is not None:
+            timer.stages["first token"] = stream.started - timer.started + stream.first_token_time
+        self.status_text.insert(tk.END, f"Timing: {timer.summary()}\n")
+        if stream.error:
+            self._finish_query(f"Error: {str(stream.error)}\n")
+        elif stream.cancelled:
+            self._finish_query("Response generation stopped.\n")
+        elif stream.text:
+            # Add to conversation history (the model's own token count when it reports one)
+            self.chatbot.add_to_history("user", query)
+            self.chatbot.add_to_history("assistant", stream.text,
+                                        stream.final.get("eval_count") if stream.final else None)
+            self.status_text.insert(tk.END, f"Context updated for follow-up queries ({self.chatbot.memory.stats()}).\n")
+            self.answer_done = True
+            self._append_related_questions()
+            self._finish_query()
+        else:
+            self._finish_query("No response generated. Please try again.\n")
+
+    def _finish_query(self, message=""):
+        self.is_processing = False
+        self.status_text.insert(tk.END, message + "Processing complete.\n")
+        self.status_text.see(tk.END)
 
     def stop_rendering_response(self):
-        """Stop rendering the response in the Response text widget."""
+        """Stop generating the response and any related questions; their connections to Ollama are closed."""
         self.stop_rendering = True
+        if self.active_stream:
+            self.active_stream.cancel()
+        self.chatbot.cancel_requests()
         self.status_text.insert(tk.END, "Response rendering stopped by user.\n")
         self.status_text.see(tk.END)
 
@@ -279,8 +479,8 @@ class ChatbotGUI:
         self.followup_entry.delete("1.0", tk.END)
         self.status_text.delete("1.0", tk.END)
         self.response_text.delete("1.0", tk.END)
-        self.chatbot.context = None  # Reset context
-        self.chatbot.conversation_history.clear()  # Clear conversation history
+        self.chatbot.cancel_requests()  # Nothing still generating belongs to the new conversation
+        self.chatbot.clear_history()  # Clear conversation history and its summary
 
     def save_output(self):
         with open("chatbot_output.txt", "w") as f:
@@ -300,12 +500,14 @@ class ChatbotGUI:
             self.status_text.insert(tk.END, "Connection test successful. Ollama is running and accessible.\n")
             self.status_text.insert(tk.END, f"Available models: {', '.join(self.chatbot.available_models)}\n")
             self.status_text.insert(tk.END, f"Current model: {self.chatbot.model}\n")
+            self.status_text.insert(tk.END, f"Expansion latency: {self.chatbot.expansion_summary()}\n")
             self.status_text.insert(tk.END, f"Ollama server URL: {self.chatbot.base_url}\n")
         except Exception as e:
             self.status_text.insert(tk.END, f"Connection test failed: {str(e)}\n")
         self.status_text.see(tk.END)
 
     def exit_application(self):
+        self.chatbot.async_client.close()
         if self.ollama_process:
             self.ollama_process.terminate()
             self.ollama_process.wait()
@@ -322,7 +524,7 @@ def start_ollama_serve():
             print("Ollama server is already running.")
             return None
         process = subprocess.Popen(["ollama", "serve"])
-        time.sleep(5)  # Give Ollama some time to start
+        get_client().wait_until_ready(attempts=10)  # Poll until the server answers (up to ~10s)
         return process
     except Exception as e:
         print(f"Error starting Ollama: {e}")
@@ -11,12 +11,19 @@ from datetime import datetime
 import sys
 import socket
 import os
-from langchain.document_loaders import PyPDFLoader, Docx2txtLoader, UnstructuredExcelLoader
+from langchain.document_loaders import PyPDFLoader
+from langchain.schema import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.embeddings import HuggingFaceEmbeddings
 from langchain.vectorstores import Chroma
-from langchain.chains import RetrievalQA
-from langchain.chains.llm import Runnable
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ollama_tools.chunking import TextChunker
+from ollama_tools.client import get_client
+from ollama_tools.context_budget import ContextAssembler, context_budget, estimate_tokens
+from ollama_tools.embedding_cache import EmbeddingCache
+from ollama_tools.extractors import file_segments
+from ollama_tools.timing import StageTimer
 
 
 @dataclass
@@ -47,6 +54,13 @@ class OllamaChatbot:
         self.conversation_history: List[ChatMessage] = []
         self.context = None  # Context array for maintaining conversation state
         self.vector_db = None  # Vector database for RAG
+        self.embeddings = None
+        self.query_embeddings = None  # EmbeddingCache around self.embeddings
+        self.top_k = 4
+        self.last_timings = None  # StageTimer of the last RAG query
+        self.context_assembler = ContextAssembler()
+        self.last_context = None  # AssembledContext of the last RAG query
+        self.last_prompt_tokens = 0
         self.verify_setup()
 
     def verify_setup(self):
@@ -139,28 +153,31 @@ class OllamaChatbot:
     def load_files(self, file_paths: List[str]):
         """Load and process files into a vector database."""
         documents = []
+        streamed = []
+        chunker = TextChunker(chunk_size=1000, overlap=200)
         for file_path in file_paths:
             if file_path.endswith(".pdf"):
-                loader = PyPDFLoader(file_path)
-            elif file_path.endswith(".docx"):
-                loader = Docx2txtLoader(file_path)
-            elif file_path.endswith(".xlsx"):
-                loader = UnstructuredExcelLoader(file_path)
+                documents.extend(PyPDFLoader(file_path).load())
+            elif file_path.endswith((".docx", ".xlsx")):
+                # Word paragraphs and Excel rows are streamed straight into the chunker
+                streamed.extend(Document(page_content=text, metadata=dict(metadata, source=file_path))
+                                for text, metadata in chunker.stream(file_segments(file_path)))
             else:
                 print(f"Unsupported file type: {file_path}")
                 continue
-            documents.extend(loader.load())
 
         # Split documents into chunks
         text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-        texts = text_splitter.split_documents(documents)
+        texts = text_splitter.split_documents(documents) + streamed
 
-        # Create embeddings and vector database
-        embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+        # Create embeddings (loaded once, also used to embed queries) and vector database
+        if self.embeddings is None:
+            self.embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+            self.query_embeddings = EmbeddingCache(self.embeddings, "sentence-transformers/all-MiniLM-L6-v2")
 
         # Check if vector_db already exists
         if self.vector_db is None:
-            self.vector_db = Chroma.from_documents(texts, embeddings)
+            self.vector_db = Chroma.from_documents(texts, self.embeddings)
         else:
             # If it exists, add the new documents to the existing database
             self.vector_db.add_documents(texts)
@@ -170,37 +187,43 @@ class OllamaChatbot:
         if not self.vector_db:
             return None
 
-        docs = self.vector_db.as_retriever().get_relevant_documents(query)
+        # Retrieve once and pass the documents straight to the prompt
+        timer = StageTimer()
+        self.last_timings = timer
+        with timer.stage("embed query"):
+            query_vector = self.query_embeddings.embed_query(query)
+        with timer.stage("search"):
+            docs = self.vector_db.similarity_search_by_vector(query_vector, k=self.top_k)
 
         if not docs:
             return "No relevant documents found for your query."
 
-        context = "\n".join([doc.page_content for doc in docs])
+        with timer.stage("prompt build"):
+            # Overlapping chunks are merged and the rest trimmed to the model's budget
+            budget = context_budget(self.model, client=get_client(self.base_url))
+            assembled = self.context_assembler.assemble(
+                query, [(doc.page_content, doc.metadata) for doc in docs], budget)
+            self.last_context = assembled
+            context = "\n".join(text for text, _ in assembled.passages)
 
-        # Modify the prompt to list file names and find common recommendations
-        prompt = f"""You have the following files loaded: {', '.join([os.path.basename(fp) for fp in file_paths])}\n\n
+            # Modify the prompt to list file names and find common recommendations
+            prompt = f"""You have the following files loaded: {', '.join([os.path.basename(fp) for fp in file_paths])}\n\n
         The content of these files is:\n\n{context}\n\n
         Please provide a list of the uploaded files and then identify and list any common recommendations found across all the documents."""
+            self.last_prompt_tokens = estimate_tokens(prompt)
 
-        class OllamaRunnable(Runnable):
-            def __init__(self, chatbot, prompt):
-                self.chatbot = chatbot
-                self.prompt = prompt
-
-            def run(self):
-                response = self.chatbot.query_ollama(self.prompt)
-                return response["response"]
-
-            def invoke(self, *args, **kwargs):
-                return self.run()
-
-        qa_chain = RetrievalQA.from_chain_type(
-            llm=OllamaRunnable(self, prompt),
-            chain_type="stuff",
-            retriever=self.vector_db.as_retriever()
-        )
-        result = qa_chain.run(query)
-        return result
+        data = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": True,
+            "temperature": self.temperature
+        }
+        parts = []
+        for part in self._stream_response(f"{self.base_url}/api/generate", data):
+            timer.mark("first token")
+            parts.append(part)
+        timer.stop()
+        return "".join(parts)
 
 
 class ChatbotGUI:
@@ -368,6 +391,12 @@ class ChatbotGUI:
                 self.response_text.delete("1.0", tk.END)
                 self.response_text.insert(tk.END, response)
                 self.response_text.see(tk.END)
+            if self.file_paths and self.chatbot.last_timings:
+                self.status_text.insert(tk.END, f"Timing: {self.chatbot.last_timings.summary()}\n")
+                if self.chatbot.last_context:
+                    self.status_text.insert(tk.END, f"Prompt: ~{self.chatbot.last_prompt_tokens} tokens, "
+                                                    f"{self.chatbot.last_context.summary()}\n")
+                self.status_text.see(tk.END)
         except Exception as e:
             self.status_text.insert(tk.END, f"Error processing query: {e}\n")
             self.status_text.see(tk.END)
@@ -1,7 +1,8 @@
-# pip install chromadb ollama pypdf2 python-docx openpyxl tk tqdm requests
+# pip install chromadb pypdf openpyxl tk tqdm requests
 
 import os
 import subprocess
+import sys
 import threading
 import time
 import uuid
@@ -11,13 +12,33 @@ from tkinter import filedialog, messagebox, ttk
 from typing import Generator, List, Optional
 
 import chromadb
-import ollama
+from chromadb.utils import embedding_functions
 import requests
-from docx import Document
-from openpyxl import load_workbook
-from pypdf import PdfReader
 from tqdm import tqdm
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ollama_tools.answer_cache import AnswerCache, cache_scope
+from ollama_tools.bm25 import BM25Index, hybrid_search
+from ollama_tools.chunking import TextChunker
+from ollama_tools.embedding_cache import EmbeddingCache
+from ollama_tools.extractors import file_segments
+from ollama_tools.ingest import BatchWriter
+from ollama_tools.registry import DocumentRegistry
+from ollama_tools.streaming import GenerationStream, TextStreamer
+
+CHROMA_PATH = "chroma_db"
+REGISTRY_PATH = os.path.join(CHROMA_PATH, "registry.json")
+LEXICAL_INDEX_PATH = os.path.join(CHROMA_PATH, "bm25.json")
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 150
+INSERT_BATCH_SIZE = 128
+TOP_K = 5
+CANDIDATES = 20  # per ranking (vector, keyword) before fusion
+# Bump when the way files are turned into documents changes, so the database is rebuilt
+INDEX_PARAMS = {"documents": "chunks", "chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP,
+                "extraction": "streaming", "embedding": "chroma-default"}
+SYSTEM_PROMPT = "You are a helpful assistant. Base your answers strictly on the provided context."
+
 class RAGApplication:
     def __init__(self, root):
         self.root = root
@@ -27,11 +48,18 @@ class RAGApplication:
         self.llm_options = []
         self.current_llm = "llama2:latest"
         self.base_url = "http://localhost:11434"
-        self.chroma_client = chromadb.PersistentClient(path="chroma_db")
+        self.chroma_client = chromadb.PersistentClient(path=CHROMA_PATH)
+        # Chroma's default model, held here so queries can be embedded once and reused
+        self.embedding_function = embedding_functions.DefaultEmbeddingFunction()
+        self.query_embedder = EmbeddingCache(self.embedding_function, "chroma-default",
+                                             path=os.path.join(CHROMA_PATH, "query_embeddings.sqlite"))
+        self.chunker = TextChunker(CHUNK_SIZE, CHUNK_OVERLAP)
+        self.answer_cache = AnswerCache(os.path.join(CHROMA_PATH, "answer_cache.json"))
         self.processing = False
         self.ollama_process = None
         self.uploaded_documents = []
         self.existing_ids = set()
+        self.active_stream = None  # GenerationStream of the running query
 
         self.create_widgets()
         self.initialize_chroma()
@@ -81,6 +109,9 @@ class RAGApplication:
         self.clear_btn = Button(button_frame, text="Clear Output", command=self.clear_output)
         self.clear_btn.pack(side=LEFT, padx=5)
         
+        self.stop_btn = Button(button_frame, text="Stop", command=self.stop_query, bg="pink")
+        self.stop_btn.pack(side=LEFT, padx=5)
+        
         self.exit_btn = Button(button_frame, text="Exit", command=self.cleanup_and_exit, bg="orange", width=10)
         self.exit_btn.pack(side=RIGHT, padx=5)
 
@@ -137,18 +168,44 @@ class RAGApplication:
             self.llm_combobox['values'] = []
             self.llm_combobox.set('')
 
-    def initialize_chroma(self):
-        try:
-            self.chroma_client.delete_collection(name="docs")
-            self.update_output("Cleared previous database entries\n\nYou can upload PDF, Word, Or Excel files\n")
-        except Exception as e:
-            self.update_output("No existing database found")
-        
+    def initialize_chroma(self, reset=False):
+        # The database is kept between sessions; the registry remembers which file versions it holds
+        self.registry = DocumentRegistry(REGISTRY_PATH, INDEX_PARAMS)
+        # Keyword index over the same chunks, for exact terms (codes, names) embeddings miss
+        self.lexical_index = BM25Index(LEXICAL_INDEX_PATH)
         try:
-            self.collection = self.chroma_client.create_collection(name="docs")
-            self.update_output("Initialized new database")
-            self.uploaded_documents.clear()
-            self.existing_ids.clear()
+            self.collection = self.chroma_client.get_or_create_collection(name="docs", embedding_function=self.embedding_function)
+            if reset or self.registry.params_changed or (not len(self.registry) and self.collection.count()):
+                self.chroma_client.delete_collection(name="docs")
+                self.collection = self.chroma_client.create_collection(name="docs", embedding_function=self.embedding_function)
+                self.registry.clear()
+                self.lexical_index.clear()
+                if reset:
+                    self.update_output("Cleared previous database entries")
+                else:
+                    self.update_output("Document splitting settings changed - please upload your documents again")
+
+            # Files deleted from disk since the last session are dropped from the database
+            removed = self.registry.plan([], prune=False)["removed"]
+            for file_path in removed:
+                self.collection.delete(ids=self.registry.ids(file_path))
+                self.lexical_index.remove(self.registry.ids(file_path))
+                self.registry.forget(file_path)
+            if not len(self.lexical_index) and self.collection.count():
+                stored = self.collection.get(include=["documents", "metadatas"])
+                self.lexical_index.add(stored["ids"], stored["documents"],
+                                       [(meta or {}).get("source") for meta in stored["metadatas"]])
+            self.registry.save()
+            self.lexical_index.save()
+
+            self.uploaded_documents[:] = self.registry.paths()
+            self.existing_ids = {doc_id for path in self.uploaded_documents for doc_id in self.registry.ids(path)}
+            if self.uploaded_documents:
+                self.update_output(f"Loaded database with {len(self.uploaded_documents)} documents"
+                                   + (f" ({len(removed)} missing files removed)" if removed else ""))
+            else:
+                self.update_output("Initialized new database")
+            self.update_output("\nYou can upload PDF, Word, Or Excel files\n")
         except Exception as e:
             self.update_output(f"Database initialization failed: {str(e)}")
             raise
@@ -165,60 +222,74 @@ class RAGApplication:
         )
         
         if file_paths:
-            documents = []
-            metadatas = []
-            ids = []
-            
             try:
-                self.update_output(f"Processing {len(file_paths)} new files...")
+                self.update_output(f"Processing {len(file_paths)} files...")
                 self.progress.start()
                 
-                for file_path in tqdm(file_paths, desc="Processing files"):
-                    if file_path in self.uploaded_documents:
-                        self.update_output(f"Skipping duplicate: {os.path.basename(file_path)}")
+                plan = self.registry.plan(file_paths, prune=False)
+                for file_path in plan["unchanged"]:
+                    self.update_output(f"Skipping unchanged: {os.path.basename(file_path)}")
+                
+                added = 0
+                total_chunks = 0
+                for file_path in tqdm(plan["new"] + plan["changed"], desc="Processing files"):
+                    if file_path in self.registry:
+                        self.update_output(f"Re-indexing changed file: {os.path.basename(file_path)}")
+                        self.existing_ids.difference_update(self.registry.ids(file_path))
+                    ids = self.index_file(file_path)
+                    if not ids:
                         continue
-                        
-                    content = self.read_file(file_path)
-                    if content:
-                        doc_id = str(uuid.uuid4())
-                        documents.append(content)
-                        metadatas.append({"source": file_path})
-                        ids.append(doc_id)
+                    self.registry.record(file_path, ids)
+                    if file_path not in self.uploaded_documents:
                         self.uploaded_documents.append(file_path)
-                        self.existing_ids.add(doc_id)
+                    self.existing_ids.update(ids)
+                    added += 1
+                    total_chunks += len(ids)
                 
-                if documents:
-                    self.collection.add(
-                        documents=documents,
-                        metadatas=metadatas,
-                        ids=ids
-                    )
-                    self.update_output(f"Added {len(documents)} new documents")
-                    self.update_output(f"Total documents in session: {len(self.uploaded_documents)}")
+                self.registry.save()
+                self.lexical_index.save()
+                if added:
+                    self.update_output(f"Added {added} new documents ({total_chunks} chunks)")
+                self.update_output(f"Total documents in session: {len(self.uploaded_documents)}")
             except Exception as e:
                 self.update_output(f"Error during ingestion: {str(e)}")
             finally:
                 self.progress.stop()
                 self.set_processing(False)
+        else:
+            self.set_processing(False)
 
-    def read_file(self, file_path):
+    def index_file(self, file_path):
+        """Chunk a file into the collection; returns the chunk ids (empty on failure)."""
+        # Old versions and leftovers of an interrupted upload go first
+        self.collection.delete(where={"source": file_path})
+        self.lexical_index.remove_source(file_path)
+        doc_id = str(uuid.uuid4())
+        ids = []
         try:
-            if file_path.endswith('.pdf'):
-                reader = PdfReader(file_path)
-                return "\n".join([page.extract_text() for page in reader.pages])
-            elif file_path.endswith('.docx'):
-                doc = Document(file_path)
-                return "\n".join([para.text for para in doc.paragraphs])
-            elif file_path.endswith('.xlsx'):
-                wb = load_workbook(file_path)
-                text_content = []
-                for sheet in wb.worksheets:
-                    for row in sheet.iter_rows(values_only=True):
-                        text_content.extend([str(cell) for cell in row if cell is not None])
-                return "\n".join(text_content)
+            with BatchWriter(self.collection, batch_size=INSERT_BATCH_SIZE) as writer:
+                for chunk, metadata in self.chunker.stream(file_segments(file_path)):
+                    metadata["source"] = file_path
+                    chunk_id = f"{doc_id}:{metadata['chunk']}"
+                    writer.add(chunk, metadata, chunk_id)
+                    self.lexical_index.add([chunk_id], [chunk], [file_path])
+                    ids.append(chunk_id)
         except Exception as e:
             self.update_output(f"Error reading {os.path.basename(file_path)}: {str(e)}")
-            return None
+            self.collection.delete(where={"source": file_path})
+            self.lexical_index.remove_source(file_path)
+            self.forget_file(file_path)
+            return []
+        if not ids:
+            self.update_output(f"No text found in {os.path.basename(file_path)}")
+            self.forget_file(file_path)
+        return ids
+
+    def forget_file(self, file_path):
+        """Drop a file whose chunks are gone (e.g. a changed file that failed to re-index)."""
+        self.registry.forget(file_path)
+        if file_path in self.uploaded_documents:
+            self.uploaded_documents.remove(file_path)
 
     def display_uploaded_documents(self):
         self.update_output("\nUploaded Documents:")
@@ -252,25 +323,61 @@ class RAGApplication:
         self.update_output(f"Processing your query using {self.current_llm}... (This may take a moment)")
         
         try:
-            results = self.collection.query(
-                query_texts=[query],
-                n_results=min(3, len(self.uploaded_documents)))
-            
-            context = "\n\n".join(results['documents'][0])
+            n_results = min(TOP_K, self.collection.count())
+            scope = cache_scope(index=self.registry.version, model=self.current_llm, n_results=n_results,
+                                retrieval="hybrid", system=SYSTEM_PROMPT)
+            vector = None
+            cached = self.answer_cache.get(scope, query)
+            if cached is None:
+                vector = self.query_embedder.embed_query(query)
+                cached = self.answer_cache.get(scope, query, vector)
+            if cached is not None:
+                note = "" if "similarity" not in cached else f", similar to: {cached['query']}"
+                self.update_output(f"\nResponse ({self.current_llm}, cached{note}):\n{cached['answer']}")
+                self.update_output(self.answer_cache.summary())
+                self.set_processing(False)
+                return
+
+            # Vector and keyword rankings fused by rank
+            results = hybrid_search(self.collection, self.lexical_index, query, vector,
+                                    k=n_results, candidates=CANDIDATES)
             
-            response = ollama.generate(
-                model=self.current_llm,
-                prompt=f"Context: {context}\n\nQuestion: {query}\nAnswer:",
-                system="You are a helpful assistant. Base your answers strictly on the provided context.",
-                stream=False
-            )
+            # Only the matching passages go into the prompt, labelled with where they came from
+            context = "\n\n".join(
+                f"[{os.path.basename(meta.get('source', ''))}{', page ' + str(meta['page']) if 'page' in meta else ''}]\n{doc}"
+                for doc, meta in zip(results['documents'], results['metadatas']))
             
-            self.update_output(f"\nResponse ({self.current_llm}):\n{response['response']}")
+            # Tokens are shown as they arrive; Stop aborts the request
+            stream = GenerationStream({
+                "model": self.current_llm,
+                "prompt": f"Context: {context}\n\nQuestion: {query}\nAnswer:",
+                "system": SYSTEM_PROMPT
+            }, host=self.base_url)
+            self.active_stream = stream.start()
+            self.update_output(f"\nResponse ({self.current_llm}):")
+            done = lambda finished: self.on_stream_done(finished, scope, query, vector)
+            self.root.after(0, lambda: TextStreamer(self.output_text, stream, on_done=done).start())
         except Exception as e:
             self.update_output(f"Error processing query: {str(e)}")
-        finally:
             self.set_processing(False)
 
+    def on_stream_done(self, stream, scope, query, vector):
+        self.active_stream = None
+        if stream.error:
+            self.update_output(f"\nError processing query: {str(stream.error)}")
+        elif stream.cancelled:
+            self.update_output("\n[Response stopped]")
+        else:
+            self.update_output("")
+            if stream.text.strip():
+                self.answer_cache.put(scope, query, stream.text, vector)
+            self.update_output(self.answer_cache.summary())
+        self.set_processing(False)
+
+    def stop_query(self):
+        if self.active_stream:
+            self.active_stream.cancel()
+
     def update_output(self, message):
         def safe_update():
             self.output_text.config(state=NORMAL)
@@ -358,7 +465,7 @@ class RAGApplication:
     def reset_system(self):
         self.set_processing(True)
         self.update_output("Initializing new session...")
-        self.initialize_chroma()
+        self.initialize_chroma(reset=True)
         self.initialize_models()
         self.update_output("System reset completed")
         self.set_processing(False)
@@ -0,0 +1,3 @@
+# Shared helpers for the Ollama based apps (AI-RAG-PDF, ChatbotWithRAG, NewChatbotRAG, Chatbot)
+# The apps add the repository root to sys.path and import from here, e.g.
+#   from ollama_tools.embeddings import OllamaEmbedder
@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# Cache of finished RAG answers, so a repeated question skips retrieval and generation
+
+
+def normalize_query(text):
+    """Case- and whitespace-insensitive form of a query, used as the exact-match key."""
+    return " ".join(str(text).lower().split())
+
+
+def cache_scope(**parts):
+    """
+    Key for everything an answer depends on besides the question: index version, model,
+    temperature, top k, prompt... Answers are only ever reused within the same scope.
+    """
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+class AnswerCache:
+    """
+    Two-tier answer cache: exact (normalized) query text first, then the most similar cached
+    query embedding in the same scope, if its cosine similarity reaches threshold.
+
+    Entries expire after ttl seconds and the least recently used are evicted past
+    max_entries. With a path, the cache is loaded from and saved to a JSON file. stats holds
+    exact/semantic hit and miss counts.
+    """
+
+    def __init__(self, path=None, max_entries=512, ttl=7 * 24 * 3600, threshold=0.92):
+        self.path = path
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = ttl
+        self.threshold = threshold
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0}
+        self._entries = OrderedDict()
+        self._matrices = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self._load()
+
+    def get(self, scope, query, embedding=None):
+        """
+        Cached entry for query, or None. Without an embedding only the exact tier is checked
+        (and a miss is not counted, so the caller can retry with one).
+
+        The entry is a dict with answer, sources, query, created, hits and, for semantic hits,
+        the similarity.
+        """
+        with self._lock:
+            self._expire()
+            key = self._key(scope, query)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.stats["exact_hits"] += 1
+                return self._hit(key, entry)
+            if embedding is None:
+                return None
+
+            match = self._nearest(scope, embedding)
+            if match is not None:
+                key, similarity = match
+                self.stats["semantic_hits"] += 1
+                return dict(self._hit(key, self._entries[key]), similarity=similarity)
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, scope, query, answer, embedding=None, sources=None):
+        with self._lock:
+            key = self._key(scope, query)
+            self._entries.pop(key, None)
+            self._entries[key] = {
+                "scope": scope,
+                "query": query,
+                "answer": answer,
+                "sources": sources or [],
+                "embedding": self._unit(embedding).tolist() if embedding is not None else None,
+                "created": time.time(),
+                "hits": 0
+            }
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrices.clear()
+        if self.path:
+            self.save()
+
+    def invalidate(self, scope=None):
+        """Drop every entry, or only those of one scope."""
+        with self._lock:
+            for key in [k for k, e in self._entries.items() if scope is None or e["scope"] == scope]:
+                del self._entries[key]
+            self._matrices.clear()
+        if self.path:
+            self.save()
+
+    def hit_rate(self):
+        hits = self.stats["exact_hits"] + self.stats["semantic_hits"]
+        lookups = hits + self.stats["misses"]
+        return hits / lookups if lookups else 0.0
+
+    def summary(self):
+        s = self.stats
+        return (f"answer cache: {s['exact_hits']} exact + {s['semantic_hits']} semantic hits, "
+                f"{s['misses']} misses ({self.hit_rate():.0%} hit rate), {len(self._entries)} entries")
+
+    def save(self):
+        with self._lock:
+            data = {"entries": list(self._entries.values())}
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(temp_path, self.path)
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                entries = json.load(f).get("entries", [])
+        except (OSError, ValueError):
+            return
+        for entry in entries:
+            self._entries[self._key(entry["scope"], entry["query"])] = entry
+        self._expire()
+
+    def _key(self, scope, query):
+        return f"{scope}:{normalize_query(query)}"
+
+    def _hit(self, key, entry):
+        entry["hits"] += 1
+        self._entries.move_to_end(key)
+        return dict(entry)
+
+    def _expire(self):
+        if not self.ttl:
+            return
+        cutoff = time.time() - self.ttl
+        expired = [k for k, e in self._entries.items() if e["created"] < cutoff]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._matrices.clear()
+
+    @staticmethod
+    def _unit(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _nearest(self, scope, embedding):
+        # One matrix of unit vectors per scope, rebuilt only after the entries change
+        if scope not in self._matrices:
+            keys = [k for k, e in self._entries.items() if e["scope"] == scope and e["embedding"] is not None]
+            matrix = np.array([self._entries[k]["embedding"] for k in keys], dtype=np.float32) if keys else None
+            self._matrices[scope] = (keys, matrix)
+        keys, matrix = self._matrices[scope]
+        if matrix is None or matrix.shape[1] != len(embedding):
+            return None
+        similarities = matrix @ self._unit(embedding)
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold or keys[best] not in self._entries:
+            return None
+        return keys[best], float(similarities[best])
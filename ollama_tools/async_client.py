@@ -0,0 +1,246 @@
+import asyncio
+import random
+import threading
+import time
+from concurrent.futures import CancelledError
+
+import aiohttp
+
+from .embeddings import DEFAULT_HOST
+from .streaming import GenerationStream
+
+# pip install aiohttp
+# Ollama requests on an asyncio event loop in its own thread, for Tk apps: any number of requests
+# run concurrently, each with its own timeout, retried with exponential backoff, and cancelling
+# one closes its connection so Ollama stops generating right away
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class EventLoopThread:
+    """An asyncio event loop running forever on a daemon thread."""
+
+    def __init__(self, name="ollama-async"):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coroutine):
+        """Schedule a coroutine from any thread; returns a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=2)
+
+
+class RetryableStatus(Exception):
+    def __init__(self, status, message):
+        super().__init__(f"HTTP {status}: {message}")
+        self.status = status
+
+
+class AsyncOllamaClient:
+    """
+    Ollama HTTP API over aiohttp, driven from ordinary (e.g. Tk) threads.
+
+    submit(coroutine) runs one of the async methods (generate, list_models, ...) on the loop
+    thread and returns a concurrent Future; when_done() brings its result back to the Tk
+    thread. stream() returns a GenerationStream-compatible object, so TextStreamer can show it,
+    whose cancel() aborts the request. Connection errors, timeouts and 429/5xx answers are
+    retried up to retries times, waiting backoff * 2**attempt seconds (with jitter, at most
+    max_backoff); a stream is only retried before its first token.
+    """
+
+    def __init__(self, host=DEFAULT_HOST, retries=3, backoff=0.5, max_backoff=8.0, connect_timeout=10,
+                 read_timeout=300, max_connections=8, keep_alive="30m", loop_thread=None):
+        self.host = host.rstrip("/")
+        self.retries = max(1, int(retries))
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_connections = max_connections
+        self.keep_alive = keep_alive
+        self.loop_thread = loop_thread or EventLoopThread()
+        self._session = None
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+
+    # Called from any thread
+
+    def submit(self, coroutine):
+        """Run a coroutine of this client on the loop thread; cancel_all() can abort it."""
+        future = self.loop_thread.submit(coroutine)
+        with self._pending_lock:
+            self._pending.add(future)
+        future.add_done_callback(self._forget)
+        return future
+
+    def run(self, coroutine, timeout=None):
+        """Blocking call for worker threads: submit() and wait for the result."""
+        return self.submit(coroutine).result(timeout)
+
+    def stream(self, payload, endpoint="/api/generate", timeout=None, on_token=None, on_done=None):
+        """A started AsyncGenerationStream."""
+        payload = dict(payload)
+        payload.setdefault("keep_alive", self.keep_alive)
+        return AsyncGenerationStream(self, payload, endpoint, timeout, on_token, on_done).start()
+
+    def cancel_all(self):
+        """Abort every request still in flight (streams end as cancelled)."""
+        with self._pending_lock:
+            pending = list(self._pending)
+        for future in pending:
+            future.cancel()
+        return len(pending)
+
+    def close(self):
+        self.cancel_all()
+        if self._session is not None:
+            self.loop_thread.submit(self._session.close()).result(timeout=5)
+        self.loop_thread.stop()
+
+    def _forget(self, future):
+        with self._pending_lock:
+            self._pending.discard(future)
+
+    # Coroutines (run on the loop thread)
+
+    async def generate(self, payload, timeout=120):
+        """Non-streamed /api/generate; returns the response JSON."""
+        payload = dict(payload, stream=False)
+        payload.setdefault("keep_alive", self.keep_alive)
+        return await self.request("POST", "/api/generate", payload, timeout)
+
+    async def chat(self, payload, timeout=120):
+        payload = dict(payload, stream=False)
+        payload.setdefault("keep_alive", self.keep_alive)
+        return await self.request("POST", "/api/chat", payload, timeout)
+
+    async def list_models(self, timeout=10):
+        data = await self.request("GET", "/api/tags", timeout=timeout)
+        return sorted((model["name"] for model in data.get("models", [])), key=str.lower)
+
+    async def is_running(self, timeout=2):
+        try:
+            await self.request("GET", "/api/version", timeout=timeout, retries=1)
+            return True
+        except Exception:
+            return False
+
+    async def gather(self, *coroutines):
+        """Run coroutines concurrently; results (or exceptions) in order."""
+        return await asyncio.gather(*coroutines, return_exceptions=True)
+
+    async def request(self, method, endpoint, payload=None, timeout=120, retries=None):
+        """JSON request with per-request timeout and retries."""
+        session = self._get_session()
+        client_timeout = aiohttp.ClientTimeout(total=timeout, connect=self.connect_timeout)
+        retries = retries or self.retries
+        for attempt in range(retries):
+            try:
+                async with session.request(method, self.host + endpoint, json=payload,
+                                           timeout=client_timeout) as response:
+                    if response.status in RETRY_STATUSES:
+                        raise RetryableStatus(response.status, await response.text())
+                    response.raise_for_status()
+                    return await response.json(content_type=None)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError, RetryableStatus):
+                if attempt == retries - 1:
+                    raise
+                await asyncio.sleep(self.retry_delay(attempt))
+
+    def retry_delay(self, attempt):
+        return min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.max_connections))
+        return self._session
+
+
+class AsyncGenerationStream(GenerationStream):
+    """GenerationStream read on the client's event loop instead of a thread of its own."""
+
+    def __init__(self, client, payload, endpoint="/api/generate", timeout=None, on_token=None, on_done=None):
+        super().__init__(payload, host=client.host, endpoint=endpoint, on_token=on_token, on_done=on_done,
+                         timeout=timeout or client.read_timeout)
+        self.client = client
+        self._future = None
+        self._ended = False
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._future = self.client.submit(self._run_async())
+        self._future.add_done_callback(self._on_future_done)
+        return self
+
+    def _on_future_done(self, future):
+        # Cancelled (possibly before the task even started): end the stream now
+        if future.cancelled():
+            self.cancelled = True
+            self._finish()
+
+    def _finish(self):
+        with self._lock:
+            if self._ended:
+                return
+            self._ended = True
+        super()._finish()
+
+    def cancel(self):
+        """Abort the request: the task is cancelled and its connection closed."""
+        with self._lock:
+            self.cancelled = True
+        if self._future is not None:
+            self._future.cancel()
+
+    async def _run_async(self):
+        client = self.client
+        # No total limit for a stream; the read timeout applies between chunks
+        timeout = aiohttp.ClientTimeout(total=None, connect=client.connect_timeout, sock_read=self.timeout)
+        try:
+            for attempt in range(client.retries):
+                try:
+                    await self._read(client._get_session(), timeout)
+                    return
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError, RetryableStatus):
+                    if self._parts or attempt == client.retries - 1:
+                        raise
+                    await asyncio.sleep(client.retry_delay(attempt))
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        except Exception as e:
+            if not self.cancelled:
+                self.error = e
+        finally:
+            self._finish()
+
+    async def _read(self, session, timeout):
+        async with session.post(self.url, json=self.payload, timeout=timeout) as response:
+            if response.status in RETRY_STATUSES:
+                raise RetryableStatus(response.status, await response.text())
+            response.raise_for_status()
+            async for line in response.content:
+                line = line.strip()
+                if line and self._receive(line):
+                    return
+
+
+def when_done(widget, future, callback, interval_ms=30):
+    """Call callback(result, error) on the Tk thread once a submitted request has finished."""
+    def poll():
+        if not future.done():
+            widget.after(interval_ms, poll)
+        elif future.cancelled():
+            callback(None, CancelledError())
+        else:
+            error = future.exception()
+            callback(None if error else future.result(), error)
+    widget.after(interval_ms, poll)
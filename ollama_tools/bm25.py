@@ -0,0 +1,163 @@
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+# Lexical (BM25) retrieval next to the vector store, fused with vector results by rank
+
+# Words, numbers and codes such as "AB-1234", "E1.2" or "x86_64" stay single tokens
+_TOKEN = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+
+
+def tokenize(text):
+    return _TOKEN.findall(str(text).lower())
+
+
+class BM25Index:
+    """
+    Inverted index scored with Okapi BM25, built at ingestion alongside the vectors.
+
+    Chunks are added and removed by id (adding an existing id replaces it); an optional
+    source per chunk allows removing a whole file. With a path, the index is loaded from and
+    saved to a JSON file.
+    """
+
+    def __init__(self, path=None, k1=1.5, b=0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.postings = {}  # term -> {chunk id: term frequency}
+        self.lengths = {}  # chunk id -> token count
+        self.terms = {}  # chunk id -> its distinct terms, for removal
+        self.sources = {}  # chunk id -> source
+        self.total_length = 0
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self._load()
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def add(self, ids, documents, sources=None):
+        with self._lock:
+            for i, (chunk_id, document) in enumerate(zip(ids, documents)):
+                if chunk_id in self.lengths:
+                    self._remove(chunk_id)
+                terms = Counter(tokenize(document))
+                for term, count in terms.items():
+                    self.postings.setdefault(term, {})[chunk_id] = count
+                length = sum(terms.values())
+                self.lengths[chunk_id] = length
+                self.terms[chunk_id] = list(terms)
+                self.total_length += length
+                if sources is not None:
+                    self.sources[chunk_id] = sources[i]
+
+    def remove(self, ids):
+        with self._lock:
+            for chunk_id in ids:
+                if chunk_id in self.lengths:
+                    self._remove(chunk_id)
+
+    def remove_source(self, source):
+        self.remove([chunk_id for chunk_id, s in list(self.sources.items()) if s == source])
+
+    def clear(self):
+        with self._lock:
+            self.postings, self.lengths, self.terms, self.sources, self.total_length = {}, {}, {}, {}, 0
+
+    def search(self, query, k=10):
+        """[(chunk id, score), ...] best first."""
+        with self._lock:
+            count = len(self.lengths)
+            if not count:
+                return []
+            average = self.total_length / count
+            scores = {}
+            for term in set(tokenize(query)):
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_id, tf in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self.lengths[chunk_id] / average)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda item: -item[1])[:k]
+
+    def save(self):
+        with self._lock:
+            data = {"postings": self.postings, "lengths": self.lengths, "terms": self.terms, "sources": self.sources}
+            folder = os.path.dirname(self.path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(temp_path, self.path)
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.postings = data.get("postings", {})
+        self.lengths = data.get("lengths", {})
+        self.terms = data.get("terms", {})
+        self.sources = data.get("sources", {})
+        self.total_length = sum(self.lengths.values())
+
+    def _remove(self, chunk_id):
+        for term in self.terms.pop(chunk_id, []):
+            postings = self.postings.get(term, {})
+            postings.pop(chunk_id, None)
+            if not postings:
+                self.postings.pop(term, None)
+        self.total_length -= self.lengths.pop(chunk_id)
+        self.sources.pop(chunk_id, None)
+
+
+def reciprocal_rank_fusion(rankings, k=60, weights=None):
+    """
+    Fuse ranked id lists: each id scores sum(weight / (k + rank)) over the lists it is in.
+    Returns [(id, score), ...] best first.
+    """
+    scores = {}
+    for i, ranking in enumerate(rankings):
+        weight = weights[i] if weights else 1.0
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + weight / (k + rank)
+    return sorted(scores.items(), key=lambda item: -item[1])
+
+
+def hybrid_search(collection, index, query, query_embedding, k=5, candidates=20, where=None):
+    """
+    Top k chunks of a Chroma collection for a query, by reciprocal-rank fusion of its vector
+    ranking and the BM25 ranking of index (each taking the best candidates).
+
+    Returns {"ids", "documents", "metadatas"} lists, like one row of collection.query().
+    """
+    available = collection.count()
+    if not available:
+        return {"ids": [], "documents": [], "metadatas": []}
+    kwargs = {"where": where} if where else {}
+    dense = collection.query(query_embeddings=[query_embedding], n_results=min(candidates, available), **kwargs)
+    found = {chunk_id: (document, metadata) for chunk_id, document, metadata
+             in zip(dense["ids"][0], dense["documents"][0], dense["metadatas"][0])}
+    lexical = [chunk_id for chunk_id, _ in index.search(query, candidates)] if index is not None else []
+
+    fused = [chunk_id for chunk_id, _ in reciprocal_rank_fusion([dense["ids"][0], lexical])][:k]
+    missing = [chunk_id for chunk_id in fused if chunk_id not in found]
+    if missing:
+        extra = collection.get(ids=missing, include=["documents", "metadatas"])
+        for chunk_id, document, metadata in zip(extra["ids"], extra["documents"], extra["metadatas"]):
+            found[chunk_id] = (document, metadata)
+    # Ids the index still knows but the collection no longer has are skipped
+    fused = [chunk_id for chunk_id in fused if chunk_id in found]
+    return {
+        "ids": fused,
+        "documents": [found[chunk_id][0] for chunk_id in fused],
+        "metadatas": [found[chunk_id][1] for chunk_id in fused]
+    }
@@ -0,0 +1,108 @@
+# Splitting extracted text into overlapping chunks for embedding
+
+SEPARATORS = ("\n\n", "\n", ". ", "? ", "! ", "; ", ", ", " ")
+
+
+class TextChunker:
+    """
+    Splits text into chunks of at most chunk_size characters, each overlapping the previous
+    one by about overlap characters.
+
+    Cuts are made at the strongest boundary in the second half of the window (paragraph,
+    line, sentence, clause, word) and only mid-word when there is none. split(text) suits
+    IngestPipeline's chunker argument; stream(segments) chunks a whole document given as
+    (metadata, text) pieces (pages, paragraphs, rows...) while holding only a few chunks of
+    it in memory, and tags every chunk with the metadata of the piece it starts in and its
+    character offset in the document.
+    """
+
+    def __init__(self, chunk_size=1000, overlap=150, separators=SEPARATORS):
+        self.chunk_size = max(1, int(chunk_size))
+        self.overlap = max(0, min(int(overlap), self.chunk_size // 2))
+        self.separators = separators
+
+    def split(self, text):
+        return [chunk for _, chunk in self.chunks(text)]
+
+    def chunks(self, text):
+        """[(offset, chunk_text), ...] for one string."""
+        return [(offset, chunk) for offset, chunk, _ in self._cut(text, 0, final=True)]
+
+    def stream(self, segments, joiner="\n"):
+        """
+        Yields (chunk_text, metadata) for a document given as (metadata, text) segments.
+
+        metadata is a copy of the starting segment's metadata plus "offset" (characters from
+        the start of the document, segments joined with joiner) and "chunk" (index).
+        """
+        buffer = ""
+        buffer_start = 0  # document offset of buffer[0]
+        marks = []  # (document offset, metadata) of the segments still in the buffer
+        index = 0
+
+        for metadata, text in segments:
+            if not text:
+                continue
+            if buffer:
+                buffer += joiner
+            marks.append((buffer_start + len(buffer), metadata))
+            buffer += text
+            if len(buffer) < self.chunk_size * 2:
+                continue
+            consumed = 0
+            for offset, chunk, consumed in self._cut(buffer, buffer_start, final=False):
+                yield self._tagged(chunk, offset, marks, index)
+                index += 1
+            buffer, buffer_start = buffer[consumed:], buffer_start + consumed
+            # Segments that ended before the buffer start no longer tag any chunk
+            while len(marks) > 1 and marks[1][0] <= buffer_start:
+                marks.pop(0)
+
+        for offset, chunk, _ in self._cut(buffer, buffer_start, final=True):
+            yield self._tagged(chunk, offset, marks, index)
+            index += 1
+
+    def _tagged(self, chunk, offset, marks, index):
+        metadata = {}
+        for start, segment_metadata in marks:
+            if start > offset:
+                break
+            metadata = segment_metadata
+        return chunk, dict(metadata, offset=offset, chunk=index)
+
+    def _cut(self, text, base, final):
+        """
+        Yields (document offset, chunk, consumed) for text; consumed is the buffer position the
+        next call should start from. Unless final, stops while a full window is still ahead,
+        so the rest can be joined with the next segment.
+        """
+        start = 0
+        length = len(text)
+        while start < length:
+            if not final and length - start < self.chunk_size * 2:
+                return
+            end = min(start + self.chunk_size, length)
+            if end < length:
+                end = self._boundary(text, start, end)
+            chunk = text[start:end].strip()
+            next_start = end if end >= length else max(start + 1, self._overlap_start(text, start, end))
+            if chunk:
+                leading = len(text[start:end]) - len(text[start:end].lstrip())
+                yield base + start + leading, chunk, next_start
+            start = next_start
+
+    def _boundary(self, text, start, end):
+        window = text[start:end]
+        for separator in self.separators:
+            cut = window.rfind(separator)
+            if cut >= len(window) // 2:
+                return start + cut + len(separator)
+        return end
+
+    def _overlap_start(self, text, start, end):
+        if not self.overlap:
+            return end
+        position = max(start + 1, end - self.overlap)
+        # Begin the overlap on a word boundary
+        space = text.find(" ", position, end)
+        return space + 1 if space != -1 else position
@@ -0,0 +1,168 @@
+import re
+import threading
+import time
+
+import requests
+
+from .embeddings import DEFAULT_HOST, create_session
+from .streaming import GenerationStream
+
+# pip install requests
+# One Ollama connection per host, shared by everything in the app: pooled keep-alive HTTP
+# session, HTTP health checks, a cached model list and model preloading
+
+_clients = {}
+_clients_lock = threading.Lock()
+_DURATION = re.compile(r"(-?\d+(?:\.\d+)?)(ms|h|m|s)?")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+_NUM_CTX = re.compile(r"^num_ctx\s+(\d+)", re.MULTILINE)
+
+
+def keep_alive_seconds(keep_alive):
+    """Seconds Ollama keeps a model loaded for a keep_alive value ("5m", "1h30m", 300, -1 = forever)."""
+    if isinstance(keep_alive, (int, float)):
+        seconds = float(keep_alive)
+    else:
+        # A bare number is seconds; durations may combine units like "1h30m"
+        parts = _DURATION.findall(str(keep_alive).strip().lower())
+        seconds = sum(float(number) * _DURATION_UNITS.get(unit, 1) for number, unit in parts)
+    return float("inf") if seconds < 0 else seconds
+
+
+def get_client(host=DEFAULT_HOST):
+    """The shared OllamaClient for host (created on first use)."""
+    host = host.rstrip("/")
+    with _clients_lock:
+        if host not in _clients:
+            _clients[host] = OllamaClient(host)
+        return _clients[host]
+
+
+class OllamaClient:
+    """
+    Ollama HTTP API over one pooled requests.Session.
+
+    is_running() is a cheap HTTP health check (no `ollama list` subprocess). list_models()
+    caches the installed models for models_ttl seconds. preload(model) loads a model in the
+    background as soon as it is selected, and every request asks Ollama to keep the model
+    loaded for keep_alive, so the first question after a pause does not wait for the load.
+    """
+
+    def __init__(self, host=DEFAULT_HOST, pool_size=8, timeout=(5, 300), models_ttl=60,
+                 keep_alive="30m", session=None):
+        self.host = host.rstrip("/")
+        self.timeout = timeout
+        self.models_ttl = models_ttl
+        self.keep_alive = keep_alive
+        self.session = session or create_session(pool_size)
+        self._models = None
+        self._models_time = 0.0
+        self._preloaded = {}  # model -> time of the last preload
+        self._windows = {}  # model -> num_ctx from /api/show (None if the model does not set one)
+        self._lock = threading.Lock()
+
+    def url(self, endpoint):
+        return self.host + endpoint
+
+    def is_running(self, timeout=2):
+        try:
+            return self.session.get(self.url("/api/version"), timeout=timeout).ok
+        except requests.RequestException:
+            return False
+
+    def wait_until_ready(self, attempts=10, delay=1.0):
+        """Poll is_running() until the server answers; returns whether it did."""
+        for attempt in range(attempts):
+            if self.is_running():
+                return True
+            if attempt < attempts - 1:
+                time.sleep(delay)
+        return False
+
+    def list_models(self, refresh=False):
+        """Installed model names, sorted; cached for models_ttl seconds unless refresh."""
+        with self._lock:
+            if not refresh and self._models is not None and time.time() - self._models_time < self.models_ttl:
+                return list(self._models)
+        response = self.session.get(self.url("/api/tags"), timeout=self.timeout)
+        response.raise_for_status()
+        models = sorted((model["name"] for model in response.json().get("models", [])), key=str.lower)
+        with self._lock:
+            self._models, self._models_time = models, time.time()
+        return list(models)
+
+    def invalidate_models(self):
+        with self._lock:
+            self._models = None
+
+    def context_window(self, model):
+        """
+        The num_ctx model runs with, from the parameters /api/show reports for it; None if the
+        model does not set one (the server default applies) or the server cannot be reached.
+        """
+        if not model:
+            return None
+        with self._lock:
+            if model in self._windows:
+                return self._windows[model]
+        try:
+            response = self.session.post(self.url("/api/show"), json={"model": model}, timeout=self.timeout)
+            response.raise_for_status()
+            match = _NUM_CTX.search(response.json().get("parameters") or "")
+        except (requests.RequestException, ValueError):
+            return None  # not cached, so the next call tries again
+        window = int(match.group(1)) if match else None
+        with self._lock:
+            self._windows[model] = window
+        return window
+
+    def preload(self, model, embedding=False, wait=False):
+        """
+        Load model into memory ahead of the first request (on a background thread unless wait).
+        Repeated calls for the same model within the keep-alive period are skipped.
+        """
+        if not model:
+            return None
+        with self._lock:
+            last = self._preloaded.get(model)
+            if last is not None and time.time() - last < keep_alive_seconds(self.keep_alive):
+                return None
+            self._preloaded[model] = time.time()
+
+        def load():
+            try:
+                if embedding:
+                    payload = {"model": model, "input": "", "keep_alive": self.keep_alive}
+                    self.session.post(self.url("/api/embed"), json=payload, timeout=self.timeout)
+                else:
+                    # A generate request without a prompt only loads the model
+                    payload = {"model": model, "keep_alive": self.keep_alive, "stream": False}
+                    self.session.post(self.url("/api/generate"), json=payload, timeout=self.timeout)
+            except requests.RequestException:
+                with self._lock:
+                    self._preloaded.pop(model, None)
+
+        if wait:
+            load()
+            return None
+        thread = threading.Thread(target=load, daemon=True)
+        thread.start()
+        return thread
+
+    def generate(self, payload, timeout=None):
+        """Non-streamed /api/generate; returns the response JSON."""
+        payload = dict(payload, stream=False)
+        payload.setdefault("keep_alive", self.keep_alive)
+        response = self.session.post(self.url("/api/generate"), json=payload, timeout=timeout or self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def stream(self, payload, endpoint="/api/generate", **kwargs):
+        """A started GenerationStream on the pooled session."""
+        payload = dict(payload)
+        payload.setdefault("keep_alive", self.keep_alive)
+        return GenerationStream(payload, host=self.host, endpoint=endpoint, session=self.session,
+                                **kwargs).start()
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,165 @@
+import math
+import re
+
+from .bm25 import tokenize
+
+# Fitting retrieved passages into a token budget before generation: prompt length is what
+# local models spend most of their time on before the first token
+
+# Ollama's default num_ctx, used when neither the model (its /api/show parameters) nor
+# CONTEXT_WINDOWS gives a window
+DEFAULT_CONTEXT_WINDOW = 2048
+CONTEXT_WINDOWS = {}  # model name or base name (before ":") -> context window in tokens
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n+")
+# Question words that would make every sentence look relevant
+_STOPWORDS = frozenset("a an and are as at be by can do does for from how i in is it of on or "
+                       "the this that to was what when where which who why with you".split())
+
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token for English text)."""
+    return math.ceil(len(text) / 4) if text else 0
+
+
+def context_budget(model, reserve=768, window=None, client=None):
+    """
+    Tokens available for retrieved context with model: its context window less reserve
+    tokens kept for the instructions, the question and the answer. The window is the model's
+    num_ctx as reported by client (an OllamaClient), else CONTEXT_WINDOWS, else the default.
+    """
+    if window is None and client is not None:
+        window = client.context_window(model)
+    if window is None:
+        window = CONTEXT_WINDOWS.get(model) or CONTEXT_WINDOWS.get(str(model).split(":")[0],
+                                                                    DEFAULT_CONTEXT_WINDOW)
+    return max(256, window - reserve)
+
+
+def split_sentences(text):
+    return [sentence.strip() for sentence in _SENTENCE_END.split(text) if sentence.strip()]
+
+
+class AssembledContext:
+    """Passages that made it into the prompt, with token counts for logging."""
+
+    def __init__(self, passages, budget, retrieved, retrieved_tokens, dropped):
+        self.passages = passages  # [(text, metadata), ...] in rank order
+        self.budget = budget
+        self.retrieved = retrieved
+        self.retrieved_tokens = retrieved_tokens
+        self.dropped = dropped  # {"overlap": n, "duplicate": n, "budget": n}
+        self.tokens = sum(estimate_tokens(text) for text, _ in passages)
+
+    def __len__(self):
+        return len(self.passages)
+
+    def summary(self):
+        dropped = ", ".join(f"{count} {reason}" for reason, count in self.dropped.items() if count)
+        return (f"context: {len(self.passages)} of {self.retrieved} passages, ~{self.tokens} of "
+                f"~{self.retrieved_tokens} tokens (budget {self.budget})"
+                + (f", dropped {dropped}" if dropped else ""))
+
+
+class ContextAssembler:
+    """
+    Builds the context of a RAG prompt from ranked passages within a token budget.
+
+    Passages are taken best first. Text a passage shares with one already taken (chunkers
+    overlap neighbouring chunks) is cut off, passages mostly repeating an earlier one are
+    dropped, and long passages are trimmed to the sentences sharing terms with the query
+    (with neighbours sentences either side). Whatever is left is packed until the budget is
+    spent; the last passage is cut at a sentence boundary rather than left out.
+    """
+
+    def __init__(self, budget_tokens=1280, duplicate_threshold=0.8, neighbours=1, min_overlap=40):
+        self.budget_tokens = budget_tokens
+        self.duplicate_threshold = duplicate_threshold
+        self.neighbours = neighbours
+        self.min_overlap = min_overlap
+
+    def assemble(self, query, passages, budget_tokens=None):
+        """passages: [(text, metadata), ...] best first. Returns an AssembledContext."""
+        budget = self.budget_tokens if budget_tokens is None else budget_tokens
+        passages = [(text, metadata or {}) for text, metadata in passages if text and text.strip()]
+        query_terms = set(tokenize(query)) - _STOPWORDS
+        dropped = {"overlap": 0, "duplicate": 0, "budget": 0}
+        taken = []
+        shingles = []
+        used = 0
+
+        for text, metadata in passages:
+            stripped = self._strip_overlap(text, [kept for kept, _ in taken])
+            if stripped != text and len(stripped) < self.min_overlap:
+                dropped["overlap"] += 1
+                continue
+            text = stripped
+            words = _shingles(text)
+            if any(_jaccard(words, other) >= self.duplicate_threshold for other in shingles):
+                dropped["duplicate"] += 1
+                continue
+            text = self._relevant_sentences(text, query_terms)
+            tokens = estimate_tokens(text)
+            if used + tokens > budget:
+                text = self._fit(text, budget - used)
+                if not text:
+                    dropped["budget"] += 1
+                    continue
+                tokens = estimate_tokens(text)
+            taken.append((text, metadata))
+            shingles.append(words)
+            used += tokens
+
+        return AssembledContext(taken, budget, len(passages),
+                                sum(estimate_tokens(text) for text, _ in passages), dropped)
+
+    def _strip_overlap(self, text, kept):
+        for other in kept:
+            # This passage continues one already taken: drop the shared beginning
+            head = text[:self.min_overlap]
+            position = other.find(head)
+            if position != -1 and text.startswith(other[position:]):
+                text = text[len(other) - position:].strip()
+                continue
+            # ...or leads into it: drop the shared end
+            head = other[:self.min_overlap]
+            position = text.find(head)
+            if position != -1 and other.startswith(text[position:]):
+                text = text[:position].strip()
+        return text
+
+    def _relevant_sentences(self, text, query_terms):
+        sentences = split_sentences(text)
+        if len(sentences) <= 2 * self.neighbours + 1 or not query_terms:
+            return text
+        hits = [i for i, sentence in enumerate(sentences) if query_terms & set(tokenize(sentence))]
+        if not hits:
+            # Nothing to go by (the match was semantic), keep the passage as it is
+            return text
+        keep = sorted({j for i in hits
+                       for j in range(max(0, i - self.neighbours), min(len(sentences), i + self.neighbours + 1))})
+        parts = []
+        for position, j in enumerate(keep):
+            if position and j != keep[position - 1] + 1:
+                parts.append("...")
+            parts.append(sentences[j])
+        return " ".join(parts)
+
+    def _fit(self, text, tokens):
+        if tokens < 32:
+            return ""
+        parts = []
+        for sentence in split_sentences(text):
+            if estimate_tokens(" ".join(parts + [sentence])) > tokens:
+                break
+            parts.append(sentence)
+        return " ".join(parts)
+
+
+def _shingles(text, size=3):
+    words = tokenize(text)
+    return {tuple(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+
+
+def _jaccard(a, b):
+    return len(a & b) / len(a | b) if a and b else 0.0
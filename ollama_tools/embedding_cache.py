@@ -0,0 +1,146 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+# Embedding cache for query paths: repeated and follow-up questions skip the embedding model
+
+
+def normalize_text(text):
+    """Whitespace-normalized text; the cache key (case is kept, embeddings can depend on it)."""
+    return " ".join(str(text).split())
+
+
+class EmbeddingCache:
+    """
+    LRU cache in front of an embedding function, keyed by model name and normalized text.
+
+    embedder is either a Chroma-style callable (list of texts -> list of vectors) or an object
+    with embed_documents/embed_query (langchain embeddings, OllamaEmbedder). The cache offers
+    all three, so it can stand in wherever the original was used. Query and document
+    embeddings are cached separately, as some models embed them differently.
+
+    With a path, entries are also stored in a SQLite file so they survive restarts (at most
+    max_stored, least recently used dropped first); several caches, e.g. one per model, can
+    share one file.
+    """
+
+    def __init__(self, embedder, model_name, max_entries=2048, path=None, max_stored=50000):
+        self.embedder = embedder
+        self.model_name = model_name
+        self.max_entries = max(1, int(max_entries))
+        self.max_stored = max_stored
+        self.stats = {"hits": 0, "misses": 0}
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._writes = 0
+        if path:
+            folder = os.path.dirname(path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS embeddings "
+                             "(key TEXT PRIMARY KEY, vector BLOB, used REAL)")
+            self._db.commit()
+
+    def __call__(self, input):
+        return self.embed_documents(list(input))
+
+    def embed_documents(self, texts):
+        return self._embed(texts, "document")
+
+    def embed_query(self, text):
+        return self._embed([text], "query")[0]
+
+    def summary(self):
+        lookups = self.stats["hits"] + self.stats["misses"]
+        rate = self.stats["hits"] / lookups if lookups else 0.0
+        return (f"embedding cache: {self.stats['hits']} hits, {self.stats['misses']} misses "
+                f"({rate:.0%} hit rate)")
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _key(self, text, kind):
+        return hashlib.sha1(f"{self.model_name}\0{kind}\0{normalize_text(text)}".encode()).hexdigest()
+
+    def _embed(self, texts, kind):
+        keys = [self._key(text, kind) for text in texts]
+        vectors = {}
+        with self._lock:
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    vectors[key] = self._memory[key]
+            wanted = [key for key in dict.fromkeys(keys) if key not in vectors]
+            vectors.update(self._load(wanted))
+            for key in wanted:
+                if key in vectors:
+                    self._remember(key, vectors[key])
+
+        missing = {}
+        for text, key in zip(texts, keys):
+            if key not in vectors:
+                missing.setdefault(key, text)
+        hits = sum(1 for key in keys if key in vectors)
+        if missing:
+            computed = self._compute(list(missing.values()), kind)
+            new = dict(zip(missing, computed))
+            vectors.update(new)
+            with self._lock:
+                for key, vector in new.items():
+                    self._remember(key, vector)
+                self._store(new)
+        with self._lock:
+            self.stats["hits"] += hits
+            self.stats["misses"] += len(keys) - hits
+        return [list(vectors[key]) for key in keys]
+
+    def _compute(self, texts, kind):
+        if kind == "query" and hasattr(self.embedder, "embed_query"):
+            return [self.embedder.embed_query(text) for text in texts]
+        if hasattr(self.embedder, "embed_documents"):
+            return self.embedder.embed_documents(texts)
+        return self.embedder(texts)
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _load(self, keys):
+        if self._db is None or not keys:
+            return {}
+        found = {}
+        now = time.time()
+        for start in range(0, len(keys), 500):
+            part = keys[start:start + 500]
+            rows = self._db.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})",
+                                    part).fetchall()
+            for key, blob in rows:
+                found[key] = array("f", blob).tolist()
+        if found:
+            self._db.executemany("UPDATE embeddings SET used = ? WHERE key = ?", [(now, key) for key in found])
+            self._db.commit()
+        return found
+
+    def _store(self, vectors):
+        if self._db is None or not vectors:
+            return
+        now = time.time()
+        self._db.executemany("INSERT OR REPLACE INTO embeddings (key, vector, used) VALUES (?, ?, ?)",
+                             [(key, array("f", vector).tobytes(), now) for key, vector in vectors.items()])
+        self._writes += len(vectors)
+        if self._writes >= 1000:
+            # Trim the file to the max_stored most recently used entries now and then
+            self._writes = 0
+            self._db.execute("DELETE FROM embeddings WHERE key NOT IN "
+                             "(SELECT key FROM embeddings ORDER BY used DESC LIMIT ?)", (self.max_stored,))
+        self._db.commit()
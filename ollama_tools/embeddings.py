@@ -0,0 +1,123 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# pip install requests
+
+DEFAULT_HOST = "http://localhost:11434"
+
+
+def create_session(pool_size=8):
+    """requests.Session with a keep-alive connection pool sized for pool_size concurrent requests."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class OllamaEmbedder:
+    """
+    Embedding function backed by the Ollama HTTP API (usable as a Chroma embedding_function).
+
+    Texts are sent batch_size at a time to /api/embed over a pooled keep-alive session, with
+    up to max_workers batches in flight. Older Ollama servers without /api/embed fall back to
+    one /api/embeddings request per text. Empty texts get a zero vector of the model's own size.
+    """
+
+    def __init__(self, model_name, host=DEFAULT_HOST, batch_size=32, max_workers=4, timeout=120,
+                 keep_alive=None, session=None):
+        self.model_name = model_name
+        self.host = host.rstrip("/")
+        self.batch_size = max(1, int(batch_size))
+        self.max_workers = max(1, int(max_workers))
+        self.timeout = timeout
+        self.keep_alive = keep_alive
+        self.session = session or create_session(self.max_workers)
+        self._executor = None
+        self._dimension = None
+        self._legacy_api = False
+        self._lock = threading.Lock()
+
+    def __call__(self, input):
+        return self.embed(list(input))
+
+    @property
+    def dimension(self):
+        """Embedding size reported by the model (probed once with a short text)."""
+        if self._dimension is None:
+            self._dimension = len(self._embed_batch(["dimension probe"])[0])
+        return self._dimension
+
+    def embed(self, texts):
+        """Embeddings for texts, in order."""
+        embeddings = [None] * len(texts)
+        indexes = [i for i, text in enumerate(texts) if text and text.strip()]
+        batches = [indexes[k:k + self.batch_size] for k in range(0, len(indexes), self.batch_size)]
+
+        if len(batches) == 1:
+            results = [self._embed_batch([texts[i] for i in batches[0]])]
+        elif batches:
+            results = self._get_executor().map(lambda batch: self._embed_batch([texts[i] for i in batch]),
+                                               batches)
+        else:
+            results = []
+        for batch, vectors in zip(batches, results):
+            for i, vector in zip(batch, vectors):
+                embeddings[i] = vector
+                if self._dimension is None:
+                    self._dimension = len(vector)
+
+        if len(indexes) < len(texts):
+            zero = [0.0] * self.dimension
+            embeddings = [vector if vector is not None else list(zero) for vector in embeddings]
+        return embeddings
+
+    def embed_query(self, text):
+        return self.embed([text])[0]
+
+    def close(self):
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        self.session.close()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix="ollama-embed")
+            return self._executor
+
+    def _payload(self, **fields):
+        payload = {"model": self.model_name, **fields}
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        return payload
+
+    def _embed_batch(self, texts):
+        if not self._legacy_api:
+            response = self.session.post(f"{self.host}/api/embed", json=self._payload(input=texts),
+                                         timeout=self.timeout)
+            # A plain 404 means the server predates /api/embed; a JSON error (unknown model) is real
+            if response.status_code != 404 or response.headers.get("Content-Type", "").startswith("application/json"):
+                if not response.ok:
+                    raise RuntimeError(f"Ollama embedding error: {response.text.strip()}")
+                embeddings = response.json().get("embeddings") or []
+                if len(embeddings) != len(texts):
+                    raise RuntimeError(f"Ollama returned {len(embeddings)} embeddings for {len(texts)} texts")
+                return embeddings
+            self._legacy_api = True
+        return [self._embed_legacy(text) for text in texts]
+
+    def _embed_legacy(self, text):
+        response = self.session.post(f"{self.host}/api/embeddings", json=self._payload(prompt=text),
+                                     timeout=self.timeout)
+        if not response.ok:
+            raise RuntimeError(f"Ollama embedding error: {response.text.strip()}")
+        embedding = response.json().get("embedding")
+        if not embedding:
+            raise RuntimeError(f"Ollama returned no embedding for model {self.model_name}")
+        return embedding
@@ -0,0 +1,110 @@
+import os
+import zipfile
+from xml.etree.ElementTree import iterparse
+
+# Streaming text extraction for ingestion: each extractor yields (metadata, text) segments,
+# the input TextChunker.stream() expects, without building the whole document in memory
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+def xlsx_segments(path, rows_per_segment=50):
+    """
+    Rows of every sheet of an .xlsx workbook, rows_per_segment at a time.
+
+    The workbook is opened read-only, so openpyxl parses rows as they are iterated instead of
+    loading every cell. Each row becomes one line of " | "-separated values; metadata holds
+    the sheet name and the number of the segment's first row.
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            lines = []
+            first_row = None
+            for row_number, row in enumerate(sheet.iter_rows(values_only=True), start=1):
+                values = [str(cell) for cell in row if cell is not None and str(cell).strip()]
+                if not values:
+                    continue
+                if first_row is None:
+                    first_row = row_number
+                lines.append(" | ".join(values))
+                if len(lines) >= rows_per_segment:
+                    yield {"sheet": sheet.title, "row": first_row}, "\n".join(lines)
+                    lines, first_row = [], None
+            if lines:
+                yield {"sheet": sheet.title, "row": first_row}, "\n".join(lines)
+    finally:
+        workbook.close()
+
+
+def docx_paragraphs(path):
+    """
+    Paragraph texts of a .docx file, in document order (table cells included).
+
+    word/document.xml is read with an incremental parser straight from the archive, and each
+    paragraph is discarded once its text has been yielded.
+    """
+    with zipfile.ZipFile(path) as archive:
+        with archive.open("word/document.xml") as xml:
+            parts = []
+            depth = 0
+            for event, element in iterparse(xml, events=("start", "end")):
+                tag = element.tag
+                if tag == _W + "p":
+                    if event == "start":
+                        depth += 1
+                        continue
+                    depth -= 1
+                    if depth == 0:
+                        yield "".join(parts)
+                        parts = []
+                    element.clear()
+                elif event == "end" and depth:
+                    if tag == _W + "t" and element.text:
+                        parts.append(element.text)
+                    elif tag == _W + "tab":
+                        parts.append("\t")
+                    elif tag in (_W + "br", _W + "cr"):
+                        parts.append("\n")
+
+
+def docx_segments(path, paragraphs_per_segment=20):
+    """Non-empty paragraphs of a .docx file, grouped; metadata holds the first paragraph number."""
+    lines = []
+    first = None
+    for number, text in enumerate(docx_paragraphs(path), start=1):
+        if not text.strip():
+            continue
+        if first is None:
+            first = number
+        lines.append(text)
+        if len(lines) >= paragraphs_per_segment:
+            yield {"paragraph": first}, "\n".join(lines)
+            lines, first = [], None
+    if lines:
+        yield {"paragraph": first}, "\n".join(lines)
+
+
+def pdf_segments(path):
+    """Text of each PDF page; metadata holds the page number."""
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        from PyPDF2 import PdfReader
+
+    reader = PdfReader(path)
+    for page_num, page in enumerate(reader.pages):
+        yield {"page": page_num + 1}, page.extract_text() or ""
+
+
+EXTRACTORS = {".pdf": pdf_segments, ".docx": docx_segments, ".xlsx": xlsx_segments}
+
+
+def file_segments(path):
+    """(metadata, text) segments of a PDF, Word or Excel file."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in EXTRACTORS:
+        raise ValueError(f"Unsupported file type: {os.path.basename(path)}")
+    return EXTRACTORS[extension](path)
@@ -0,0 +1,60 @@
+# Batched vector-store writes for the RAG apps
+
+
+class BatchWriter:
+    """
+    Collects chunks across pages and documents and writes them to a Chroma collection in batches.
+
+    Every batch of batch_size chunks is embedded in one call (embedding_function, or the
+    collection's own one when omitted) and stored with a single collection.add. Pending chunks
+    are written by flush(), which also runs when the writer is used as a context manager and
+    the block exits, whether it completed, was stopped or raised.
+    """
+
+    def __init__(self, collection, batch_size=256, embedding_function=None, on_flush=None):
+        self.collection = collection
+        self.batch_size = max(1, int(batch_size))
+        self.embedding_function = embedding_function
+        self.on_flush = on_flush
+        self.written = 0
+        self._documents = []
+        self._metadatas = []
+        self._ids = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+        return False
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, document, metadata, chunk_id):
+        self._documents.append(document)
+        self._metadatas.append(metadata)
+        self._ids.append(chunk_id)
+        if len(self._ids) >= self.batch_size:
+            self.flush()
+
+    def add_many(self, documents, metadatas, ids):
+        for document, metadata, chunk_id in zip(documents, metadatas, ids):
+            self.add(document, metadata, chunk_id)
+
+    def flush(self):
+        """Embed and store the pending chunks; returns how many were written."""
+        if not self._ids:
+            return 0
+        documents, metadatas, ids = self._documents, self._metadatas, self._ids
+        self._documents, self._metadatas, self._ids = [], [], []
+
+        kwargs = {"documents": documents, "metadatas": metadatas, "ids": ids}
+        if self.embedding_function is not None:
+            kwargs["embeddings"] = self.embedding_function(documents)
+        self.collection.add(**kwargs)
+
+        self.written += len(ids)
+        if self.on_flush:
+            self.on_flush(len(ids), self.written)
+        return len(ids)
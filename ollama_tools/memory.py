@@ -0,0 +1,123 @@
+import threading
+import time
+from collections import deque
+
+from .context_budget import estimate_tokens
+
+# Bounded chat history for follow-up prompts: recent messages verbatim, older ones folded into a
+# running summary on a background thread, so the prompt (and each turn's latency) stays flat
+
+
+class ConversationMemory:
+    """
+    Recent messages in a bounded deque plus a summary of everything before them.
+
+    Once the messages exceed token_budget tokens (or max_messages), all but the keep_recent
+    latest are handed to summarize(previous_summary, transcript) -> str on a background thread.
+    Until it returns they stay in the prompt verbatim, so nothing is lost while the summary is
+    being written; if it fails they are dropped. prompt(question) builds the follow-up prompt.
+    """
+
+    def __init__(self, summarize=None, token_budget=1500, max_messages=20, keep_recent=4):
+        self.summarize = summarize
+        self.token_budget = token_budget
+        self.keep_recent = max(1, keep_recent)
+        self.messages = deque(maxlen=max(self.keep_recent + 1, max_messages))  # (role, content, tokens)
+        self.summary = ""
+        self.summary_tokens = 0
+        self.summaries = 0
+        self.last_summary_seconds = None
+        self.last_error = None
+        self._folding = []  # messages being summarized
+        self._generation = 0  # bumped by clear(), so a late summary of old messages is dropped
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def __len__(self):
+        with self._lock:
+            return len(self.messages) + len(self._folding) + (1 if self.summary else 0)
+
+    @property
+    def tokens(self):
+        with self._lock:
+            return self._tokens()
+
+    def add(self, role, content, tokens=None):
+        """Record a message; tokens defaults to an estimate (pass the model's eval count if known)."""
+        tokens = estimate_tokens(content) if tokens is None else tokens
+        with self._lock:
+            # With a summary still running and the deque full, the oldest message is dropped here
+            self.messages.append((role, content, tokens))
+            if self._worker is None and (self._tokens() > self.token_budget
+                                         or len(self.messages) == self.messages.maxlen):
+                self._start_summary()
+
+    def clear(self):
+        with self._lock:
+            self.messages.clear()
+            self._folding = []
+            self.summary, self.summary_tokens = "", 0
+            self._generation += 1
+            self._worker = None
+
+    def wait(self, timeout=None):
+        """Block until a running summary has finished (for tests and shutdown)."""
+        worker = self._worker
+        if worker is not None:
+            worker.join(timeout)
+
+    def prompt(self, question, user="User", assistant="Assistant"):
+        with self._lock:
+            parts = []
+            if self.summary:
+                parts.append(f"Summary of the earlier conversation:\n{self.summary}\n")
+            for role, content, _ in self._folding + list(self.messages):
+                parts.append(f"{user if role == 'user' else assistant}: {content}")
+        parts.append(f"{user}: {question}\n{assistant}:")
+        return "\n".join(parts)
+
+    def stats(self):
+        with self._lock:
+            return (f"memory: {len(self.messages) + len(self._folding)} messages, ~{self._tokens()} tokens"
+                    + (f", summarized {self.summaries}x" if self.summary else "")
+                    + (" (summarizing)" if self._worker else ""))
+
+    def _tokens(self):
+        return (self.summary_tokens + sum(tokens for _, _, tokens in self._folding)
+                + sum(tokens for _, _, tokens in self.messages))
+
+    def _start_summary(self):
+        if self.summarize is None:
+            # Nothing to summarize with: keep within budget by forgetting the oldest messages
+            while len(self.messages) > self.keep_recent and self._tokens() > self.token_budget:
+                self.messages.popleft()
+            return
+        while len(self.messages) > self.keep_recent:
+            self._folding.append(self.messages.popleft())
+        if not self._folding:
+            return
+        transcript = "\n".join(f"{role}: {content}" for role, content, _ in self._folding)
+        self._worker = threading.Thread(target=self._summarize, args=(self.summary, transcript, self._generation),
+                                        daemon=True)
+        self._worker.start()
+
+    def _summarize(self, previous, transcript, generation):
+        started = time.perf_counter()
+        try:
+            summary = self.summarize(previous, transcript).strip()
+            error = None
+        except Exception as e:
+            summary, error = previous, e
+        with self._lock:
+            if generation != self._generation:
+                return
+            self.summary = summary
+            self.summary_tokens = estimate_tokens(summary)
+            self.summaries += error is None
+            self.last_summary_seconds = time.perf_counter() - started
+            self.last_error = error
+            self._folding = []
+            self._worker = None
+            # Messages added while this summary was written may already be over budget again
+            if self._tokens() > self.token_budget and len(self.messages) > self.keep_recent:
+                self._start_summary()
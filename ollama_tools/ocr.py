@@ -0,0 +1,113 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import pytesseract
+from PIL import Image
+
+# pip install pytesseract pillow pymupdf  (plus the Tesseract binary)
+
+
+class ImageOCR:
+    """
+    OCR for images embedded in PyMuPDF pages, decoded straight from memory.
+
+    Images that are too small, too thin (rules, borders) or too few bytes to hold text are
+    skipped from the sizes in the page's image list, before anything is extracted. Tesseract
+    runs on a small thread pool (it is a separate process, so threads run it in parallel) and
+    results are cached by image content hash, and per document by xref, so repeated logos,
+    headers and stamps are recognised once.
+    """
+
+    def __init__(self, min_width=64, min_height=32, max_aspect=20.0, min_bytes=2048, workers=2,
+                 lang=None, cache_size=4096):
+        self.min_width = min_width
+        self.min_height = min_height
+        self.max_aspect = max_aspect
+        self.min_bytes = min_bytes
+        self.lang = lang
+        self.cache_size = cache_size
+        self.stats = {"images": 0, "skipped": 0, "cache_hits": 0, "recognised": 0}
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="ocr")
+        self._cache = OrderedDict()
+        self._xref_keys = {}
+        self._small_xrefs = set()
+        self._lock = threading.Lock()
+
+    def wanted(self, width, height):
+        """Size heuristic: could an image of this size hold readable text?"""
+        if width < self.min_width or height < self.min_height:
+            return False
+        return max(width, height) / max(min(width, height), 1) <= self.max_aspect
+
+    def page_text(self, page):
+        """Text of all worthwhile images on a page, in page order."""
+        doc = page.parent
+        futures = []
+        seen = set()
+        for image in page.get_images(full=True):
+            xref, width, height = image[0], image[2], image[3]
+            if xref in seen:
+                continue
+            seen.add(xref)
+            self.stats["images"] += 1
+            if not self.wanted(width, height):
+                self.stats["skipped"] += 1
+                continue
+
+            doc_key = (doc.name, xref)
+            if doc_key in self._small_xrefs:
+                self.stats["skipped"] += 1
+                continue
+            key = self._xref_keys.get(doc_key)
+            future = self._cached(key) if key else None
+            if future is None:
+                data = doc.extract_image(xref)["image"]
+                if len(data) < self.min_bytes:
+                    self._small_xrefs.add(doc_key)
+                    self.stats["skipped"] += 1
+                    continue
+                key = self._xref_keys[doc_key] = hashlib.sha1(data).hexdigest()
+                future = self._submit(key, data)
+            futures.append(future)
+
+        texts = [future.result() for future in futures]
+        return "\n".join(text for text in texts if text.strip())
+
+    def image_text(self, data):
+        """OCR one encoded image (PNG/JPEG/... bytes), using the cache."""
+        return self._submit(hashlib.sha1(data).hexdigest(), data).result()
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    def _cached(self, key):
+        with self._lock:
+            future = self._cache.get(key)
+            if future is not None:
+                self._cache.move_to_end(key)
+                self.stats["cache_hits"] += 1
+            return future
+
+    def _submit(self, key, data):
+        with self._lock:
+            future = self._cache.get(key)
+            if future is not None:
+                self._cache.move_to_end(key)
+                self.stats["cache_hits"] += 1
+                return future
+            future = self._cache[key] = self._executor.submit(self._recognise, data)
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return future
+
+    def _recognise(self, data):
+        self.stats["recognised"] += 1
+        try:
+            with Image.open(BytesIO(data)) as image:
+                return pytesseract.image_to_string(image, lang=self.lang)
+        except Exception as e:
+            print(f"Error processing image: {str(e)}")
+            return ""
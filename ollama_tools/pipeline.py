@@ -0,0 +1,350 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+# Staged PDF ingestion: extract pages (process pool) -> chunk -> embed in batches -> write
+# Stages are threads joined by bounded queues, so a slow stage makes the ones before it wait
+# instead of piling up pages in memory. Extraction runs in worker processes; call
+# multiprocessing.freeze_support() in the app's __main__ block when freezing with PyInstaller.
+
+_DONE = object()
+
+
+def _open_reader(path, parser):
+    if parser == "pymupdf":
+        import fitz  # PyMuPDF
+        return fitz.open(path)
+    if parser == "pdfplumber":
+        import pdfplumber
+        return pdfplumber.open(path)
+    if parser in ("pypdf", "pypdf2"):
+        try:
+            if parser == "pypdf2":
+                raise ImportError
+            from pypdf import PdfReader
+        except ImportError:
+            from PyPDF2 import PdfReader
+        return PdfReader(path)
+    raise ValueError(f"Unknown PDF parser '{parser}'")
+
+
+def _pages_of(reader, parser):
+    if parser == "pymupdf":
+        return reader
+    return reader.pages
+
+
+def _close_reader(reader):
+    close = getattr(reader, "close", None)
+    if close:
+        close()
+
+
+def count_pages(path, parser="pymupdf"):
+    """Number of pages in a PDF (runs in a worker process)."""
+    reader = _open_reader(path, parser)
+    try:
+        return len(_pages_of(reader, parser))
+    finally:
+        _close_reader(reader)
+
+
+_page_ocr = None
+
+
+def _ocr_for(options):
+    # One OCR engine (and cache) per worker process, kept across tasks
+    global _page_ocr
+    if _page_ocr is None:
+        from .ocr import ImageOCR
+        _page_ocr = ImageOCR(**{k: v for k, v in options.items() if k != "min_text_chars"})
+    return _page_ocr
+
+
+def extract_pages(path, start, stop, parser="pymupdf", ocr=None):
+    """
+    [(page_index, text), ...] for pages start..stop-1 of a PDF (runs in a worker process).
+
+    With ocr (a dict of ImageOCR options plus min_text_chars, PyMuPDF only), the images of
+    pages with less text than min_text_chars are OCR'd and their text appended.
+    """
+    reader = _open_reader(path, parser)
+    try:
+        pages = _pages_of(reader, parser)
+        results = []
+        for page_num in range(start, min(stop, len(pages))):
+            page = pages[page_num]
+            text = (page.get_text() if parser == "pymupdf" else page.extract_text()) or ""
+            if ocr is not None and parser == "pymupdf" and len(text.strip()) < ocr.get("min_text_chars", 100):
+                image_text = _ocr_for(ocr).page_text(page)
+                if image_text:
+                    text = text + "\n" + image_text
+            results.append((page_num, text))
+        return results
+    finally:
+        _close_reader(reader)
+
+
+class StageStats:
+    """Counters for one pipeline stage: items handled, time busy and time blocked downstream."""
+
+    def __init__(self, name, unit):
+        self.name = name
+        self.unit = unit
+        self.items = 0
+        self.busy = 0.0
+        self.blocked = 0.0
+        self.errors = 0
+
+    def throughput(self):
+        return self.items / self.busy if self.busy > 0 else 0.0
+
+    def __str__(self):
+        return (f"{self.name:<8} {self.items:>7} {self.unit:<7} busy {self.busy:7.2f}s "
+                f"({self.throughput():8.1f}/s)  waiting on next stage {self.blocked:6.2f}s"
+                + (f"  errors {self.errors}" if self.errors else ""))
+
+
+class PipelineStats:
+    def __init__(self):
+        self.extract = StageStats("extract", "pages")
+        self.chunk = StageStats("chunk", "chunks")
+        self.embed = StageStats("embed", "chunks")
+        self.write = StageStats("write", "chunks")
+        self.elapsed = 0.0
+        self.stopped = False
+
+    def stages(self):
+        return [self.extract, self.chunk, self.embed, self.write]
+
+    def summary(self):
+        lines = [str(stage) for stage in self.stages()]
+        lines.append(f"total    {self.write.items:>7} chunks stored in {self.elapsed:.2f}s"
+                     + (" (stopped)" if self.stopped else ""))
+        return "\n".join(lines)
+
+
+class IngestPipeline:
+    """
+    Parallel PDF ingestion with backpressure.
+
+    chunker(text) -> list of chunk strings; sink(documents, metadatas, ids, embeddings) stores a
+    batch (embeddings is None when no embedding_function is given, e.g. a Chroma collection
+    that embeds on add). page_hook(path, page_index, text) -> text can enrich a page (OCR)
+    before chunking. make_id(path, page_index, chunk_index) and make_metadata(path, page_index)
+    control how chunks are labelled. ocr (see extract_pages) OCRs image-only pages inside the
+    extraction workers.
+    """
+
+    def __init__(self, chunker, sink, embedding_function=None, parser="pymupdf", workers=None,
+                 pages_per_task=8, batch_size=256, queue_size=32, page_hook=None, make_id=None,
+                 make_metadata=None, should_stop=None, on_progress=None, on_error=None, ocr=None):
+        self.chunker = chunker
+        self.sink = sink
+        self.embedding_function = embedding_function
+        self.parser = parser
+        self.ocr = ocr
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self.pages_per_task = max(1, int(pages_per_task))
+        self.batch_size = max(1, int(batch_size))
+        self.queue_size = max(1, int(queue_size))
+        self.page_hook = page_hook
+        self.make_id = make_id or (lambda path, page, i: f"{os.path.basename(path)}_p{page}_c{i}")
+        self.make_metadata = make_metadata or (lambda path, page: {"source": os.path.basename(path),
+                                                                   "page": page + 1})
+        self.should_stop = should_stop or (lambda: False)
+        self._failures = []
+        self.on_progress = on_progress
+        self.on_error = on_error
+        self.stats = PipelineStats()
+
+    def run(self, paths):
+        """Ingest the PDFs; returns the PipelineStats once every stage has drained."""
+        started = time.perf_counter()
+        page_queue = queue.Queue(self.queue_size)
+        chunk_queue = queue.Queue(self.queue_size)
+        write_queue = queue.Queue(max(1, self.queue_size // 8))
+        failures = self._failures = []
+
+        stages = [
+            threading.Thread(target=self._guard, args=(self._chunk_stage, failures, page_queue, chunk_queue),
+                             daemon=True),
+            threading.Thread(target=self._guard, args=(self._embed_stage, failures, chunk_queue, write_queue),
+                             daemon=True),
+            threading.Thread(target=self._guard, args=(self._write_stage, failures, write_queue), daemon=True),
+        ]
+        for stage in stages:
+            stage.start()
+        try:
+            self._extract_stage(list(paths), page_queue)
+        finally:
+            self._put(page_queue, _DONE, None)
+            for stage in stages:
+                stage.join()
+
+        self.stats.elapsed = time.perf_counter() - started
+        self.stats.stopped = self.should_stop()
+        if failures:
+            raise failures[0]
+        return self.stats
+
+    def _stopping(self):
+        return bool(self._failures) or self.should_stop()
+
+    def _guard(self, stage, failures, *queues):
+        # A failing stage keeps draining its input so the stages before it never block forever
+        try:
+            stage(*queues)
+        except Exception as e:
+            failures.append(e)
+            inbox = queues[0]
+            while not getattr(inbox, "finished", False):
+                self._get(inbox)
+            if len(queues) > 1:
+                queues[1].put(_DONE)
+
+    def _get(self, q):
+        item = q.get()
+        if item is _DONE:
+            q.finished = True
+        return item
+
+    def _put(self, q, item, stats):
+        started = time.perf_counter()
+        q.put(item)
+        if stats is not None:
+            stats.blocked += time.perf_counter() - started
+
+    def _error(self, path, message):
+        if self.on_error:
+            self.on_error(path, message)
+
+    def _extract_stage(self, paths, page_queue):
+        stats = self.stats.extract
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            counts = {pool.submit(count_pages, path, self.parser): path for path in paths}
+            tasks = []
+            for future in counts:
+                path = counts[future]
+                try:
+                    total = future.result()
+                except Exception as e:
+                    stats.errors += 1
+                    self._error(path, str(e))
+                    continue
+                tasks.extend((path, start, start + self.pages_per_task)
+                             for start in range(0, total, self.pages_per_task))
+
+            # At most two tasks per worker are in flight; finished pages wait on the bounded queue
+            pending = {}
+            task_iter = iter(tasks)
+            while True:
+                while not self._stopping() and len(pending) < self.workers * 2:
+                    task = next(task_iter, None)
+                    if task is None:
+                        break
+                    pending[pool.submit(extract_pages, *task, self.parser, self.ocr)] = task
+                if not pending:
+                    break
+                busy_started = time.perf_counter()
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                stats.busy += time.perf_counter() - busy_started
+                for future in done:
+                    path = pending.pop(future)[0]
+                    try:
+                        pages = future.result()
+                    except Exception as e:
+                        stats.errors += 1
+                        self._error(path, str(e))
+                        continue
+                    stats.items += len(pages)
+                    if not self._stopping():
+                        self._put(page_queue, (path, pages), stats)
+                if self._stopping():
+                    for future in pending:
+                        future.cancel()
+                    break
+
+    def _chunk_stage(self, page_queue, chunk_queue):
+        stats = self.stats.chunk
+        while True:
+            item = self._get(page_queue)
+            if item is _DONE:
+                break
+            if self._stopping():
+                continue
+            path, pages = item
+            started = time.perf_counter()
+            records = []
+            for page_num, text in pages:
+                try:
+                    if self.page_hook:
+                        text = self.page_hook(path, page_num, text)
+                    if not text or not text.strip():
+                        continue
+                    metadata = self.make_metadata(path, page_num)
+                    for i, chunk in enumerate(self.chunker(text)):
+                        if chunk.strip():
+                            records.append((chunk, dict(metadata), self.make_id(path, page_num, i)))
+                except Exception as e:
+                    stats.errors += 1
+                    self._error(path, f"page {page_num + 1}: {e}")
+            stats.items += len(records)
+            stats.busy += time.perf_counter() - started
+            if records:
+                self._put(chunk_queue, records, stats)
+        chunk_queue.put(_DONE)
+
+    def _embed_stage(self, chunk_queue, write_queue):
+        stats = self.stats.embed
+        batch = []
+
+        def send(records):
+            documents = [r[0] for r in records]
+            started = time.perf_counter()
+            embeddings = self.embedding_function(documents) if self.embedding_function else None
+            stats.busy += time.perf_counter() - started
+            stats.items += len(records)
+            self._put(write_queue, (documents, [r[1] for r in records], [r[2] for r in records], embeddings),
+                      stats)
+
+        while True:
+            item = self._get(chunk_queue)
+            if item is _DONE:
+                break
+            if self._stopping():
+                continue
+            batch.extend(item)
+            while len(batch) >= self.batch_size:
+                send(batch[:self.batch_size])
+                batch = batch[self.batch_size:]
+        # Whatever is left is flushed, also when stopped early
+        if batch:
+            send(batch)
+        write_queue.put(_DONE)
+
+    def _write_stage(self, write_queue):
+        stats = self.stats.write
+        while True:
+            item = self._get(write_queue)
+            if item is _DONE:
+                break
+            documents, metadatas, ids, embeddings = item
+            started = time.perf_counter()
+            self.sink(documents, metadatas, ids, embeddings)
+            stats.busy += time.perf_counter() - started
+            stats.items += len(ids)
+            if self.on_progress:
+                self.on_progress(stats.items)
+
+
+def chroma_sink(collection):
+    """sink for IngestPipeline that adds each batch to a Chroma collection."""
+    def add(documents, metadatas, ids, embeddings):
+        kwargs = {"documents": documents, "metadatas": metadatas, "ids": ids}
+        if embeddings is not None:
+            kwargs["embeddings"] = embeddings
+        collection.add(**kwargs)
+    return add
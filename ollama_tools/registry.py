@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+
+# Which documents a vector store holds, so re-indexing only touches what changed
+
+
+def file_digest(path, block_size=1 << 20):
+    """SHA-256 of a file's contents, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def params_key(params):
+    """Stable fingerprint of the chunking/embedding settings an index was built with."""
+    return hashlib.sha256(json.dumps(params or {}, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+class DocumentRegistry:
+    """
+    JSON record of the documents in a vector store, keyed by path.
+
+    Each entry keeps the file's content hash, size, mtime and the ids of its chunks. The whole
+    registry is tied to the chunking/embedding parameters: when they differ from the ones it
+    was saved with, params_changed is set and every document counts as new (the caller should
+    clear the store). Unchanged size and mtime skip re-hashing.
+    """
+
+    def __init__(self, path, params=None):
+        self.path = path
+        self.params = params or {}
+        self.key = params_key(self.params)
+        self.documents = {}
+        self.params_changed = False
+        self._scanned = {}
+
+        if os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    saved = json.load(f)
+            except (OSError, ValueError):
+                saved = {}
+            if saved.get("params_key") == self.key:
+                self.documents = saved.get("documents", {})
+            else:
+                self.params_changed = bool(saved.get("documents"))
+
+    def __contains__(self, file_path):
+        return self._key(file_path) in self.documents
+
+    def __len__(self):
+        return len(self.documents)
+
+    def paths(self):
+        return list(self.documents)
+
+    def ids(self, file_path):
+        return list(self.documents.get(self._key(file_path), {}).get("ids", []))
+
+    @property
+    def version(self):
+        """Fingerprint of the indexed content and settings; changes whenever the index does."""
+        contents = sorted((path, entry["digest"]) for path, entry in self.documents.items())
+        return params_key({"params": self.key, "documents": contents})
+
+    @staticmethod
+    def stored_version(path):
+        """version of the registry saved at path, or None if there is none."""
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f).get("version")
+        except (OSError, ValueError):
+            return None
+
+    def status(self, file_path):
+        """'new', 'changed', 'unchanged' or 'missing' (file no longer on disk)."""
+        key = self._key(file_path)
+        if not os.path.exists(key):
+            return "missing"
+        stat = os.stat(key)
+        entry = self.documents.get(key)
+        if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+            return "unchanged"
+
+        digest = file_digest(key)
+        self._scanned[key] = (digest, stat.st_size, stat.st_mtime)
+        if entry is None:
+            return "new"
+        if entry["digest"] == digest:
+            # Touched but identical - remember the new mtime so it is not hashed again
+            entry["mtime"] = stat.st_mtime
+            return "unchanged"
+        return "changed"
+
+    def plan(self, file_paths, prune=True):
+        """
+        Sort file_paths into new/changed/unchanged and list registered documents to remove.
+
+        With prune, registered documents that are not in file_paths are removed too (the
+        selection is the whole library); otherwise only those deleted from disk.
+        """
+        plan = {"new": [], "changed": [], "unchanged": [], "removed": []}
+        wanted = set()
+        for file_path in file_paths:
+            key = self._key(file_path)
+            if key in wanted:
+                continue
+            wanted.add(key)
+            status = self.status(key)
+            if status == "missing":
+                if key in self.documents:
+                    plan["removed"].append(key)
+                continue
+            plan[status].append(key)
+        for key in self.documents:
+            if key not in wanted and (prune or not os.path.exists(key)):
+                plan["removed"].append(key)
+        return plan
+
+    def record(self, file_path, ids):
+        """Mark a document as indexed with the given chunk ids."""
+        key = self._key(file_path)
+        scanned = self._scanned.pop(key, None)
+        if scanned is None:
+            stat = os.stat(key)
+            scanned = (file_digest(key), stat.st_size, stat.st_mtime)
+        digest, size, mtime = scanned
+        self.documents[key] = {"digest": digest, "size": size, "mtime": mtime, "ids": list(ids)}
+
+    def forget(self, file_path):
+        self.documents.pop(self._key(file_path), None)
+
+    def clear(self):
+        self.documents = {}
+        self.params_changed = False
+
+    def save(self):
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"params_key": self.key, "params": self.params, "version": self.version,
+                       "documents": self.documents}, f, indent=1)
+        os.replace(temp_path, self.path)
+
+    @staticmethod
+    def _key(file_path):
+        return os.path.abspath(file_path)
@@ -0,0 +1,196 @@
+import json
+import queue
+import threading
+import time
+
+import requests
+
+from .embeddings import DEFAULT_HOST
+
+# pip install requests
+# Streaming Ollama generation for Tk apps: a worker thread reads the HTTP stream and puts tokens
+# on a queue, and the Tk thread drains that queue into a text widget once per frame.
+
+_END = object()
+
+
+class GenerationStream:
+    """
+    One streaming /api/generate (or /api/chat) request, read on a background thread.
+
+    Tokens are put on self.tokens as they arrive; drain() takes everything queued so far.
+    cancel() closes the HTTP connection, which makes Ollama stop generating. When the stream
+    ends, self.final holds the last JSON object (with "context", eval counts, ...), self.text
+    the whole response and self.error any failure; on_token(text) and on_done(stream) are
+    optional callbacks run on the worker thread.
+    """
+
+    def __init__(self, payload, host=DEFAULT_HOST, endpoint="/api/generate", session=None,
+                 timeout=(10, 300), on_token=None, on_done=None):
+        self.payload = dict(payload, stream=True)
+        self.url = host.rstrip("/") + endpoint
+        self.session = session or requests
+        self.timeout = timeout
+        self.on_token = on_token
+        self.on_done = on_done
+        self.tokens = queue.Queue()
+        self.final = None
+        self.error = None
+        self.cancelled = False
+        self.first_token_time = None
+        self.started = None
+        self._parts = []
+        self._response = None
+        self._lock = threading.Lock()
+        self._finished = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    @property
+    def text(self):
+        return "".join(self._parts)
+
+    def done(self):
+        return self._finished.is_set()
+
+    def wait(self, timeout=None):
+        """Block until the stream has ended; returns the full text."""
+        self._finished.wait(timeout)
+        return self.text
+
+    def __iter__(self):
+        """Tokens as they arrive, for callers running on a worker thread."""
+        while True:
+            token = self.tokens.get()
+            if token is _END:
+                self.tokens.put(_END)
+                return
+            yield token
+
+    def drain(self):
+        """Everything queued since the last call, joined into one string (never blocks)."""
+        parts = []
+        while True:
+            try:
+                token = self.tokens.get_nowait()
+            except queue.Empty:
+                break
+            if token is _END:
+                self.tokens.put(_END)
+                break
+            parts.append(token)
+        return "".join(parts)
+
+    def exhausted(self):
+        """True once the stream has ended and every token has been drained."""
+        return self.done() and self.tokens.qsize() == 1
+
+    def cancel(self):
+        """Abort the request; tokens already received stay available."""
+        with self._lock:
+            self.cancelled = True
+            response = self._response
+        if response is not None:
+            try:
+                response.close()
+            except Exception:
+                pass
+
+    def _run(self):
+        try:
+            with self.session.post(self.url, json=self.payload, stream=True, timeout=self.timeout) as response:
+                with self._lock:
+                    self._response = response
+                    cancelled = self.cancelled
+                if cancelled:
+                    return
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if self.cancelled:
+                        break
+                    if not line:
+                        continue
+                    if self._receive(line):
+                        break
+        except Exception as e:
+            # Closing the response from cancel() surfaces here as a connection error
+            if not self.cancelled:
+                self.error = e
+        finally:
+            self._finish()
+
+    def _receive(self, line):
+        """Handle one NDJSON line of the response; returns True on the final one."""
+        try:
+            data = json.loads(line)
+        except json.JSONDecodeError:
+            return False
+        if data.get("error"):
+            raise RuntimeError(data["error"])
+        token = data.get("response") or data.get("message", {}).get("content", "")
+        if token:
+            if self.first_token_time is None:
+                self.first_token_time = time.perf_counter() - self.started
+            self._parts.append(token)
+            self.tokens.put(token)
+            if self.on_token:
+                self.on_token(token)
+        if data.get("done"):
+            self.final = data
+            return True
+        return False
+
+    def _finish(self):
+        self.tokens.put(_END)
+        self._finished.set()
+        if self.on_done:
+            self.on_done(self)
+
+
+class TextStreamer:
+    """
+    Drains a GenerationStream into a Tk text widget from the Tk thread.
+
+    Every interval_ms, all tokens queued since the last frame are inserted with a single
+    insert, so fast models do not flood the event loop. on_done(stream) runs on the Tk thread
+    once the stream has ended and been fully shown.
+    """
+
+    def __init__(self, widget, stream, interval_ms=30, on_done=None, autoscroll=True):
+        self.widget = widget
+        self.stream = stream
+        self.interval_ms = interval_ms
+        self.on_done = on_done
+        self.autoscroll = autoscroll
+
+    def start(self):
+        self.widget.after(self.interval_ms, self._tick)
+        return self
+
+    def _tick(self):
+        try:
+            text = self.stream.drain()
+            if text:
+                # Read-only (disabled) output panes are unlocked just for the insert
+                disabled = str(self.widget.cget("state")) == "disabled"
+                if disabled:
+                    self.widget.config(state="normal")
+                self.widget.insert("end", text)
+                if disabled:
+                    self.widget.config(state="disabled")
+                if self.autoscroll:
+                    self.widget.see("end")
+        except Exception:
+            # Widget destroyed while streaming - stop the request too
+            self.stream.cancel()
+            return
+        if self.stream.exhausted():
+            if self.on_done:
+                self.on_done(self.stream)
+        else:
+            self.widget.after(self.interval_ms, self._tick)
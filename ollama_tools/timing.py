@@ -0,0 +1,43 @@
+import time
+from contextlib import contextmanager
+
+# Per-request latency breakdown, e.g. embed query -> search -> prompt build -> first token -> total
+
+
+class StageTimer:
+    """
+    Wall-clock time of the named stages of one request.
+
+    stage(name) times a block (repeated blocks add up); mark(name) records the time elapsed
+    since the timer started, for events such as the first streamed token.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.ended = None
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - started
+
+    def mark(self, name):
+        if name not in self.stages:
+            self.stages[name] = time.perf_counter() - self.started
+
+    def stop(self):
+        self.ended = time.perf_counter()
+        return self.total()
+
+    def total(self):
+        return (self.ended or time.perf_counter()) - self.started
+
+    def as_dict(self):
+        return dict(self.stages, total=self.total())
+
+    def summary(self):
+        return " | ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in self.as_dict().items())